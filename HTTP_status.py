@@ -1,6 +1,12 @@
 import requests
 import re
-from requests.exceptions import RequestException, SSLError
+import time
+import logging
+import warnings
+from urllib.parse import urlparse, urljoin
+from requests.exceptions import RequestException, SSLError, Timeout, ConnectionError
+from urllib3.exceptions import InsecureRequestWarning
+from tls_certificates import capture_peer_certificate
 
 # Dictionary of common HTTP status codes and their descriptions
 HTTP_STATUS_DESCRIPTIONS = {
@@ -18,59 +24,266 @@ HTTP_STATUS_DESCRIPTIONS = {
     # Add more status codes and descriptions as needed
 }
 
-def get_http_status_code(url, retries=3, timeout=10):
+logger = logging.getLogger(__name__)
+
+# Default request headers; the browser user agent avoids bot-specific responses
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# Bytes of an HTML response read to look for a <meta http-equiv="refresh"> redirect
+META_REFRESH_PEEK_BYTES = 4096
+
+_META_REFRESH_RE = re.compile(
+    rb'<meta[^>]+http-equiv\s*=\s*["\']?refresh["\']?[^>]*content\s*=\s*["\']([^"\'>]*)', re.IGNORECASE)
+_META_REFRESH_REVERSED_RE = re.compile(
+    rb'<meta[^>]+content\s*=\s*["\']([^"\'>]*)["\'][^>]*http-equiv\s*=\s*["\']?refresh', re.IGNORECASE)
+
+def classify_request_error(error):
     """
-    Retrieves the HTTP status code and description from a given URL.
+    Maps a requests exception to a short outcome name used by the rate limiter and metrics.
 
     Parameters:
-    url (str): The URL of the domain to retrieve the HTTP status code from.
-    retries (int): The number of retry attempts for failed requests.
-    timeout (int): The timeout duration for each request attempt.
+    error (Exception): The exception raised by requests.
 
     Returns:
-    tuple: A tuple containing the HTTP status code and its description, or (None, None) if the request fails.
+    str: 'timeout', 'reset', or 'error'.
+    """
+    if isinstance(error, Timeout):
+        return 'timeout'
+    if isinstance(error, ConnectionError) and 'reset' in str(error).lower():
+        return 'reset'
+    return 'error'
+
+def parse_refresh(value):
+    """
+    Extracts the target URL from a Refresh header or meta-refresh content value.
+
+    Parameters:
+    value (str): A value such as "0; url=https://example.com/".
+
+    Returns:
+    str: The target URL, or None if the value does not redirect.
+    """
+    match = re.search(r'url\s*=\s*["\']?([^"\';]+)', value or '', re.IGNORECASE)
+    return match.group(1).strip() if match else None
+
+def _peek_meta_refresh(response, peek_bytes):
+    """
+    Reads at most `peek_bytes` of an HTML response.
+
+    Returns:
+    tuple: (meta-refresh target or None, the bytes read or None if the response is not HTML).
+    """
+    if 'html' not in response.headers.get('Content-Type', '').lower():
+        return None, None
+    try:
+        head = response.raw.read(peek_bytes, decode_content=True)
+    except Exception as e:
+        logger.debug("Could not read the start of %s: %s", response.url, e)
+        return None, None
+    match = _META_REFRESH_RE.search(head[:META_REFRESH_PEEK_BYTES]) or \
+        _META_REFRESH_REVERSED_RE.search(head[:META_REFRESH_PEEK_BYTES])
+    return (parse_refresh(match.group(1).decode('latin-1')) if match else None), head
+
+def _charset(content_type):
+    """
+    Returns the charset declared in a Content-Type header, or None.
+    """
+    match = re.search(r'charset\s*=\s*["\']?([\w.:-]+)', content_type, re.IGNORECASE)
+    return match.group(1) if match else None
+
+def _set_cookie_names(response):
+    """
+    Returns the names of the cookies set by a response (values are not kept).
+    """
+    headers = response.raw.headers if response.raw is not None else None
+    values = headers.getlist('Set-Cookie') if hasattr(headers, 'getlist') else []
+    return [value.split('=', 1)[0].strip() for value in values if '=' in value]
+
+def get_http_status(url, retries=3, timeout=10, limiter=None, limiter_key=None, max_hops=10,
+                    peek_bytes=META_REFRESH_PEEK_BYTES, body_bytes=0):
+    """
+    Follows a URL's redirect chain hop by hop and returns the status of the final response.
+
+    Every hop is a streamed request with redirects disabled. Response bodies are not
+    downloaded; only the first `peek_bytes` of an HTML page are read to detect a
+    meta-refresh redirect. Each hop records its status, Location, timing, the names
+    of the cookies it sets, and how it redirected ('http', 'refresh-header', or 'meta-refresh').
+
+    HTTPS hops are made with certificate verification on. A hop whose certificate
+    fails CA validation is fetched again unverified, so only that hop costs a second
+    handshake, and 'ssl_verified' is False. The peer certificate is read from the
+    connection the hop's response arrived on and stored on the hop as 'certificate'.
+    'cert_checks_passed' is False when any certificate fails the hostname,
+    validity-period, or self-signed checks.
+
+    Parameters:
+    url (str): The URL of the domain to check.
+    retries (int): The number of attempts for the whole chain when a request fails.
+    timeout (int): The timeout duration for each request.
+    limiter (AdaptiveRateLimiter, optional): Shared rate limiter pacing every request.
+    limiter_key (str, optional): Limiter key for the original host, normally the resolved IP. Other hosts
+                                 in the chain are keyed by host name.
+    max_hops (int): Maximum number of redirects to follow. Default is 10.
+    peek_bytes (int): Bytes of an HTML page read to look for a meta refresh. 0 disables the check.
+    body_bytes (int): Keep up to this many bytes of the final HTML page as 'body'. Default is 0 (no body).
+
+    Returns:
+    dict: 'url', 'final_url', 'status_code', 'description', 'chain' (list of hop dictionaries),
+          'elapsed_ms', 'ssl_verified', 'cert_checks_passed', 'certificate' (the last HTTPS hop's certificate, or None), 'body'
+          (bytes or None), 'body_charset', 'body_truncated', 'error' (None, or the last error when
+          every attempt failed), and 'error_type' (see classify_request_error).
+          'status_code' and 'description' are None if the request failed.
     """
     # Ensure the URL starts with http:// or https://
     if not re.match(r'^https?://', url):
         url = 'http://' + url
-    
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
+
+    origin_host = urlparse(url).hostname
+    result = {'url': url, 'final_url': None, 'status_code': None, 'description': None, 'chain': [],
+              'elapsed_ms': None, 'ssl_verified': True, 'cert_checks_passed': True, 'certificate': None, 'body': None,
+              'body_charset': None, 'body_truncated': False, 'error': None, 'error_type': None}
+    # One extra byte tells whether the body was cut off
+    read_bytes = max(peek_bytes, body_bytes + 1 if body_bytes else 0)
+
+    def fetch(session, unverified_session, hop_url):
+        key = (limiter_key or origin_host) if urlparse(hop_url).hostname == origin_host else urlparse(hop_url).hostname
+        captured = {'certificate': None}
+
+        def capture_certificate(response, **kwargs):
+            # Response hooks run before requests reads a redirect's body and returns the
+            # connection to the pool, which it does even with allow_redirects=False
+            if hop_url.startswith('https://'):
+                captured['certificate'] = capture_peer_certificate(response, urlparse(hop_url).hostname)
+
+        def get(session, verify):
+            if limiter is not None:
+                limiter.acquire(key)
+            try:
+                with warnings.catch_warnings():
+                    if not verify:
+                        warnings.simplefilter('ignore', InsecureRequestWarning)
+                    response = session.get(hop_url, headers=REQUEST_HEADERS, timeout=timeout, allow_redirects=False,
+                                           stream=True, verify=verify, hooks={'response': capture_certificate})
+            except RequestException as e:
+                if limiter is not None:
+                    # A certificate that fails validation is an answer, not a congestion signal
+                    limiter.record(key, 'ok' if verify and isinstance(e, SSLError) else classify_request_error(e))
+                raise
+            if limiter is not None:
+                limiter.record(key, 'ok')
+            return response
+
+        try:
+            return get(session, verify=True), captured['certificate'], True
+        except SSLError as e:
+            logger.debug("Certificate of %s failed validation, fetching it unverified: %s", hop_url, e)
+            return get(unverified_session, verify=False), captured['certificate'], False
+
+    def follow():
+        chain = []
+        body = charset = None
+        started = time.monotonic()
+        current = url
+        visited = set()
+        # Unverified fetches get their own session: requests 2.31 would hand their pooled
+        # connections to later verified requests to the same host
+        with requests.Session() as session, requests.Session() as unverified_session:
+            for _ in range(max_hops + 1):
+                visited.add(current)
+                response, certificate, verified = fetch(session, unverified_session, current)
+                try:
+                    hop = {
+                        'url': current,
+                        'status_code': response.status_code,
+                        'location': None,
+                        'redirect_type': None,
+                        'elapsed_ms': round(response.elapsed.total_seconds() * 1000, 1),
+                        'set_cookies': _set_cookie_names(response),
+                        'certificate': certificate,
+                        'ssl_verified': verified,
+                    }
+                    target = None
+                    body = None
+                    if response.is_redirect:
+                        target, hop['redirect_type'] = response.headers.get('Location'), 'http'
+                    elif response.headers.get('Refresh'):
+                        target, hop['redirect_type'] = parse_refresh(response.headers['Refresh']), 'refresh-header'
+                    elif read_bytes and response.status_code == 200:
+                        target, body = _peek_meta_refresh(response, read_bytes)
+                        charset = _charset(response.headers.get('Content-Type', ''))
+                        hop['redirect_type'] = 'meta-refresh' if target and peek_bytes else None
+                        target = target if peek_bytes else None
+                finally:
+                    # Closing without reading discards the rest of the body
+                    response.close()
+
+                if target:
+                    hop['location'] = urljoin(current, target)
+                chain.append(hop)
+                if not target or hop['location'] in visited:
+                    break
+                current = hop['location']
+
+        last = chain[-1]
+        certificates = [hop['certificate'] for hop in chain if hop['certificate']]
+        result.update({
+            'final_url': last['url'],
+            'status_code': last['status_code'],
+            'description': HTTP_STATUS_DESCRIPTIONS.get(last['status_code'], "Unknown Status"),
+            'chain': chain,
+            'elapsed_ms': round((time.monotonic() - started) * 1000, 1),
+            'ssl_verified': all(hop['ssl_verified'] for hop in chain),
+            'cert_checks_passed': all(certificate['valid'] for certificate in certificates),
+            'certificate': certificates[-1] if certificates else None,
+            'body': body[:body_bytes] if body is not None and body_bytes else None,
+            'body_charset': charset,
+            'body_truncated': bool(body_bytes) and body is not None and len(body) > body_bytes,
+            'error': None,
+            'error_type': None,
+        })
+        return result
 
     for attempt in range(retries):
         try:
-            # Try the request with SSL verification enabled
-            response = requests.get(url, headers=headers, timeout=timeout, allow_redirects=True)
-            status_code = response.status_code
-            description = HTTP_STATUS_DESCRIPTIONS.get(status_code, "Unknown Status")
-            
-            print(f"HTTP Status Code for {url}: {status_code} ({description})")
-            return status_code, description
-
-        except SSLError as ssl_error:
-            print(f"SSL verification failed for {url}: {ssl_error}")
-            # Retry with SSL verification disabled
-            try:
-                print(f"Retrying {url} with SSL verification disabled (Attempt {attempt + 1}/{retries})...")
-                response = requests.get(url, headers=headers, timeout=timeout, verify=False, allow_redirects=True)
-                status_code = response.status_code
-                description = HTTP_STATUS_DESCRIPTIONS.get(status_code, "Unknown Status")
-                print(f"HTTP Status Code for {url} (SSL disabled): {status_code} ({description})")
-                return status_code, description
-            except Exception as e:
-                print(f"Failed to retrieve HTTP status for {url} even with SSL disabled: {str(e)}")
+            follow()
+            logger.info("HTTP Status Code for %s: %s (%s) after %d hop(s), final URL %s", url, result['status_code'],
+                        result['description'], len(result['chain']), result['final_url'],
+                        extra={'url': url, 'status_code': result['status_code'], 'hops': len(result['chain']),
+                               'ssl_verified': result['ssl_verified'],
+                               'cert_checks_passed': result['cert_checks_passed']})
+            return result
 
         except RequestException as e:
             # Handle other request errors (timeouts, connection errors, etc.)
-            print(f"An error occurred while requesting {url} (Attempt {attempt + 1}/{retries}): {e}")
+            result['error'] = str(e)
+            result['error_type'] = classify_request_error(e)
+            logger.debug("An error occurred while requesting %s (Attempt %d/%d): %s", url, attempt + 1, retries, e)
 
         # Wait before retrying
-        print(f"Retrying {url}... (Attempt {attempt + 1}/{retries})")
+        logger.debug("Retrying %s... (Attempt %d/%d)", url, attempt + 1, retries)
 
-    # After retries, return None if all attempts fail
-    print(f"Failed to retrieve HTTP status for {url} after {retries} attempts.")
-    return None, None
+    logger.warning("Failed to retrieve HTTP status for %s after %d attempts.", url, retries,
+                   extra={'url': url, 'attempts': retries})
+    return result
+
+def get_http_status_code(url, retries=3, timeout=10, limiter=None, limiter_key=None):
+    """
+    Retrieves the HTTP status code and description from a given URL.
+
+    Parameters:
+    url (str): The URL of the domain to retrieve the HTTP status code from.
+    retries (int): The number of retry attempts for failed requests.
+    timeout (int): The timeout duration for each request attempt.
+    limiter (AdaptiveRateLimiter, optional): Shared rate limiter pacing every request.
+    limiter_key (str, optional): Destination key for the limiter, normally the resolved IP. Defaults to the host.
+
+    Returns:
+    tuple: A tuple containing the HTTP status code and its description, or (None, None) if the request fails.
+    """
+    result = get_http_status(url, retries=retries, timeout=timeout, limiter=limiter, limiter_key=limiter_key)
+    return result['status_code'], result['description']
 
 # Example usage
 if __name__ == "__main__":
@@ -78,3 +291,7 @@ if __name__ == "__main__":
     url = domain_name
     status_code, description = get_http_status_code(url)
     print(f"Final result for {url}: {status_code} - {description}")
+
+    result = get_http_status("http://github.com")
+    for hop in result['chain']:
+        print(f"  {hop['status_code']} {hop['url']} -> {hop['location']} ({hop['elapsed_ms']} ms)")
@@ -1,20 +1,37 @@
 import socket
+import logging
+import threading
+import time
+import dns.exception
+import dns.message
+import dns.query
+import dns.rcode
+import dns.rdatatype
 import dns.resolver
 import re
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from urllib.parse import urlparse
 
-def resolve_domain_to_ip(domain_name):
+logger = logging.getLogger(__name__)
+
+# Upstream resolvers used when the configuration does not name any
+DEFAULT_NAMESERVERS = ['1.1.1.1', '8.8.8.8', '9.9.9.9']
+
+# Reasons resolve_domain reports for a failed lookup. Only 'no_answer' (every
+# nameserver timed out or answered SERVFAIL/REFUSED) may clear up on its own;
+# 'nodata' (NOERROR without an A record) and 'error' (anything unexpected) are final.
+TRANSIENT_DNS_FAILURES = ('no_answer',)
+
+def extract_domain(domain_name):
     """
-    Resolves a domain name to its corresponding IP address using both socket and dnspython.
+    Extracts the host part from a domain name or URL.
 
     Parameters:
-    domain_name (str): The domain name or URL to resolve.
+    domain_name (str): The domain name or URL (e.g., "https://example.com/path").
 
     Returns:
-    str: The resolved IP address, or a string indicating the domain is closed, or None if the domain could not be resolved.
+    str: The host (e.g., "example.com").
     """
-    closed_domain = "CLOSED_DOMAIN"  # Define a specific return value for closed/unreachable domains
-
     # Use urlparse to extract the netloc (domain) from the URL
     parsed_url = urlparse(domain_name)
     if parsed_url.netloc:
@@ -23,36 +40,301 @@ def resolve_domain_to_ip(domain_name):
         domain_name = parsed_url.path
 
     # Further sanitize to remove any trailing slashes or unwanted characters
-    domain_name = domain_name.strip('/')
+    return domain_name.strip('/')
+
+def canonical_domain(domain_name):
+    """
+    Normalises a domain name or URL to a canonical host: lower-case, without
+    scheme, path, port, credentials, or trailing dot.
+
+    Parameters:
+    domain_name (str): The domain name or URL.
+
+    Returns:
+    str: The canonical host name.
+    """
+    host = extract_domain(domain_name.strip()).split('/')[0]
+    host = host.rsplit('@', 1)[-1].split(':')[0]
+    return host.rstrip('.').lower()
+
+class NameserverHealth:
+    """
+    Latency and error history of one upstream resolver.
+    """
+
+    def __init__(self, address, port, initial_latency):
+        self.address = address
+        self.port = port
+        self.latency = initial_latency  # EWMA of successful query times, in seconds
+        self.error_rate = 0.0           # EWMA of failures (timeouts, SERVFAIL, REFUSED)
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.queries = 0
+        self.failures = 0
+
+    def score(self):
+        """
+        Lower is better: expected latency, inflated by the recent error rate.
+        """
+        return self.latency * (1 + 4 * self.error_rate)
+
+    def as_dict(self, now):
+        return {
+            'server': f"{self.address}:{self.port}",
+            'latency_ms': round(self.latency * 1000, 1),
+            'error_rate': round(self.error_rate, 3),
+            'queries': self.queries,
+            'failures': self.failures,
+            'ejected_for_s': round(max(self.ejected_until - now, 0), 1),
+        }
+
+
+class NameserverPool:
+    """
+    Pool of upstream resolvers with per-server health tracking.
+
+    Each query goes to the server with the best score (EWMA latency weighted by
+    the EWMA error rate). If it has not answered after the hedge delay, the same
+    query is also sent to the next-best server, and the first answer wins. A
+    server that fails `max_failures` times in a row is ejected for `cooldown`
+    seconds; when every server is ejected, the one due back first is used.
+    NXDOMAIN is a valid answer, not a failure.
+    """
+
+    def __init__(self, nameservers=None, port=53, timeout=2.0, hedge_after=None, max_failures=3, cooldown=30.0,
+                 alpha=0.3, initial_latency=0.05):
+        """
+        Parameters:
+        nameservers (list): Addresses as "ip" or "ip:port". Defaults to DEFAULT_NAMESERVERS.
+        port (int): Port for addresses given without one. Default is 53.
+        timeout (float): Seconds before a query to one server counts as failed. Default is 2.
+        hedge_after (float, optional): Fixed hedge delay in seconds. By default it is three times
+                                       the primary server's EWMA latency, between 50 ms and half the timeout.
+        max_failures (int): Consecutive failures that eject a server. Default is 3.
+        cooldown (float): Seconds an ejected server is left out. Default is 30.
+        alpha (float): EWMA weight of the newest observation. Default is 0.3.
+        initial_latency (float): Latency assumed for a server before its first answer.
+        """
+        self.servers = []
+        for entry in nameservers or DEFAULT_NAMESERVERS:
+            address, _, server_port = str(entry).partition(':') if str(entry).count(':') == 1 else (entry, '', '')
+            self.servers.append(NameserverHealth(address, int(server_port or port), initial_latency))
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.hedged = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(self.servers)),
+                                            thread_name_prefix='dns-pool')
+
+    def ranked(self):
+        """
+        Returns:
+        list: Servers in order of preference; healthy ones by score, then ejected ones by return time.
+        """
+        now = time.monotonic()
+        with self._lock:
+            healthy = sorted((server for server in self.servers if server.ejected_until <= now),
+                             key=lambda server: server.score())
+            ejected = sorted((server for server in self.servers if server.ejected_until > now),
+                             key=lambda server: server.ejected_until)
+        return healthy + ejected
+
+    def _record(self, server, elapsed, failed):
+        with self._lock:
+            server.queries += 1
+            server.error_rate += self.alpha * ((1.0 if failed else 0.0) - server.error_rate)
+            if failed:
+                server.failures += 1
+                server.consecutive_failures += 1
+                if server.consecutive_failures >= self.max_failures:
+                    server.ejected_until = time.monotonic() + self.cooldown
+                    server.consecutive_failures = 0
+                    logger.warning("Ejecting nameserver %s:%d for %.0fs after repeated failures",
+                                   server.address, server.port, self.cooldown,
+                                   extra={'nameserver': server.address, 'cooldown': self.cooldown})
+            else:
+                server.consecutive_failures = 0
+                server.latency += self.alpha * (elapsed - server.latency)
+
+    def _query_one(self, server, query):
+        started = time.monotonic()
+        try:
+            response = dns.query.udp(query, server.address, timeout=self.timeout, port=server.port)
+        except Exception:
+            self._record(server, time.monotonic() - started, failed=True)
+            raise
+        failed = response.rcode() not in (dns.rcode.NOERROR, dns.rcode.NXDOMAIN)
+        self._record(server, time.monotonic() - started, failed)
+        if failed:
+            raise dns.resolver.NoNameservers(f"{server.address} answered {dns.rcode.to_text(response.rcode())}")
+        return response
+
+    def query(self, domain_name, rdtype='A'):
+        """
+        Sends a query through the pool.
+
+        Parameters:
+        domain_name (str): The name to look up.
+        rdtype (str): Record type. Default is 'A'.
+
+        Returns:
+        dns.message.Message: The first NOERROR or NXDOMAIN response.
+
+        Raises:
+        dns.resolver.NoNameservers: If every server tried failed or timed out.
+        """
+        query = dns.message.make_query(domain_name, rdtype)
+        candidates = self.ranked()
+        deadline = time.monotonic() + self.timeout * 2
+        pending = {}
+        errors = []
+
+        def launch():
+            server = candidates.pop(0)
+            pending[self._executor.submit(self._query_one, server, query)] = server
+            return server
+
+        primary = launch()
+        hedge_after = self.hedge_after
+        if hedge_after is None:
+            hedge_after = min(max(3 * primary.latency, 0.05), self.timeout / 2)
+
+        while pending:
+            # Before the hedge fires, wait only until the hedge delay; afterwards until the deadline
+            wait_for = hedge_after if candidates and len(pending) == 1 else deadline - time.monotonic()
+            done, _ = wait(list(pending), timeout=max(wait_for, 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                server = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    errors.append(f"{server.address}:{server.port}: {e}")
+            if not done and candidates and time.monotonic() < deadline:
+                # The primary is slow: hedge to the next-best server
+                with self._lock:
+                    self.hedged += 1
+                launch()
+            elif done and candidates:
+                # A server failed outright: fail over without waiting
+                launch()
+            elif time.monotonic() >= deadline:
+                break
+        raise dns.resolver.NoNameservers(f"No nameserver answered for {domain_name}: {'; '.join(errors) or 'timeout'}")
+
+    def stats(self):
+        """
+        Returns:
+        list: One dictionary per server with its latency, error rate, counts, and remaining ejection time.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [server.as_dict(now) for server in self.servers]
+
+
+_shared_pools = {}
+_shared_pools_lock = threading.Lock()
+
+
+def get_nameserver_pool(config=None, nameservers=None, port=53):
+    """
+    Returns a process-wide NameserverPool, so health history is shared by every lookup.
+
+    Parameters:
+    config (dict, optional): Configuration with 'nameservers', 'dns_timeout', 'dns_hedge_after',
+                             'dns_max_failures', and 'dns_cooldown'.
+    nameservers (list, optional): Overrides config['nameservers'].
+    port (int): Port for addresses given without one. Default is 53.
+
+    Returns:
+    NameserverPool: The pool for that server list.
+    """
+    config = config or {}
+    nameservers = tuple(nameservers or config.get('nameservers') or DEFAULT_NAMESERVERS)
+    key = (nameservers, port)
+    with _shared_pools_lock:
+        pool = _shared_pools.get(key)
+        if pool is None:
+            pool = _shared_pools[key] = NameserverPool(
+                list(nameservers), port=port, timeout=config.get('dns_timeout', 2.0),
+                hedge_after=config.get('dns_hedge_after'), max_failures=config.get('dns_max_failures', 3),
+                cooldown=config.get('dns_cooldown', 30.0),
+            )
+        return pool
+
+
+def resolve_domain(domain_name, nameservers=None, port=53, use_system_resolver=True, pool=None):
+    """
+    Resolves a domain name to its IP address and reports why a lookup failed.
+
+    Parameters:
+    domain_name (str): The domain name or URL to resolve.
+    nameservers (list, optional): Nameservers for the dnspython lookup. Defaults to DEFAULT_NAMESERVERS.
+    port (int): Port the nameservers listen on. Default is 53.
+    use_system_resolver (bool): Try the system resolver (socket) first. Default is True.
+    pool (NameserverPool, optional): Pool to query. Defaults to the shared pool for `nameservers`.
+
+    Returns:
+    tuple: (result, failure). The result is the IP address, "CLOSED_DOMAIN" for NXDOMAIN, or None.
+           The failure is None unless the result is None, and then 'no_answer' (no nameserver
+           answered: timeouts, SERVFAIL, REFUSED), 'nodata' (no A record), or 'error'.
+    """
+    closed_domain = "CLOSED_DOMAIN"  # Define a specific return value for closed/unreachable domains
+
+    domain_name = extract_domain(domain_name)
 
     # First attempt to resolve using socket
+    if use_system_resolver:
+        try:
+            ip_address = socket.gethostbyname(domain_name)
+            if ip_address:
+                logger.info("IP address of %s (using socket): %s", domain_name, ip_address,
+                            extra={'domain': domain_name, 'ip': ip_address, 'resolver': 'socket'})
+                return ip_address, None
+        except socket.gaierror:
+            logger.debug("Socket resolution failed for %s. Trying dnspython...", domain_name)
+
+    # If socket resolution fails, query the upstream nameserver pool
     try:
-        ip_address = socket.gethostbyname(domain_name)
-        if ip_address:
-            print(f"IP address of {domain_name} (using socket): {ip_address}")
-            return ip_address
-    except socket.gaierror:
-        print(f"Socket resolution failed for {domain_name}. Trying dnspython...")
-
-    # If socket resolution fails, attempt to resolve using dnspython
-    try:
-        resolver = dns.resolver.Resolver()
-        resolver.nameservers = ['1.1.1.1']  # Cloudflare DNS, can be changed to Google DNS '8.8.8.8'
-        answer = resolver.resolve(domain_name, 'A')
-        ip_address = answer[0].to_text()
-        print(f"IP address of {domain_name} (using dnspython): {ip_address}")
-        return ip_address
-    except dns.resolver.NXDOMAIN:
-        print(f"Domain does not exist: {domain_name}")
-        return closed_domain  # Return closed_domain for non-existent domains
-    except dns.resolver.Timeout:
-        print(f"Timeout while resolving domain: {domain_name}")
-    except dns.resolver.NoNameservers:
-        print(f"No nameservers available for domain: {domain_name}")
+        pool = pool or get_nameserver_pool(nameservers=nameservers, port=port)
+        response = pool.query(domain_name, 'A')
+        if response.rcode() == dns.rcode.NXDOMAIN:
+            logger.info("Domain does not exist: %s", domain_name, extra={'domain': domain_name, 'rcode': 'NXDOMAIN'})
+            return closed_domain, None  # Return closed_domain for non-existent domains
+        for rrset in response.answer:
+            if rrset.rdtype == dns.rdatatype.A:
+                ip_address = rrset[0].to_text()
+                logger.info("IP address of %s (using dnspython): %s", domain_name, ip_address,
+                            extra={'domain': domain_name, 'ip': ip_address, 'resolver': 'dnspython'})
+                return ip_address, None
+        logger.info("No A record for %s", domain_name, extra={'domain': domain_name, 'rcode': 'NOERROR'})
+        return None, 'nodata'
+    except (dns.resolver.NoNameservers, dns.exception.Timeout) as e:
+        logger.warning("DNS lookup failed for %s: %s", domain_name, e, extra={'domain': domain_name})
+        return None, 'no_answer'
     except Exception as e:
-        print(f"An error occurred while resolving with dnspython: {e}")
-    
-    return None
+        logger.error("An error occurred while resolving %s with dnspython: %s", domain_name, e,
+                     extra={'domain': domain_name})
+        return None, 'error'
+
+def resolve_domain_to_ip(domain_name, nameservers=None, port=53, use_system_resolver=True, pool=None):
+    """
+    Resolves a domain name to its corresponding IP address using both socket and dnspython.
+
+    Parameters:
+    domain_name (str): The domain name or URL to resolve.
+    nameservers (list, optional): Nameservers for the dnspython lookup. Defaults to DEFAULT_NAMESERVERS.
+    port (int): Port the nameservers listen on. Default is 53.
+    use_system_resolver (bool): Try the system resolver (socket) first. Default is True.
+    pool (NameserverPool, optional): Pool to query. Defaults to the shared pool for `nameservers`.
+
+    Returns:
+    str: The resolved IP address, or a string indicating the domain is closed, or None if the domain could not
+         be resolved (see resolve_domain for the reason).
+    """
+    return resolve_domain(domain_name, nameservers, port, use_system_resolver, pool)[0]
 
 # Example usage
 if __name__ == "__main__":
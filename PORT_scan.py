@@ -1,47 +1,238 @@
+import os
 import time
+import random
+import logging
 from scapy.all import *
 
-def scan_ports(ip_address, ports=None, delay=0.5):
+logger = logging.getLogger(__name__)
+
+# Named scan modes: 'list' scans the configured ports one by one, the others use scan_ports_fast
+PORT_SCAN_MODES = ('list', 'top100', 'top1000', 'full')
+
+# Bundled table of the top 1000 TCP ports, most frequently open first
+POPULARITY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'port_popularity.txt')
+
+_popular_ports = None
+
+def load_popular_ports(popularity_file=POPULARITY_FILE):
+    """
+    Loads the bundled port popularity table.
+
+    Parameters:
+    popularity_file (str): Path to the table, one port per line, most popular first.
+
+    Returns:
+    list: Port numbers in popularity order.
+    """
+    global _popular_ports
+    if popularity_file == POPULARITY_FILE and _popular_ports is not None:
+        return _popular_ports
+    with open(popularity_file, 'r') as file:
+        ports = [int(line) for line in (line.strip() for line in file) if line and not line.startswith('#')]
+    if popularity_file == POPULARITY_FILE:
+        _popular_ports = ports
+    return ports
+
+def ports_for_mode(mode, ports=None):
+    """
+    Returns the ports scanned by a named scan mode.
+
+    Parameters:
+    mode (str): One of PORT_SCAN_MODES.
+    ports (list, optional): The configured ports, used by the 'list' mode.
+
+    Returns:
+    list: Port numbers, in the order they should be probed.
+    """
+    if mode == 'list':
+        return list(ports) if ports is not None else [80, 443, 22]
+    if mode == 'top100':
+        return load_popular_ports()[:100]
+    if mode == 'top1000':
+        return load_popular_ports()[:1000]
+    if mode == 'full':
+        return list(range(1, 65536))
+    raise ValueError(f"Unknown port scan mode '{mode}'. Expected one of {', '.join(PORT_SCAN_MODES)}.")
+
+def scan_ports(ip_address, ports=None, delay=0.5, limiter=None):
     """
     Scans a list of ports on a given IP address to check if they are open, with a delay between each scan.
 
+    When a rate limiter is given it paces the packets instead of the fixed delay,
+    and is told the outcome of every probe so it can adapt its rate. As in
+    scan_ports_fast, a RST from a closed port is an ordinary answer, and an
+    unanswered port counts as a timeout only when the host's answer rate so far
+    has dropped below half of its best.
+
     Parameters:
     ip_address (str): The IP address to scan.
-    ports (list, optional): A list of port numbers to scan. Defaults to all ports (0-65535) if None.
+    ports (list, optional): A list of port numbers to scan. Defaults to the full range (1-65535) if None,
+                            which is scanned in parallel by scan_ports_fast.
     delay (float): The delay in seconds between each port scan to avoid blocking. Default is 0.5 seconds.
+    limiter (AdaptiveRateLimiter, optional): Shared rate limiter. Replaces the fixed delay when given.
 
     Returns:
     dict: A dictionary with port numbers as keys and their status ('open' or 'closed/filtered') as values.
     """
     if ports is None:
-        ports = range(0, 65536)  # Scan all ports if no specific ports are provided
+        # Probing 65535 ports one at a time would take more than a day
+        return scan_ports_fast(ip_address, ports_for_mode('full'), limiter=limiter, randomize=True)
     
     port_status = {}
+    probed = answered = 0
+    best_answer_rate = 0.0
 
     for port in ports:
+        if limiter is not None:
+            limiter.acquire(ip_address)
+
         # Crafting a TCP SYN packet
         syn_packet = IP(dst=ip_address)/TCP(dport=port, flags="S")
         
         # Sending the packet and waiting for a response
         response = sr1(syn_packet, timeout=1, verbose=False)
+        probed += 1
         
         # Checking the response to determine if the port is open
         if response:
-            if response.haslayer(TCP) and response.getlayer(TCP).flags == 0x12:
-                port_status[port] = 'open'
-                print(f"Port {port} is open")
-            else:
-                port_status[port] = 'closed/filtered'
-                print(f"Port {port} is closed or filtered")
+            answered += 1
+            port_status[port] = ('open' if response.haslayer(TCP) and response.getlayer(TCP).flags == 0x12
+                                 else 'closed/filtered')
+            # Any TCP reply (SYN-ACK or RST) shows the path is not congested
+            outcome = 'ok' if response.haslayer(TCP) else 'error'
         else:
             port_status[port] = 'closed/filtered'
-            print(f"Port {port} is closed or filtered")
+
+        answer_rate = answered / probed
+        if not response:
+            # A filtered port never answers; only a falling answer rate signals congestion
+            outcome = 'timeout' if answer_rate < best_answer_rate / 2 else 'ok'
+        best_answer_rate = max(best_answer_rate, answer_rate)
+
+        if limiter is not None:
+            limiter.record(ip_address, outcome)
+
+        # Per-port results are DEBUG-level chatter; enable with log_levels {"PORT_scan": "DEBUG"}
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Port %s on %s is %s", port, ip_address, port_status[port],
+                         extra={'ip': ip_address, 'port': port, 'state': port_status[port]})
 
         # Delay between each scan to avoid triggering security mechanisms
-        time.sleep(delay)
+        if limiter is None:
+            time.sleep(delay)
+
+    open_ports = [port for port, state in port_status.items() if state == 'open']
+    logger.info("Scanned %d ports on %s, open: %s", len(port_status), ip_address, open_ports,
+                extra={'ip': ip_address, 'open_ports': open_ports})
+    return port_status
+
+def scan_ports_fast(ip_address, ports, limiter=None, on_result=None, chunk_size=1024, timeout=1,
+                    randomize=False, retries=1, burst=64):
+    """
+    Scans many ports on an IP address by sending SYN packets in parallel batches.
 
+    Each batch is sent in one go and its replies are collected together, so a batch
+    costs about one timeout instead of one timeout per port. Unanswered ports are
+    probed once more in a later batch. When a rate limiter is given, every batch
+    waits for one token per packet, taken `burst` tokens at a time so the buckets
+    never run deep into debt and other hosts sharing them keep their turn.
+
+    A closed port answers with a RST, so RSTs are not a congestion signal here.
+    Instead, unanswered ports count as timeouts for the limiter only when a batch's
+    answer rate drops below half of the best rate seen so far on this host.
+
+    Parameters:
+    ip_address (str): The IP address to scan.
+    ports (list): Port numbers to scan, in the order they should be probed.
+    limiter (AdaptiveRateLimiter, optional): Shared rate limiter pacing the packets.
+    on_result (callable, optional): Called as on_result(port, status) as soon as each port is settled.
+    chunk_size (int): Number of packets per batch. Default is 1024.
+    timeout (float): Seconds to wait for the replies of a batch. Default is 1 second.
+    randomize (bool): Probe the ports in random order, which spreads the load and looks less like a sweep.
+    retries (int): Extra attempts for ports that did not answer. Default is 1.
+    burst (int): Tokens taken from the limiter per reservation. Default is 64.
+
+    Returns:
+    dict: A dictionary with port numbers as keys and their status ('open' or 'closed/filtered') as values.
+    """
+    ports = list(ports)
+    if randomize:
+        random.shuffle(ports)
+
+    port_status = {}
+    best_answer_rate = 0.0
+    started = time.monotonic()
+
+    def settle(port, status):
+        port_status[port] = status
+        if on_result is not None:
+            on_result(port, status)
+
+    pending = ports
+    for attempt in range(retries + 1):
+        unanswered = []
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            if limiter is not None:
+                for offset in range(0, len(chunk), burst):
+                    limiter.acquire(ip_address, cost=len(chunk[offset:offset + burst]))
+
+            answered, _ = sr(IP(dst=ip_address)/TCP(dport=chunk, flags="S"), timeout=timeout, verbose=False)
+
+            replies = {}
+            for sent, received in answered:
+                if received.haslayer(TCP):
+                    replies[sent[TCP].dport] = received.getlayer(TCP).flags
+                else:
+                    replies[sent[TCP].dport] = None
+
+            answer_rate = len(replies) / len(chunk)
+            congested = answer_rate < best_answer_rate / 2
+            best_answer_rate = max(best_answer_rate, answer_rate)
+
+            for port in chunk:
+                if port in replies:
+                    settle(port, 'open' if replies[port] == 0x12 else 'closed/filtered')
+                elif attempt == retries:
+                    settle(port, 'closed/filtered')
+                else:
+                    unanswered.append(port)
+                if limiter is not None:
+                    limiter.record(ip_address, 'timeout' if port not in replies and congested else 'ok')
+
+            logger.debug("Port scan of %s: %d/%d ports done, %d open", ip_address, len(port_status), len(ports),
+                        sum(1 for state in port_status.values() if state == 'open'),
+                        extra={'ip': ip_address, 'done': len(port_status), 'total': len(ports)})
+        pending = unanswered
+        if not pending:
+            break
+
+    open_ports = sorted(port for port, state in port_status.items() if state == 'open')
+    logger.info("Scanned %d ports on %s in %.1fs, open: %s", len(port_status), ip_address,
+                time.monotonic() - started, open_ports, extra={'ip': ip_address, 'open_ports': open_ports})
     return port_status
 
+def scan_ports_by_mode(ip_address, mode='list', ports=None, delay=0.5, limiter=None, on_result=None):
+    """
+    Scans an IP address using a named scan mode.
+
+    Parameters:
+    ip_address (str): The IP address to scan.
+    mode (str): 'list' (the given ports, one by one), 'top100', 'top1000', or 'full' (1-65535, randomized).
+    ports (list, optional): The ports for the 'list' mode.
+    delay (float): Delay between ports in 'list' mode when no rate limiter is given.
+    limiter (AdaptiveRateLimiter, optional): Rate limiter; for the batch modes, use the sweep limiter
+                                             (rate_limiter.get_sweep_limiter).
+    on_result (callable, optional): Progress callback for the batch modes, called as on_result(port, status).
+
+    Returns:
+    dict: A dictionary with port numbers as keys and their status ('open' or 'closed/filtered') as values.
+    """
+    if mode == 'list':
+        return scan_ports(ip_address, ports_for_mode(mode, ports), delay=delay, limiter=limiter)
+    return scan_ports_fast(ip_address, ports_for_mode(mode), limiter=limiter, on_result=on_result,
+                           randomize=(mode == 'full'))
+
 # Example usage
 if __name__ == "__main__":
     ip_address = "93.184.216.34"  # Example IP address (example.com)
@@ -1,36 +1,12 @@
-import re
-import time
-import logging
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QLabel, QLineEdit, QPushButton, QTextEdit, QFileDialog,
     QRadioButton, QVBoxLayout, QWidget, QHBoxLayout, QMessageBox, QGridLayout, QStatusBar
 )
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from IP_address import resolve_domain_to_ip
-from PORT_scan import scan_ports
-from HTTP_status import get_http_status_code
-from report import generate_report
 from config import load_config
-from screenshot_module import capture_domain_screenshot
-from datetime import datetime
-from output_storage import save_scan_results  # Import the save_scan_results function
-
-
-
-# Set up logging to a file
-logging.basicConfig(filename='http_status_debug.log', level=logging.INFO)
-
-import re
-import time
-import logging
-from PyQt5.QtCore import QThread, pyqtSignal
-from datetime import datetime
-from IP_address import resolve_domain_to_ip
-from PORT_scan import scan_ports
-from HTTP_status import get_http_status_code
-from screenshot_module import capture_domain_screenshot
-from report import generate_report
-from output_storage import save_scan_results
+from logging_module import setup_logging
+from scanner import run_scan
+from sharding import run_sharded_scan
 
 
 class ScanWorker(QThread):
@@ -44,130 +20,19 @@ class ScanWorker(QThread):
         self.headless = headless  # Headless (fast scan) or full browser (detailed scan)
 
     def run(self):
-        results_list = []
-        scan_results_to_save = []  # List to store scan results for saving
-
-        try:
-            for domain in self.domains:
-                sanitized_domain = re.sub(r'[\\/:*?"<>|]', '_', domain)
-                self.update_status.emit(f"Starting scan for {domain}...")
-
-                # Initialize variables to ensure they are always defined
-                http_status_code = "N/A"
-                http_status_desc = "N/A"
-                ip_address = None
-                port_status = {}
-                screenshot_path = None
-                redirected_url = None  # Store redirected URL
-
-                # Step 1: Resolve domain to IP
-                try:
-                    ip_address = resolve_domain_to_ip(domain)
-                    if not ip_address:
-                        self.update_status.emit(f"Failed to resolve IP for {domain}.")
-                        continue
-                    self.update_status.emit(f"Resolved IP for {domain}: {ip_address}")
-                except Exception as e:
-                    self.update_status.emit(f"Error resolving IP for {domain}: {str(e)}")
-                    continue
-
-                # Step 2: Scan ports
-                try:
-                    ports = self.config.get('ports', [80, 443, 22])
-                    port_status = scan_ports(ip_address, ports)
-                    self.update_status.emit(f"Port scan results for {domain}: {port_status}")
-                except Exception as e:
-                    self.update_status.emit(f"Error scanning ports for {domain}: {str(e)}")
-                    port_status = {}
-
-                # Step 3: Get HTTP status code
-                try:
-                    http_status_code, http_status_desc = get_http_status_code(domain)
-                    logging.info(f"Raw HTTP response for {domain}: {http_status_code} - {http_status_desc}")
-                    
-                    if http_status_code is None:
-                        http_status_code, http_status_desc = "N/A", "N/A"
-                        logging.warning(f"Empty or None HTTP status code for {domain}, defaulting to 'N/A'")
-                    
-                    self.update_status.emit(f"HTTP status code for {domain}: {http_status_code} - {http_status_desc}")
-                except Exception as e:
-                    self.update_status.emit(f"Failed to retrieve HTTP status for {domain}: {str(e)}")
-                    http_status_code, http_status_desc = "N/A", "N/A"
-                    logging.error(f"Error retrieving HTTP status for {domain}: {str(e)}")
-
-                # Step 4: Capture a screenshot and get redirected URL
-                try:
-                    self.update_status.emit(f"Capturing screenshot for {domain}...")
-
-                    # Capture screenshot and ensure it waits for full completion, also capture redirected URL
-                    screenshot_path, redirected_url = capture_domain_screenshot(f"http://{domain}", headless=self.headless)
-                    mode = "headless" if self.headless else "full browser mode"
-                    self.update_status.emit(f"Screenshot captured for {domain} in {mode}. Saved to: {screenshot_path}")
-                    self.update_status.emit(f"Redirected URL: {redirected_url}")
-
-                    # Add a small delay to ensure the screenshot process completes
-                    time.sleep(3)
-
-                except Exception as e:
-                    self.update_status.emit(f"Failed to capture screenshot for {domain}: {str(e)}")
-
-                # Step 5: Aggregate results
-                results = {
-                    "Domain Name": sanitized_domain,
-                    "IP Address": ip_address,
-                    "Port Status": port_status,
-                    "HTTP Status": f"{http_status_code} - {http_status_desc}",
-                    "Screenshot": screenshot_path,
-                    "Redirected URL": redirected_url  # Include the redirected URL
-                }
-
-                results_list.append(results)
-                self.update_status.emit(f"Aggregated results for {domain}")
-
-                # Step 6: Prepare scan results for saving
-                scan_results_to_save.append({
-                    'domain_name': sanitized_domain,
-                    'scan_date': datetime.now().strftime('%Y-%m-%d'),
-                    'port_status': port_status,
-                    'http_status_code': http_status_code,
-                    'http_status_desc': http_status_desc,
-                    'additional_info': screenshot_path,
-                    'redirected_url': redirected_url,  # Save the redirected URL
-                    'type_of_phishing': 'N/A'  # Modify this based on your logic
-                })
-
-                # Step 7: Wait between domain scans to ensure synchronization
-                self.update_status.emit(f"Waiting before scanning the next domain...")
-                time.sleep(5)  # Wait 5 seconds before moving to the next domain
-
-            # Step 8: Generate the report
-            if results_list:
-                try:
-                    report_type = 'pdf' if self.config.get('report_type') == 'pdf' else 'text'
-                    generate_report(results_list, report_type=report_type)
-                    self.update_status.emit(f"Report generated successfully.")
-                except Exception as e:
-                    self.update_status.emit(f"Failed to generate report: {str(e)}")
-            else:
-                self.update_status.emit("No valid results to report.")
-
-            # Step 9: Save the scan results to CSV
-            try:
-                save_scan_results(scan_results_to_save)
-                self.update_status.emit(f"Scan results saved to output storage.")
-            except Exception as e:
-                self.update_status.emit(f"Failed to save scan results: {str(e)}")
-
-        except Exception as e:
-            self.update_status.emit(f"An unexpected error occurred: {str(e)}")
+        if self.config.get('shards', 1) > 1:
+            run_sharded_scan(self.domains, self.config, self.headless, status=self.update_status.emit)
+        else:
+            run_scan(self.domains, self.config, self.headless, status=self.update_status.emit)
 
         # Signal that the scanning is complete
         self.finished.emit()
 
 class DomainScannerApp(QMainWindow):
-    def __init__(self):
+    def __init__(self, profile_mode=None):
         super().__init__()
         self.current_config = None
+        self.profile_mode = profile_mode  # 'cprofile' or 'sampling' to profile each scan run
         self.worker = None  # Track the worker thread
         self.initUI()
 
@@ -259,6 +124,8 @@ class DomainScannerApp(QMainWindow):
         if config_file_path:
             try:
                 self.current_config = load_config(config_file_path)
+                # Apply the file's log settings now rather than at the start of the next scan
+                setup_logging(self.current_config)
                 self.display_message(f"Configuration loaded from '{config_file_path}'")
             except Exception as e:
                 self.display_error(f"Error loading configuration file: {e}")
@@ -300,6 +167,8 @@ class DomainScannerApp(QMainWindow):
 
         report_type = 'pdf' if self.report_type_var_pdf.isChecked() else 'text'
         self.current_config['report_type'] = report_type
+        if self.profile_mode:
+            self.current_config['profile'] = self.profile_mode
 
         # Start the background scan worker
         self.worker = ScanWorker(domains, self.current_config, headless=headless)
@@ -337,6 +206,7 @@ class DomainScannerApp(QMainWindow):
 
 def main():
     import sys
+    setup_logging()
     app = QApplication(sys.argv)
     scanner_app = DomainScannerApp()
     scanner_app.show()
@@ -1,5 +1,8 @@
 import requests
 import re
+import logging
+
+logger = logging.getLogger(__name__)
 
 def get_http_status_code(url):
     """
@@ -20,11 +23,11 @@ def get_http_status_code(url):
         response = requests.get(url, timeout=5)
         
         # Print and return the HTTP status code
-        print(f"HTTP Status Code for {url}: {response.status_code}")
+        logger.info("HTTP Status Code for %s: %s", url, response.status_code)
         return response.status_code
     except requests.exceptions.RequestException as e:
         # Handle exceptions (e.g., connection errors, timeouts)
-        print(f"An error occurred while requesting {url}: {e}")
+        logger.error("An error occurred while requesting %s: %s", url, e)
         return None
 
 def aggregate_results(ip_address, port_status, http_status_code):
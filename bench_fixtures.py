@@ -0,0 +1,338 @@
+import os
+import random
+import shutil
+import socket
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import dns.flags
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+
+# Loopback address every stand-in binds to
+LOOPBACK = '127.0.0.1'
+
+
+class LocalDNSServer:
+    """
+    Authoritative DNS stand-in built on dnspython, listening on UDP loopback.
+
+    Answers A queries from a static zone. Latency and the NXDOMAIN rate are
+    configurable so the resolver stage can be measured under controlled conditions.
+    """
+
+    def __init__(self, zone=None, default_ip=None, latency=0.0, nxdomain_rate=0.0, servfail_rate=0.0,
+                 port=0, seed=0):
+        """
+        :param zone: Dictionary mapping domain names to IPv4 addresses.
+        :param default_ip: Address returned for names not in the zone. None returns NXDOMAIN.
+        :param latency: Seconds to wait before answering each query. Default is 0.
+        :param nxdomain_rate: Fraction of queries answered with NXDOMAIN regardless of the zone.
+        :param servfail_rate: Fraction of queries answered with SERVFAIL.
+        :param port: UDP port to bind. Default is 0 (pick a free port).
+        :param seed: Seed for the random failure injection, for reproducible runs.
+        """
+        self.zone = {name.lower().rstrip('.') + '.': ip for name, ip in (zone or {}).items()}
+        self.default_ip = default_ip
+        self.latency = latency
+        self.nxdomain_rate = nxdomain_rate
+        self.servfail_rate = servfail_rate
+        self.random = random.Random(seed)
+        self.queries = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((LOOPBACK, port))
+        self.port = self.sock.getsockname()[1]
+        self._running = False
+
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._serve, name=f'dns-{self.port}', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self.sock.close()
+
+    def _serve(self):
+        while self._running:
+            try:
+                wire, addr = self.sock.recvfrom(4096)
+            except OSError:
+                break
+            self.queries += 1
+            roll = self.random.random()
+            if self.latency:
+                threading.Timer(self.latency, self._answer, (wire, addr, roll)).start()
+            else:
+                self._answer(wire, addr, roll)
+
+    def _answer(self, wire, addr, roll):
+        try:
+            query = dns.message.from_wire(wire)
+        except Exception:
+            return
+        response = dns.message.make_response(query)
+        response.flags |= dns.flags.AA
+        question = query.question[0]
+        name = question.name.to_text().lower()
+        ip = self.zone.get(name, self.default_ip)
+
+        if roll < self.servfail_rate:
+            response.set_rcode(dns.rcode.SERVFAIL)
+        elif roll < self.servfail_rate + self.nxdomain_rate or ip is None:
+            response.set_rcode(dns.rcode.NXDOMAIN)
+        elif question.rdtype == dns.rdatatype.A:
+            response.answer.append(dns.rrset.from_text(question.name, 60, 'IN', 'A', ip))
+
+        try:
+            self.sock.sendto(response.to_wire(), addr)
+        except OSError:
+            pass
+
+
+class _FarmHandler(BaseHTTPRequestHandler):
+    """
+    Routes used by the HTTP farm:
+
+    /ok                  200 with a small HTML page
+    /status/<code>       the given status code
+    /redirect/<n>        a chain of n 302 redirects ending at /ok
+    /meta-refresh/<n>    like /redirect, but each hop is a 200 page with <meta http-equiv="refresh">
+    /slow/<ms>           200 after waiting <ms> milliseconds
+    /slow-page/<ms>      HTML page whose image and script resources each take <ms> to load
+    /asset/<ms>/<name>   a resource served after <ms> milliseconds
+    """
+
+    protocol_version = 'HTTP/1.1'
+    page = b"<html><head><title>Bench Page</title></head><body><form action='/login'>" \
+           b"<input name='user'></form><p>benchmark fixture</p></body></html>"
+
+    def do_GET(self):
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+        route = parts[0] if parts else 'ok'
+        arg = parts[1] if len(parts) > 1 else ''
+
+        if route == 'status' and arg.isdigit():
+            self._send(int(arg), b'')
+        elif route == 'redirect' and arg.isdigit():
+            remaining = int(arg)
+            location = f"/redirect/{remaining - 1}" if remaining > 1 else '/ok'
+            self._send(302, b'', {'Location': location, 'Set-Cookie': f'hop={remaining}; Path=/'})
+        elif route == 'meta-refresh' and arg.isdigit():
+            remaining = int(arg)
+            location = f"/meta-refresh/{remaining - 1}" if remaining > 1 else '/ok'
+            body = f"<html><head><meta http-equiv='refresh' content='0; url={location}'></head></html>".encode()
+            self._send(200, body, {'Content-Type': 'text/html'})
+        elif route == 'slow' and arg.isdigit():
+            time.sleep(int(arg) / 1000)
+            self._send(200, self.page, {'Content-Type': 'text/html'})
+        elif route == 'slow-page' and arg.isdigit():
+            body = (
+                "<html><head><title>Slow Page</title>"
+                f"<script src='/asset/{arg}/app.js'></script>"
+                f"<link rel='stylesheet' href='/asset/{arg}/font.woff2'></head>"
+                f"<body><p>slow fixture</p><img src='/asset/{arg}/hero.jpg'>"
+                f"<video src='/asset/{arg}/intro.mp4'></video></body></html>"
+            ).encode()
+            self._send(200, body, {'Content-Type': 'text/html'})
+        elif route == 'asset' and arg.isdigit():
+            time.sleep(int(arg) / 1000)
+            self._send(200, b'x' * 1024, {'Content-Type': 'application/octet-stream'})
+        else:
+            self._send(200, self.page, {'Content-Type': 'text/html'})
+
+    def _send(self, code, body, headers=None):
+        self.send_response(code)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def generate_self_signed_cert(directory, common_name='localhost'):
+    """
+    Creates a self-signed certificate and key with the openssl command-line tool.
+
+    :param directory: Directory to write cert.pem and key.pem into.
+    :param common_name: Subject CN (also added as a SAN).
+    :return: A tuple (cert_file, key_file), or None if openssl is not available.
+    """
+    if shutil.which('openssl') is None:
+        return None
+    cert_file = os.path.join(directory, 'cert.pem')
+    key_file = os.path.join(directory, 'key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '2',
+         '-keyout', key_file, '-out', cert_file, '-subj', f'/CN={common_name}',
+         '-addext', f'subjectAltName=DNS:{common_name},IP:{LOOPBACK}'],
+        check=True, capture_output=True,
+    )
+    return cert_file, key_file
+
+
+class HTTPFarm:
+    """
+    A set of loopback HTTP servers, plus HTTPS servers with a self-signed certificate.
+    """
+
+    def __init__(self, http_servers=2, https_servers=1):
+        self.http_servers = http_servers
+        self.https_servers = https_servers
+        self.servers = []
+        self.http_ports = []
+        self.https_ports = []
+        self._cert_dir = None
+
+    def start(self):
+        for _ in range(self.http_servers):
+            self.http_ports.append(self._start_server())
+
+        if self.https_servers:
+            self._cert_dir = tempfile.mkdtemp(prefix='bench_tls_')
+            cert = generate_self_signed_cert(self._cert_dir)
+            if cert is None:
+                print("openssl not found; HTTPS stand-ins are disabled.")
+            else:
+                context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+                context.load_cert_chain(*cert)
+                for _ in range(self.https_servers):
+                    self.https_ports.append(self._start_server(context))
+        return self
+
+    def _start_server(self, ssl_context=None):
+        server = ThreadingHTTPServer((LOOPBACK, 0), _FarmHandler)
+        server.daemon_threads = True
+        if ssl_context is not None:
+            server.socket = ssl_context.wrap_socket(server.socket, server_side=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.servers.append(server)
+        return server.server_address[1]
+
+    def urls(self, path='/ok'):
+        """
+        :return: One URL per running server for the given path.
+        """
+        return [f"http://{LOOPBACK}:{port}{path}" for port in self.http_ports] + \
+               [f"https://{LOOPBACK}:{port}{path}" for port in self.https_ports]
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        if self._cert_dir:
+            shutil.rmtree(self._cert_dir, ignore_errors=True)
+
+
+class TCPListeners:
+    """
+    Plain TCP listeners on chosen loopback ports that accept and immediately close connections.
+    """
+
+    def __init__(self, ports=(0, 0, 0)):
+        """
+        :param ports: Ports to listen on. 0 picks a free port.
+        """
+        self.sockets = []
+        for port in ports:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((LOOPBACK, port))
+            sock.listen(128)
+            self.sockets.append(sock)
+        self.ports = [sock.getsockname()[1] for sock in self.sockets]
+
+    def start(self):
+        for sock in self.sockets:
+            threading.Thread(target=self._accept, args=(sock,), daemon=True).start()
+        return self
+
+    def _accept(self, sock):
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                break
+            conn.close()
+
+    def stop(self):
+        for sock in self.sockets:
+            sock.close()
+
+
+def free_port():
+    """
+    :return: A loopback TCP port that nothing is listening on.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((LOOPBACK, 0))
+        return sock.getsockname()[1]
+
+
+def synthetic_scan_records(count, seed=42):
+    """
+    Builds scan records shaped like scanner.scan_domain's, for benchmarks that need
+    no network: a mix of ordinary domains, look-alike login pages, redirectors,
+    and domains that did not answer.
+
+    :param count: Number of records.
+    :param seed: Seed for the mix.
+    :return: A list of scan record dictionaries.
+    """
+    rng = random.Random(seed)
+    words = ('shop', 'news', 'cloud', 'login', 'secure', 'paypal', 'apple', 'account', 'verify', 'mail', 'app')
+    tlds = ('com', 'net', 'org', 'xyz', 'top', 'shop', 'co.uk', 'io')
+    records = []
+    for i in range(count):
+        name = '-'.join(rng.sample(words, rng.randint(1, 3))) + (str(rng.randint(1, 999)) if rng.random() < 0.3 else '')
+        domain = f"{'www.' if rng.random() < 0.3 else ''}{name}.{rng.choice(tlds)}"
+        kind = rng.random()
+        chain = [{'url': f"http://{domain}/", 'redirect_type': None}]
+        page = None
+        if kind < 0.15:
+            code = 'N/A'
+            chain = []
+        elif kind < 0.35:
+            code = 200
+            chain.append({'url': f"https://landing-{i}.example/", 'redirect_type': rng.choice(('http', 'meta-refresh'))})
+        else:
+            code = rng.choice((200, 200, 200, 403, 404, 503))
+            page = {'title': rng.choice(('Sign in to your account', 'Welcome', 'PayPal - Log in', 'Index of /')),
+                    'form_actions': [f"https://{domain}/login.php"] if rng.random() < 0.4 else []}
+        records.append({
+            'domain_name': domain,
+            'scan_date': '2024-09-13',
+            'port_status': {80: 'open', 443: rng.choice(('open', 'closed/filtered')), 22: rng.choice(('open', 'closed'))},
+            'http_status_code': code,
+            'redirect_chain': chain,
+            'page_fingerprint': page,
+            'tls_certificate': {'not_before': f"2024-0{rng.randint(1, 9)}-01T00:00:00+00:00",
+                                'self_signed': rng.random() < 0.05, 'valid': rng.random() < 0.9},
+        })
+    return records
+
+
+# Example usage within the module (optional)
+if __name__ == "__main__":
+    import requests
+    from IP_address import resolve_domain_to_ip
+
+    dns_server = LocalDNSServer({'bench-0.test': LOOPBACK}, latency=0.01).start()
+    print(resolve_domain_to_ip('bench-0.test', nameservers=[LOOPBACK], port=dns_server.port,
+                               use_system_resolver=False))
+
+    farm = HTTPFarm().start()
+    for url in farm.urls('/redirect/3'):
+        print(url, requests.get(url, verify=False, timeout=5).status_code)
+
+    farm.stop()
+    dns_server.stop()
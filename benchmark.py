@@ -0,0 +1,372 @@
+import argparse
+import contextlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bench_fixtures import LOOPBACK, LocalDNSServer, HTTPFarm, TCPListeners, free_port, synthetic_scan_records
+
+# Directory where benchmark results are written
+BENCH_DIR = 'bench_results'
+
+# Modules that can be benchmarked
+BENCH_MODULES = ('dns', 'port_scan', 'http', 'pipeline', 'classifier', 'screenshot')
+
+# Modules run when none are named; 'screenshot' needs Chrome and starts it once per page
+DEFAULT_MODULES = ('dns', 'port_scan', 'http', 'pipeline', 'classifier')
+
+# Synthetic scan records labelled per call of the classifier benchmark
+CLASSIFIER_BATCH = 10000
+
+# HTTP scenarios cycled through by the synthetic domains
+HTTP_PATHS = ('/ok', '/redirect/3', '/slow/200', '/status/404')
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _run(func, items, concurrency):
+    """
+    Calls `func` once per item, discarding anything it prints.
+
+    :return: A list of (seconds, ok) tuples, one per item.
+    """
+    def _call(item):
+        start = time.perf_counter()
+        try:
+            func(item)
+            ok = True
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                return list(pool.map(_call, items))
+        return [_call(item) for item in items]
+
+
+def measure(name, func, items, concurrency=1, memory=True):
+    """
+    Calls `func` once per item and records throughput, latency, and peak memory.
+
+    Timings come from a pass without tracemalloc, which slows allocation-heavy code
+    several-fold; peak memory comes from a second pass over the same items with
+    tracemalloc running. Output printed by the module under test is discarded so
+    it does not skew the terminal, but it is still produced, so its cost is
+    included in the timings.
+
+    :param name: Name of the benchmark.
+    :param func: Callable taking one item. Exceptions are counted as errors.
+    :param items: Items to process.
+    :param concurrency: Number of worker threads. Default is 1 (sequential, like the scanner).
+    :param memory: Run the memory pass. Default is True; without it the peak is None.
+    :return: A dictionary with the measurements.
+    """
+    items = list(items)
+    start = time.perf_counter()
+    outcomes = _run(func, items, concurrency)
+    wall = time.perf_counter() - start
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            _run(func, items, concurrency)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    latencies = [latency for latency, _ in outcomes]
+    errors = sum(1 for _, ok in outcomes if not ok)
+
+    return {
+        'benchmark': name,
+        'calls': len(latencies),
+        'errors': errors,
+        'concurrency': concurrency,
+        'wall_seconds': wall,
+        'per_second': len(latencies) / wall if wall else None,
+        'latency_seconds': {
+            'mean': sum(latencies) / len(latencies) if latencies else None,
+            'p50': _percentile(latencies, 0.50),
+            'p95': _percentile(latencies, 0.95),
+            'p99': _percentile(latencies, 0.99),
+            'max': max(latencies) if latencies else None,
+        },
+        'peak_python_memory_bytes': peak,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(domains=200, modules=DEFAULT_MODULES, dns_latency=0.005, nxdomain_rate=0.05,
+                   concurrency=1, seed=42, slow_page_ms=3000, memory=True):
+    """
+    Starts the loopback stand-ins and benchmarks each module and the full pipeline.
+
+    The pipeline benchmark runs scanner.scan_domain through the retry queue and stores
+    each result, as a scan run does, over http://localhost:<port>/<path> URLs: the
+    HTTP stage connects to the host name it is given, which the system resolver must
+    know. The DNS stage still goes to the stand-in, which answers every name it does
+    not know with loopback. Screenshots are skipped by a stage rule, so Chrome is not
+    needed.
+
+    :param domains: Number of synthetic domains. Default is 200.
+    :param modules: Modules to benchmark (see BENCH_MODULES).
+    :param dns_latency: Seconds the DNS stand-in waits before answering.
+    :param nxdomain_rate: Fraction of lookups answered with NXDOMAIN.
+    :param concurrency: Worker threads per benchmark. Default is 1.
+    :param seed: Seed for the stand-ins' failure injection.
+    :param slow_page_ms: Milliseconds each resource of the screenshot benchmark's slow page takes to load.
+    :param memory: Also measure peak memory, in a second pass per benchmark (see measure).
+    :return: A dictionary with the environment and one entry per benchmark.
+    """
+    from IP_address import resolve_domain_to_ip
+    from HTTP_status import get_http_status
+
+    names = [f"bench-{i}.test" for i in range(domains)]
+    dns_server = LocalDNSServer({name: LOOPBACK for name in names}, default_ip=LOOPBACK, latency=dns_latency,
+                                nxdomain_rate=nxdomain_rate, seed=seed).start()
+    farm = HTTPFarm().start()
+    listeners = TCPListeners().start()
+    closed_port = free_port()
+
+    urls = farm.urls()
+    targets = {
+        name: urls[i % len(urls)].rsplit('/', 1)[0] + HTTP_PATHS[i % len(HTTP_PATHS)]
+        for i, name in enumerate(names)
+    }
+    scan_port_list = listeners.ports + [closed_port]
+
+    def dns_stage(name):
+        return resolve_domain_to_ip(name, nameservers=[LOOPBACK], port=dns_server.port,
+                                    use_system_resolver=False)
+
+    def http_stage(name):
+        result = get_http_status(targets[name], retries=1, timeout=5)
+        if result['status_code'] is None:
+            raise RuntimeError('no response')
+        # Every HTTPS hop, redirects included, must carry its connection's certificate
+        if any(hop['url'].startswith('https://') and not hop['certificate'] for hop in result['chain']):
+            raise RuntimeError('HTTPS hop without a certificate')
+
+    def port_stage(ip_address):
+        from PORT_scan import scan_ports
+        return scan_ports(ip_address, scan_port_list, delay=0)
+
+    def screenshot_stage(url, lean):
+        from screenshot_module import capture_domain_screenshot
+        if capture_domain_screenshot(url, output_dir=screenshot_dir, headless=True, image_format='png',
+                                     lean=lean) is None:
+            raise RuntimeError('no screenshot')
+
+    pipeline_dir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    pipeline_urls = [target.replace(f"//{LOOPBACK}:", '//localhost:') for target in targets.values()]
+    farm_ports = sorted({int(url.split(':')[2].split('/')[0]) for url in pipeline_urls})
+    skipped_stages = ['screenshot', 'screenshot_index']
+    pipeline_config = {
+        'nameservers': [f"{LOOPBACK}:{dns_server.port}"],
+        'use_system_resolver': False,
+        'ports': scan_port_list + farm_ports,
+        'web_ports': farm_ports,
+        'port_cache_file': os.path.join(pipeline_dir, 'port_cache.json'),
+        'rate_limit': False,  # Like the module benchmarks, measure the code rather than the pacing
+        'fetch_body': True,
+        'fetch_favicon': False,
+    }
+
+    def pipeline(url):
+        from output_storage import store_scan_result
+        from retry_queue import run_with_retries, get_retry_queue
+        from scanner import scan_domain
+
+        def scan(domain, final_attempt):
+            return scan_domain(domain, pipeline_config, True, status=lambda message: None,
+                               rules=pipeline_rules, final_attempt=final_attempt)
+
+        def on_result(domain, results, scan_record):
+            if results is None:
+                raise RuntimeError(f"unresolved: {scan_record}")
+            store_scan_result(scan_record, results, run_id='bench',
+                              db_path=os.path.join(pipeline_dir, 'scan_results.db'))
+
+        run_with_retries([url], scan, on_result, queue=get_retry_queue(pipeline_config),
+                         status=lambda message: None)
+
+    available = set(modules)
+    if 'port_scan' in available:
+        try:
+            # Replies on the loopback interface are only seen through a raw L3 socket
+            from scapy.all import conf, L3RawSocket
+            conf.L3socket = L3RawSocket
+        except ImportError:
+            print("scapy is not installed; skipping the port_scan benchmark.")
+            available.discard('port_scan')
+    if 'port_scan' not in available:
+        skipped_stages.append('port_scan')
+    if 'pipeline' in available:
+        from stage_rules import StageRules, DEFAULT_RULES
+        # An empty 'when' matches every domain
+        pipeline_rules = StageRules(DEFAULT_RULES + [
+            {'name': 'benchmark', 'after': 'dns', 'when': {}, 'skip': skipped_stages},
+        ])
+    if 'classifier' in available:
+        try:
+            from phishing_classifier import get_classifier
+        except ImportError:
+            print("numpy is not installed; skipping the classifier benchmark.")
+            available.discard('classifier')
+    if 'screenshot' in available:
+        try:
+            import selenium  # noqa: F401
+        except ImportError:
+            print("selenium is not installed; skipping the screenshot benchmark.")
+            available.discard('screenshot')
+    # Pages whose script, font, image, and video each take slow_page_ms to load
+    slow_pages = [farm.urls(f"/slow-page/{slow_page_ms}")[0]] * max(1, domains // 50)
+    screenshot_dir = tempfile.mkdtemp(prefix='bench_screenshots_')
+
+    results = []
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            if 'dns' in available:
+                results.append(measure('dns', dns_stage, names, concurrency, memory))
+            if 'port_scan' in available:
+                port_hosts = [LOOPBACK] * max(1, domains // 10)
+                results.append(measure('port_scan', port_stage, port_hosts, concurrency, memory))
+            if 'http' in available:
+                results.append(measure('http', http_stage, names, concurrency, memory))
+            if 'pipeline' in available:
+                results.append(measure('pipeline', pipeline, pipeline_urls, concurrency, memory))
+            if 'classifier' in available:
+                # Batches of CLASSIFIER_BATCH records; records_per_second is the figure to compare
+                classifier = get_classifier()
+                records = synthetic_scan_records(CLASSIFIER_BATCH, seed)
+                entry = measure('classifier', classifier.label, [records] * max(1, domains // 20), concurrency,
+                                memory)
+                entry['records_per_second'] = entry['per_second'] * CLASSIFIER_BATCH
+                results.append(entry)
+            if 'screenshot' in available:
+                results.append(measure('screenshot_full', lambda url: screenshot_stage(url, False), slow_pages,
+                                       memory=memory))
+                results.append(measure('screenshot_lean', lambda url: screenshot_stage(url, True), slow_pages,
+                                       memory=memory))
+    finally:
+        dns_server.stop()
+        farm.stop()
+        listeners.stop()
+        shutil.rmtree(screenshot_dir, ignore_errors=True)
+        shutil.rmtree(pipeline_dir, ignore_errors=True)
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'parameters': {
+            'domains': domains, 'dns_latency': dns_latency, 'nxdomain_rate': nxdomain_rate,
+            'concurrency': concurrency, 'seed': seed, 'scanned_ports': len(scan_port_list),
+            'slow_page_ms': slow_page_ms, 'memory_pass': memory,
+        },
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'results': results,
+    }
+
+
+def save_results(bench, output_file=None):
+    """
+    Saves benchmark results as JSON in the bench_results folder.
+
+    :return: The path to the results file.
+    """
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    if output_file is None:
+        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        output_file = os.path.join(BENCH_DIR, f"bench_{timestamp}_{bench.get('commit') or 'nogit'}.json")
+    with open(output_file, 'w') as file:
+        json.dump(bench, file, indent=4)
+    return output_file
+
+
+def compare_results(baseline_file, candidate_file):
+    """
+    Prints the change in throughput and p95 latency between two result files.
+    """
+    with open(baseline_file) as file:
+        baseline = {entry['benchmark']: entry for entry in json.load(file)['results']}
+    with open(candidate_file) as file:
+        candidate = {entry['benchmark']: entry for entry in json.load(file)['results']}
+
+    print(f"{'benchmark':<16}{'per_second':>24}{'p95 latency (ms)':>28}")
+    for name in candidate:
+        if name not in baseline:
+            continue
+        old, new = baseline[name], candidate[name]
+        old_p95 = old['latency_seconds']['p95'] * 1000
+        new_p95 = new['latency_seconds']['p95'] * 1000
+        change = (new['per_second'] / old['per_second'] - 1) * 100 if old['per_second'] else 0
+        print(f"{name:<16}{old['per_second']:>9.1f} -> {new['per_second']:<8.1f}({change:+.0f}%)"
+              f"{old_p95:>12.1f} -> {new_p95:.1f}")
+
+
+def print_results(bench):
+    for entry in bench['results']:
+        latency = entry['latency_seconds']
+        peak = entry['peak_python_memory_bytes']
+        print(f"{entry['benchmark']:<16} {entry['per_second']:8.1f}/s  "
+              f"p50 {latency['p50'] * 1000:7.1f} ms  p95 {latency['p95'] * 1000:7.1f} ms  "
+              f"errors {entry['errors']:4d}  peak mem " + (f"{peak / 1024:8.0f} KiB" if peak is not None else "     n/a")
+              + (f"  {entry['records_per_second']:,.0f} records/s" if 'records_per_second' in entry else ''))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks against loopback DNS/HTTP/TCP stand-ins.")
+    parser.add_argument('--domains', type=int, default=200, help="Number of synthetic domains.")
+    parser.add_argument('--modules', default=','.join(DEFAULT_MODULES),
+                        help=f"Comma-separated subset of: {', '.join(BENCH_MODULES)}.")
+    parser.add_argument('--dns-latency', type=float, default=0.005, help="DNS stand-in latency in seconds.")
+    parser.add_argument('--nxdomain-rate', type=float, default=0.05, help="Fraction of NXDOMAIN answers.")
+    parser.add_argument('--concurrency', type=int, default=1, help="Worker threads per benchmark.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--slow-page-ms', type=int, default=3000,
+                        help="Resource delay of the slow page used by the screenshot benchmark.")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="Skip the second, tracemalloc-instrumented pass that measures peak memory.")
+    parser.add_argument('--output', help="Results file. Default: bench_results/bench_<time>_<commit>.json.")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'),
+                        help="Compare two saved result files instead of running.")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare_results(*args.compare)
+        return
+
+    modules = [module.strip() for module in args.modules.split(',') if module.strip()]
+    bench = run_benchmarks(args.domains, modules, args.dns_latency, args.nxdomain_rate,
+                           args.concurrency, args.seed, args.slow_page_ms, memory=not args.no_memory)
+    print_results(bench)
+    print(f"Results saved to {save_results(bench, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
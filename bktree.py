@@ -0,0 +1,127 @@
+def levenshtein(a, b, max_distance=None):
+    """
+    Computes the edit distance (insertions, deletions, substitutions) between two strings.
+
+    :param a: First string.
+    :param b: Second string.
+    :param max_distance: Stop early once the distance is known to exceed this. Default is no bound.
+    :return: The distance, or max_distance + 1 if it exceeds max_distance.
+    """
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+    if not b:
+        return len(a)
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over strings under edit distance.
+
+    Every child edge is labelled with the distance between the child and its parent.
+    By the triangle inequality, a search for words within k of a query only has to
+    descend into edges labelled d - k .. d + k, where d is the distance between the
+    query and the node, so most of the tree is never compared.
+
+    Nodes are kept in flat lists (word, {distance: child index}), which serialize
+    to JSON without recursion.
+    """
+
+    def __init__(self, distance=levenshtein):
+        self.distance = distance
+        self.words = []
+        self.children = []
+        self._positions = {}
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self._positions
+
+    def add(self, word):
+        """
+        Inserts a word.
+
+        :return: True if the word was new.
+        """
+        if word in self._positions:
+            return False
+        index = len(self.words)
+        self.words.append(word)
+        self.children.append({})
+        self._positions[word] = index
+        if index == 0:
+            return True
+
+        node = 0
+        while True:
+            distance = self.distance(word, self.words[node])
+            child = self.children[node].get(distance)
+            if child is None:
+                self.children[node][distance] = index
+                return True
+            node = child
+
+    def search(self, word, max_distance):
+        """
+        Finds the words within an edit distance of a query.
+
+        :param word: The query.
+        :param max_distance: Largest distance to include.
+        :return: A list of (distance, word) tuples, closest first.
+        """
+        if not self.words:
+            return []
+        matches = []
+        pending = [0]
+        while pending:
+            node = pending.pop()
+            distance = self.distance(word, self.words[node])
+            if distance <= max_distance:
+                matches.append((distance, self.words[node]))
+            for edge, child in self.children[node].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    pending.append(child)
+        matches.sort()
+        return matches
+
+    def to_dict(self):
+        """
+        :return: A JSON-serializable form of the tree.
+        """
+        return {'words': self.words,
+                'children': [sorted(children.items()) for children in self.children]}
+
+    @classmethod
+    def from_dict(cls, data, distance=levenshtein):
+        """
+        Rebuilds a tree saved with to_dict without recomputing any distance.
+        """
+        tree = cls(distance)
+        tree.words = list(data['words'])
+        tree.children = [{edge: child for edge, child in children} for children in data['children']]
+        tree._positions = {word: index for index, word in enumerate(tree.words)}
+        return tree
+
+
+# Example usage within the module (optional)
+if __name__ == "__main__":
+    tree = BKTree()
+    for word in ('fla-sh', 'fim-sh', 'flq-fh', 'xll-fh', 'example', 'exampel'):
+        tree.add(word)
+    print(tree.search('fla-sh', 2))
+    print(tree.search('example', 1))
@@ -1,5 +1,8 @@
 import json
 import os
+import logging
+
+logger = logging.getLogger(__name__)
 
 def load_config(config_file='config.json'):
     """
@@ -9,7 +12,7 @@ def load_config(config_file='config.json'):
     :return: A dictionary containing the configuration settings.
     """
     if not os.path.exists(config_file):
-        print(f"Configuration file '{config_file}' not found. Using default settings.")
+        logger.warning("Configuration file '%s' not found. Using default settings.", config_file)
         return default_config()
 
     if config_file.endswith('.json'):
@@ -17,7 +20,7 @@ def load_config(config_file='config.json'):
     elif config_file.endswith('.txt'):
         return load_txt_config(config_file)
     else:
-        print(f"Unsupported file format: '{config_file}'. Using default settings.")
+        logger.warning("Unsupported file format: '%s'. Using default settings.", config_file)
         return default_config()
 
 def load_json_config(config_file):
@@ -30,10 +33,10 @@ def load_json_config(config_file):
     try:
         with open(config_file, 'r') as file:
             config = json.load(file)
-            print(f"Configuration loaded from '{config_file}'.")
+            logger.info("Configuration loaded from '%s'.", config_file)
             return config
     except Exception as e:
-        print(f"Error loading JSON configuration file: {e}. Using default settings.")
+        logger.error("Error loading JSON configuration file: %s. Using default settings.", e)
         return default_config()
 
 def load_txt_config(config_file):
@@ -50,10 +53,10 @@ def load_txt_config(config_file):
                 if line.strip() and not line.startswith('#'):
                     key, value = line.split('=')
                     config[key.strip()] = parse_config_value(value.strip())
-        print(f"Configuration loaded from '{config_file}'.")
+        logger.info("Configuration loaded from '%s'.", config_file)
         return config
     except Exception as e:
-        print(f"Error loading TXT configuration file: {e}. Using default settings.")
+        logger.error("Error loading TXT configuration file: %s. Using default settings.", e)
         return default_config()
 
 def parse_config_value(value):
@@ -81,8 +84,62 @@ def default_config():
         "ports": [80, 443, 22, 8080],  # Default ports to scan
         "timeout": 5,                  # Default timeout for network operations in seconds
         "retry_attempts": 3,           # Default number of retry attempts for scanning
+        "retry_queue": True,           # Retry transient DNS/HTTP failures later from a queue instead of on the spot
+        "retry_base_delay": 5,         # Seconds before a domain's first retry; tripled for each later one...
+        "retry_max_delay": 120,        # ...up to this many seconds
         "output_format": "json",       # Default output format (json or text)
         "log_level": "INFO",           # Default logging level (INFO, DEBUG, ERROR)
+        "console_log_level": "INFO",   # Minimum level echoed to the terminal
+        "log_levels": {"PORT_scan": "INFO"},  # Per-module levels; set PORT_scan to DEBUG for per-port results
+        "log_file": "logs/app_log.jsonl",  # Structured JSON-lines log
+        "log_max_bytes": 10485760,     # Rotate the log when it reaches this size (10 MB)...
+        "log_rotate_when": "midnight", # ...and on this schedule
+        "log_backup_count": 7,         # Number of rotated log files to keep
+        "domain_delay": 0,             # Extra fixed seconds between domains (pacing is done by the rate limiter)
+        "rate_limit": {                # Adaptive (AIMD) rate limiter shared by ports, HTTP, and screenshots; false disables it
+            "limits": {"global": [100, 1000], "subnet": [20, 200], "ip": [5, 50]},  # [initial, max] per second
+            "window": 20,              # Outcomes per adjustment window
+            "threshold": 0.3,          # Timeout/RST share above which the rate is halved
+        },
+        "use_system_resolver": True,   # Try the operating system's resolver before the nameserver pool
+        "nameservers": ["1.1.1.1", "8.8.8.8", "9.9.9.9"],  # Upstream resolver pool ("ip" or "ip:port")
+        "dns_timeout": 2.0,            # Seconds before a query to one nameserver counts as failed
+        "dns_hedge_after": None,       # Seconds before a slow query is also sent to the next server (null: adaptive)
+        "dns_max_failures": 3,         # Consecutive failures that eject a nameserver...
+        "dns_cooldown": 30,            # ...for this many seconds
+        "port_scan_mode": "list",      # list (the ports above), top100, top1000, or full (1-65535, randomized)
+        "port_sweep_rate_limit": {     # Separate packet budget for top100, top1000, and full; false disables it
+            "limits": {"global": [2000, 10000], "subnet": [1000, 5000], "ip": [500, 2000]},  # [initial, max] per second
+        },
+        "port_cache": True,            # Scan each (IP, port set) once and reuse it for every domain on the IP
+        "port_cache_ttl": 21600,       # Seconds a cached port scan stays valid across runs (6 hours)
+        "fetch_body": False,           # Read the start of each page to fingerprint it (title, forms, favicon, text hash)
+        "body_max_kb": 64,             # Most of a page body read for the fingerprint, in KB
+        "fetch_favicon": True,         # Also download and hash the favicon when fingerprinting
+        "classifier": True,            # Label each domain's type_of_phishing with the batch classifier
+        "classifier_model": None,      # JSON model file; null uses models/phishing_model.json
+        "web_ports": [80, 443, 8080, 8443],  # Ports whose state decides whether HTTP and screenshots run
+        "stage_rules": None,           # Early-exit rules (see stage_rules.py); null uses the defaults, [] runs every stage
+        "screenshot_format": "webp",   # Stored screenshot encoding: webp, jpeg, or png
+        "screenshot_quality": 80,      # WebP/JPEG quality (1-100)
+        "screenshot_viewport": [1280, 800],  # Browser viewport (width, height)
+        "screenshot_devices": ["android"],  # Device profiles to capture; several share one browser session and are compared for cloaking
+        "screenshot_lean": True,       # Eager page load, blocked resources, and a network-idle wait instead of a full load
+        "screenshot_block": ["media", "fonts", "trackers"],  # Resource categories blocked in lean capture
+        "screenshot_deadline": 30,     # Seconds a capture may take before the page is stopped and the browser killed
+        "screenshot_index": True,      # Perceptual-hash each screenshot and look up near-duplicates
+        "screenshot_similarity_distance": 6,  # Max Hamming distance (of 64 bits) for a similar screenshot
+        "similarity_index": True,      # Index scanned domains for lookalike clusters in the report summary
+        "similarity_index_file": "scan_output/domain_similarity.json",  # Persistent lookalike index
+        "report_cache": True,          # Reuse rendered report sections of domains whose results and screenshot are unchanged
+        "report_cache_dir": "output/.report_cache",  # Rendered sections and decoded screenshots
+        "shards": 1,                   # Worker processes for sharded scanning (1 scans in-process)
+        "api_port": 8780,              # Port of the local results API (python results_api.py)
+        "api_cors_origin": "http://localhost:3000",  # Dashboard origin allowed by the results API (null sends no CORS headers)
+        "api_token": None,             # Secret required in X-Scan-Token to start scans through the API; null disables POST
+        "metrics_port": 9464,          # Localhost port for the Prometheus /metrics endpoint (0 disables it)
+        "metrics_snapshot_file": "logs/metrics_snapshot.json",  # Periodic JSON metrics snapshot (null disables it)
+        "metrics_snapshot_interval": 10,  # Seconds between metrics snapshots
     }
 
 def save_config(config, config_file='config.json'):
@@ -95,9 +152,9 @@ def save_config(config, config_file='config.json'):
     try:
         with open(config_file, 'w') as file:
             json.dump(config, file, indent=4)
-            print(f"Configuration saved to '{config_file}'.")
+            logger.info("Configuration saved to '%s'.", config_file)
     except Exception as e:
-        print(f"Error saving configuration file: {e}")
+        logger.error("Error saving configuration file: %s", e)
 
 # Example usage within the module (optional)
 if __name__ == "__main__":
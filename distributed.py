@@ -0,0 +1,462 @@
+import argparse
+import hmac
+import ipaddress
+import json
+import logging
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from IP_address import canonical_domain
+from logging_module import log_status
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the coordinator
+DEFAULT_PORT = 8765
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_LEASE_TIMEOUT = 300  # Seconds a worker may hold a batch without reporting progress
+
+
+class LeaseCoordinator:
+    """
+    Hands out batches of canonical domains to workers under time-limited leases.
+
+    A lease is renewed every time its worker reports a result. When a lease expires,
+    the domains it still holds go back to the queue for another worker. Results are
+    deduplicated by canonical domain, so a domain scanned twice (e.g., by a slow
+    worker whose lease was reassigned) is only merged once. Results for domains
+    that were never queued, or sent under a lease that was never issued, are
+    rejected, so they cannot end the run early.
+    """
+
+    def __init__(self, domains, batch_size=DEFAULT_BATCH_SIZE, lease_timeout=DEFAULT_LEASE_TIMEOUT,
+                 run_id=None, on_result=None):
+        """
+        :param domains: Domains to scan. They are canonicalised and deduplicated.
+        :param batch_size: Maximum domains per lease. Default is 20.
+        :param lease_timeout: Seconds before an idle lease expires. Default is 300.
+        :param run_id: Identifier of the run in the result store.
+        :param on_result: Callback (domain, results, scan_record) called once per merged domain.
+        """
+        seen = set()
+        self.queue = deque()
+        for domain in domains:
+            domain = canonical_domain(domain)
+            if domain and domain not in seen:
+                seen.add(domain)
+                self.queue.append(domain)
+        self.domains = frozenset(seen)
+        self.total = len(seen)
+        self.batch_size = batch_size
+        self.lease_timeout = lease_timeout
+        self.run_id = run_id
+        self.on_result = on_result
+        self.leases = {}
+        self.issued = set()  # Every lease id handed out, expired ones included
+        self.completed = {}  # domain -> (results, scan_record); results is None for unresolved domains
+        self.duplicates = 0
+        self.rejected = 0
+        self.reassigned = 0
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+        if not self.total:
+            self.finished.set()
+
+    def _reap_expired(self, now):
+        for lease_id, lease in list(self.leases.items()):
+            if lease['expires'] > now:
+                continue
+            remaining = [domain for domain in lease['domains'] if domain not in self.completed]
+            if remaining:
+                logger.warning("Lease %s of worker %s expired; requeueing %d domain(s)", lease_id,
+                               lease['worker'], len(remaining), extra={'lease': lease_id, 'worker': lease['worker']})
+                self.reassigned += len(remaining)
+                self.queue.extendleft(reversed(remaining))
+            del self.leases[lease_id]
+
+    def lease(self, worker_id, max_batch=None):
+        """
+        Leases the next batch of domains to a worker.
+
+        :param worker_id: Identifier of the requesting worker.
+        :param max_batch: Upper bound requested by the worker.
+        :return: A dictionary with 'lease_id', 'domains', and 'lease_timeout';
+                 'done' is True once every domain has been merged.
+        """
+        with self._lock:
+            now = time.time()
+            self._reap_expired(now)
+            if self.finished.is_set():
+                return {'done': True}
+
+            size = min(self.batch_size, max_batch or self.batch_size)
+            batch = []
+            while self.queue and len(batch) < size:
+                domain = self.queue.popleft()
+                if domain not in self.completed:
+                    batch.append(domain)
+            if not batch:
+                # Everything is leased out; the worker should poll again in case a lease expires
+                return {'done': False, 'domains': [], 'retry_after': 2}
+
+            lease_id = uuid.uuid4().hex
+            self.issued.add(lease_id)
+            self.leases[lease_id] = {'worker': worker_id, 'domains': set(batch),
+                                     'expires': now + self.lease_timeout}
+            return {'done': False, 'lease_id': lease_id, 'domains': batch, 'lease_timeout': self.lease_timeout}
+
+    def submit(self, lease_id, worker_id, items):
+        """
+        Merges results streamed back by a worker.
+
+        :param lease_id: The lease the results belong to. Results for an expired lease are
+                         still merged if the domain is not done yet; results for a lease that
+                         was never issued are rejected.
+        :param worker_id: Identifier of the reporting worker.
+        :param items: A list of {'domain', 'results', 'scan_record'} dictionaries.
+        :return: A dictionary with the number of accepted, duplicate, and rejected results.
+        """
+        accepted = rejected = 0
+        merged = []
+        with self._lock:
+            if lease_id not in self.issued:
+                logger.warning("Rejected %d result(s) from worker %s under unknown lease %s", len(items),
+                               worker_id, lease_id, extra={'lease': lease_id, 'worker': worker_id})
+                self.rejected += len(items)
+                return {'accepted': 0, 'duplicates': 0, 'rejected': len(items)}
+
+            lease = self.leases.get(lease_id)
+            for item in items:
+                domain = canonical_domain(str(item.get('domain') or ''))
+                if domain not in self.domains:
+                    logger.warning("Rejected a result from worker %s for %r, which was never queued", worker_id,
+                                   domain, extra={'lease': lease_id, 'worker': worker_id, 'domain': domain})
+                    rejected += 1
+                    continue
+                if lease is not None:
+                    lease['domains'].discard(domain)
+                if domain in self.completed:
+                    self.duplicates += 1
+                    continue
+                self.completed[domain] = (item.get('results'), item.get('scan_record'))
+                merged.append((domain, item.get('results'), item.get('scan_record')))
+                accepted += 1
+
+            if lease is not None:
+                if lease['domains']:
+                    lease['expires'] = time.time() + self.lease_timeout
+                else:
+                    del self.leases[lease_id]
+
+            self.rejected += rejected
+            if len(self.completed) >= self.total:
+                self.finished.set()
+
+        for domain, results, scan_record in merged:
+            if self.on_result is not None:
+                self.on_result(domain, results, scan_record)
+
+        return {'accepted': accepted, 'duplicates': len(items) - accepted - rejected, 'rejected': rejected}
+
+    def progress(self):
+        with self._lock:
+            return {
+                'total': self.total,
+                'completed': len(self.completed),
+                'queued': len(self.queue),
+                'leased': sum(len(lease['domains']) for lease in self.leases.values()),
+                'active_leases': len(self.leases),
+                'reassigned': self.reassigned,
+                'duplicates': self.duplicates,
+                'rejected': self.rejected,
+                'done': self.finished.is_set(),
+            }
+
+
+def _make_handler(coordinator, token=None):
+    class CoordinatorHandler(BaseHTTPRequestHandler):
+        def _reply(self, code, payload):
+            body = json.dumps(payload, default=str).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _authorised(self):
+            if token and not hmac.compare_digest(self.headers.get('X-Scan-Token', ''), token):
+                self._reply(403, {'error': 'invalid token'})
+                return False
+            return True
+
+        def do_GET(self):
+            if not self._authorised():
+                return
+            if self.path == '/status':
+                self._reply(200, coordinator.progress())
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if not self._authorised():
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                self._reply(400, {'error': 'invalid JSON'})
+                return
+
+            if self.path == '/lease':
+                self._reply(200, coordinator.lease(payload.get('worker_id', 'unknown'), payload.get('max_batch')))
+            elif self.path == '/results':
+                self._reply(200, coordinator.submit(payload.get('lease_id'), payload.get('worker_id', 'unknown'),
+                                                    payload.get('items', [])))
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def log_message(self, format, *args):
+            logger.debug("coordinator: " + format, *args)
+
+    return CoordinatorHandler
+
+
+def is_loopback(host):
+    """
+    :param host: An interface address or host name to bind.
+    :return: True if only this machine can connect to it.
+    """
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def run_coordinator(domains, config, host='127.0.0.1', port=DEFAULT_PORT, batch_size=DEFAULT_BATCH_SIZE,
+                    lease_timeout=DEFAULT_LEASE_TIMEOUT, token=None, status=log_status, linger=10):
+    """
+    Serves work leases over HTTP until every domain has a result, then writes the report.
+
+    Endpoints (JSON over HTTP): POST /lease, POST /results, GET /status.
+
+    :param domains: Domains to scan.
+    :param config: A dictionary containing the configuration settings.
+    :param host: Interface to bind. Use '0.0.0.0' to accept workers on other hosts.
+    :param port: TCP port to listen on. Default is 8765.
+    :param batch_size: Maximum domains per lease.
+    :param lease_timeout: Seconds before an idle lease is reassigned.
+    :param token: Shared secret workers must send in the X-Scan-Token header. Required unless
+                  `host` is a loopback address.
+    :param status: Callback receiving progress messages. Default logs them (see logging_module.log_status).
+    :param linger: Seconds to keep answering 'done' to workers after the run completes.
+    :return: A list of result dictionaries, one per resolved domain.
+    :raises ValueError: If `host` accepts remote connections and no token is given.
+    """
+    if not token and not is_loopback(host):
+        raise ValueError(f"Refusing to bind the coordinator to {host} without a token; pass --token.")
+
+    from logging_module import setup_logging
+    from metrics import start_exporters
+    from output_storage import store_scan_result
+    from profiling import start_profiler
+    from scanner import finish_scan, new_run_id, stop_profiler, write_final_snapshot
+
+    setup_logging(config)
+    start_exporters(config)
+    run_id = new_run_id()
+
+    def on_result(domain, results, scan_record):
+        if results is not None:
+            store_scan_result(scan_record, results, run_id=run_id)
+        status(f"Result for {domain} merged")
+
+    coordinator = LeaseCoordinator(domains, batch_size, lease_timeout, run_id=run_id, on_result=on_result)
+    server = ThreadingHTTPServer((host, port), _make_handler(coordinator, token))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='coordinator', daemon=True).start()
+    status(f"Coordinator listening on {host}:{server.server_address[1]} with {coordinator.total} domain(s)")
+
+    results_list = []
+    try:
+        while not coordinator.finished.wait(5):
+            progress = coordinator.progress()
+            status(f"Progress: {progress['completed']}/{progress['total']} done, "
+                   f"{progress['leased']} leased, {progress['queued']} queued")
+        completed = list(coordinator.completed.values())
+        results_list = [results for results, _ in completed if results is not None]
+        scan_results_to_save = [scan_record for results, scan_record in completed if results is not None]
+        profiler = start_profiler(config, run_id=run_id, label='coordinator')
+        finish_scan(results_list, scan_results_to_save, config, status=status, profiler=profiler,
+                    run_id=run_id)
+        stop_profiler(profiler, status=status)
+        write_final_snapshot(config, status=status)
+
+        # Give polling workers a chance to hear that the run is over
+        time.sleep(linger)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return results_list
+
+
+def run_worker(coordinator_url, config, headless=True, worker_id=None, max_batch=None, token=None,
+               status=log_status, max_connection_errors=5):
+    """
+    Leases batches from a coordinator, runs the scan stages, and streams each result back.
+
+    :param coordinator_url: Base URL of the coordinator (e.g., "http://10.0.0.5:8765").
+    :param config: A dictionary containing the configuration settings.
+    :param headless: Capture screenshots in a headless browser (fast scan) or a full browser (detailed scan).
+    :param worker_id: Identifier reported to the coordinator. Defaults to hostname and a random suffix.
+    :param max_batch: Largest batch to request.
+    :param token: Shared secret expected by the coordinator.
+    :param status: Callback receiving progress messages. Default logs them (see logging_module.log_status).
+    :param max_connection_errors: Consecutive connection failures before giving up.
+    :return: The number of domains this worker scanned.
+    """
+    import requests
+    from logging_module import setup_logging
+    from port_cache import flush_port_cache
+    from profiling import start_profiler, profile_span
+    from scanner import scan_domain, stop_profiler
+    from stage_rules import StageRules
+    from retry_queue import run_with_retries, get_retry_queue
+
+    setup_logging(config)
+    rules = StageRules.from_config(config)
+    worker_id = worker_id or f"{socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+    headers = {'X-Scan-Token': token} if token else {}
+    session = requests.Session()
+    scanned = 0
+    errors = 0
+    # With config['profile'] set, each worker writes its own profile and trace, labelled with its id
+    profiler = start_profiler(config, label=worker_id)
+
+    def post(path, payload):
+        response = session.post(coordinator_url.rstrip('/') + path, json=payload, headers=headers, timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    while True:
+        try:
+            lease = post('/lease', {'worker_id': worker_id, 'max_batch': max_batch})
+            errors = 0
+        except requests.RequestException as e:
+            errors += 1
+            if errors >= max_connection_errors:
+                status(f"Coordinator unreachable after {errors} attempts; stopping: {e}")
+                break
+            time.sleep(2 * errors)
+            continue
+
+        if lease.get('done'):
+            status(f"Worker {worker_id}: coordinator reports the run is complete.")
+            break
+        if not lease.get('domains'):
+            time.sleep(lease.get('retry_after', 2))
+            continue
+
+        status(f"Worker {worker_id}: leased {len(lease['domains'])} domain(s)")
+
+        def scan(domain, final_attempt):
+            nonlocal scanned
+            scanned += 1
+            with profile_span(profiler, 'scan_domain', domain):
+                return scan_domain(domain, config, headless, status=status, profiler=profiler, rules=rules,
+                                   final_attempt=final_attempt)
+
+        def report(domain, results, scan_record):
+            item = {'domain': domain, 'results': results, 'scan_record': scan_record}
+            try:
+                post('/results', {'lease_id': lease['lease_id'], 'worker_id': worker_id, 'items': [item]})
+            except requests.RequestException as e:
+                # The lease will expire and the domain will be rescanned elsewhere
+                status(f"Failed to report result for {domain}: {e}")
+            time.sleep(config.get('domain_delay', 0))
+
+        # Transient failures are retried within the batch, so the lease is settled before the next one
+        run_with_retries(lease['domains'], scan, report, queue=get_retry_queue(config), status=status)
+
+    flush_port_cache()
+    stop_profiler(profiler, status=status)
+    return scanned
+
+
+def _read_domains(args):
+    domains = []
+    if args.domains:
+        domains.extend(domain.strip() for domain in args.domains.split(','))
+    if args.domains_file:
+        with open(args.domains_file, 'r') as file:
+            domains.extend(line.strip() for line in file)
+    return [domain for domain in domains if domain]
+
+
+def _worker_process(coordinator_url, config, worker_id, token):
+    from logging_module import process_log_config
+
+    # Local workers share the coordinator's disk, so each gets its own log file
+    run_worker(coordinator_url, process_log_config(config, worker_id), worker_id=worker_id, token=token)
+
+
+def main(argv=None):
+    from config import load_config, default_config
+
+    parser = argparse.ArgumentParser(description="Distributed scanning: a coordinator serves work leases to workers.")
+    sub = parser.add_subparsers(dest='role', required=True)
+
+    coordinator = sub.add_parser('coordinator', help="Serve leases for a domain list and merge results.")
+    coordinator.add_argument('--domains')
+    coordinator.add_argument('--domains-file')
+    coordinator.add_argument('--bind', default='127.0.0.1', help="Use 0.0.0.0 to accept remote workers.")
+    coordinator.add_argument('--port', type=int, default=DEFAULT_PORT)
+    coordinator.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    coordinator.add_argument('--lease-timeout', type=int, default=DEFAULT_LEASE_TIMEOUT)
+    coordinator.add_argument('--local-workers', type=int, default=0,
+                             help="Also start this many worker processes on this host (for local testing).")
+
+    worker = sub.add_parser('worker', help="Lease domains from a coordinator and scan them.")
+    worker.add_argument('--coordinator', required=True, help="Coordinator URL, e.g. http://10.0.0.5:8765")
+    worker.add_argument('--worker-id')
+    worker.add_argument('--max-batch', type=int)
+    worker.add_argument('--detailed', action='store_true', help="Use a full browser for screenshots.")
+
+    for sub_parser in (coordinator, worker):
+        sub_parser.add_argument('--config', help="Configuration file (.json or .txt).")
+        sub_parser.add_argument('--token', help="Shared secret sent in the X-Scan-Token header.")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config) if args.config else default_config()
+    if args.role == 'coordinator' and not args.token and not is_loopback(args.bind):
+        parser.error(f"--token is required when binding to {args.bind}")
+
+    if args.role == 'worker':
+        run_worker(args.coordinator, config, headless=not args.detailed, worker_id=args.worker_id,
+                   max_batch=args.max_batch, token=args.token)
+        return
+
+    workers = []
+    if args.local_workers:
+        import multiprocessing
+        context = multiprocessing.get_context('spawn')
+        url = f"http://127.0.0.1:{args.port}"
+        for index in range(args.local_workers):
+            process = context.Process(target=_worker_process, args=(url, config, f"local-{index}", args.token))
+            process.start()
+            workers.append(process)
+
+    run_coordinator(_read_domains(args), config, host=args.bind, port=args.port, batch_size=args.batch_size,
+                    lease_timeout=args.lease_timeout, token=args.token)
+    for process in workers:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from bktree import BKTree, levenshtein
+
+logger = logging.getLogger(__name__)
+
+# Index of every registrable domain scanned so far
+INDEX_FILE = os.path.join('scan_output', 'domain_similarity.json')
+
+# Default edit distance under which two domain labels count as lookalikes
+DEFAULT_MAX_DISTANCE = 2
+
+# Labels shorter than this are too short to group reliably (most 3-letter names are 2 edits apart)
+MIN_LABEL_LENGTH = 5
+
+# Two-label public suffixes, so "shop.example.co.uk" reduces to "example.co.uk". An
+# approximation of the Public Suffix List covering the suffixes common in our feeds.
+MULTI_LABEL_SUFFIXES = {
+    'co.uk', 'org.uk', 'ac.uk', 'gov.uk', 'me.uk', 'com.au', 'net.au', 'org.au', 'co.nz', 'co.za',
+    'co.jp', 'ne.jp', 'or.jp', 'co.kr', 'co.in', 'co.id', 'com.br', 'com.cn', 'com.tw', 'com.hk',
+    'com.sg', 'com.my', 'com.ph', 'com.vn', 'com.pk', 'com.ng', 'com.mx', 'com.ar', 'com.tr', 'com.ua',
+}
+
+# Trigram length for the inverted index
+GRAM = 3
+
+# Fewest trigrams a candidate must share with the query for the trigram index to be used;
+# below it the candidate lists are long and the BK-trees are faster
+TRIGRAM_MIN_SHARED = 1
+
+
+def registrable_domain(domain):
+    """
+    Reduces a host name or URL to its registrable domain (approximately; see MULTI_LABEL_SUFFIXES).
+
+    :param domain: A domain, host name, or URL.
+    :return: The registrable domain in lower case, e.g. "fla-sh.cc" for "https://www.fla-sh.cc/login".
+    """
+    host = (domain or '').strip().lower()
+    host = host.split('://', 1)[-1].split('/', 1)[0].split('?', 1)[0]
+    host = host.rsplit('@', 1)[-1].split(':', 1)[0].strip('.')
+    labels = host.split('.')
+    keep = 3 if len(labels) > 2 and '.'.join(labels[-2:]) in MULTI_LABEL_SUFFIXES else 2
+    return '.'.join(labels[-keep:])
+
+
+def domain_label(registrable):
+    """
+    :return: The part of a registrable domain before its public suffix ("fla-sh" for "fla-sh.cc").
+    """
+    labels = registrable.split('.')
+    keep = 2 if len(labels) > 2 and '.'.join(labels[-2:]) in MULTI_LABEL_SUFFIXES else 1
+    return '.'.join(labels[:-keep]) or registrable
+
+
+def trigrams(label):
+    """
+    :return: The distinct trigrams of a label padded with '#' on each side.
+    """
+    padded = '#' * (GRAM - 1) + label + '#' * (GRAM - 1)
+    return {padded[i:i + GRAM] for i in range(len(padded) - GRAM + 1)}
+
+
+class DomainSimilarityIndex:
+    """
+    Persistent index of registrable domains for lookalike (typosquat) queries.
+
+    Domains are compared by the label before their public suffix, so "fla-sh.cc"
+    and "fla-sh.com" are at distance 0 and "fim-sh.cc" at distance 2. Two structures
+    answer "labels within edit distance k of X":
+
+    - An inverted trigram index. An edit changes at most three of a label's
+      trigrams, so a label within k edits of X shares at least |trigrams(X)| - 3k
+      of them. Counting shared trigrams over the posting lists gives a small
+      candidate set, which is then checked with a bounded edit distance.
+    - BK-trees (bktree.py), one per label length, used when X is too short for
+      the trigram bound to filter well. Labels within k edits differ in length by
+      at most k, so only the trees for lengths len(X) - k .. len(X) + k are searched.
+
+    Both are exact. The domain list and the BK-trees are saved as JSON; the
+    trigram index is rebuilt from them on load.
+    """
+
+    def __init__(self, index_file=INDEX_FILE):
+        """
+        :param index_file: Path to the index file, or None to keep the index in memory only.
+        """
+        self.index_file = index_file
+        self.domains = {}
+        self.label_domains = defaultdict(set)
+        self.trees = defaultdict(BKTree)
+        self.grams = defaultdict(list)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.load()
+
+    def __len__(self):
+        return len(self.domains)
+
+    def __contains__(self, domain):
+        return registrable_domain(domain) in self.domains
+
+    def _insert(self, registrable, label):
+        self.domains[registrable] = label
+        self.label_domains[label].add(registrable)
+        if self.trees[len(label)].add(label):
+            for gram in trigrams(label):
+                self.grams[gram].append(label)
+
+    def load(self):
+        """
+        Loads the index file, if there is one.
+
+        :return: The number of domains loaded.
+        """
+        if not self.index_file or not os.path.exists(self.index_file):
+            return 0
+        with open(self.index_file, 'r') as file:
+            try:
+                data = json.load(file)
+            except ValueError as e:
+                logger.warning("Ignoring unreadable domain similarity index %s: %s", self.index_file, e)
+                return 0
+        with self._lock:
+            self.trees = defaultdict(BKTree, {int(length): BKTree.from_dict(tree)
+                                              for length, tree in data['bktrees'].items()})
+            self.grams = defaultdict(list)
+            for tree in self.trees.values():
+                for label in tree.words:
+                    for gram in trigrams(label):
+                        self.grams[gram].append(label)
+            self.domains = {}
+            self.label_domains = defaultdict(set)
+            for registrable, label in data['domains'].items():
+                self.domains[registrable] = label
+                self.label_domains[label].add(registrable)
+        return len(self.domains)
+
+    def add(self, domain):
+        """
+        Adds a domain (reduced to its registrable domain) to the index.
+
+        :param domain: A domain, host name, or URL.
+        :return: The registrable domain.
+        """
+        registrable = registrable_domain(domain)
+        with self._lock:
+            if registrable and registrable not in self.domains:
+                self._insert(registrable, domain_label(registrable))
+                self._dirty = True
+        return registrable
+
+    def add_many(self, domains):
+        """
+        :return: The number of registrable domains that were new to the index.
+        """
+        before = len(self.domains)
+        for domain in domains:
+            self.add(domain)
+        return len(self.domains) - before
+
+    def save(self):
+        """
+        Writes the index file, first merging in domains that other processes saved since it was loaded.
+
+        :return: The path of the index file, or None for an in-memory index.
+        """
+        if not self.index_file:
+            return None
+        with self._lock:
+            if not self._dirty:
+                return self.index_file
+            if os.path.exists(self.index_file):
+                try:
+                    with open(self.index_file, 'r') as file:
+                        on_disk = json.load(file)['domains']
+                except (ValueError, KeyError) as e:
+                    logger.warning("Overwriting unreadable domain similarity index %s: %s", self.index_file, e)
+                    on_disk = {}
+                for registrable, label in on_disk.items():
+                    if registrable not in self.domains:
+                        self._insert(registrable, label)
+
+            os.makedirs(os.path.dirname(self.index_file) or '.', exist_ok=True)
+            temp_file = f"{self.index_file}.{os.getpid()}.tmp"
+            with open(temp_file, 'w') as file:
+                json.dump({'version': 1, 'domains': self.domains,
+                           'bktrees': {length: tree.to_dict() for length, tree in self.trees.items()}},
+                          file, separators=(',', ':'))
+            os.replace(temp_file, self.index_file)
+            self._dirty = False
+        return self.index_file
+
+    def similar_labels(self, label, max_distance=DEFAULT_MAX_DISTANCE):
+        """
+        :return: A list of (distance, label) tuples for indexed labels within max_distance, closest first.
+        """
+        grams = trigrams(label)
+        threshold = len(grams) - GRAM * max_distance
+        with self._lock:
+            if threshold < TRIGRAM_MIN_SHARED:
+                matches = []
+                for length in range(max(len(label) - max_distance, 1), len(label) + max_distance + 1):
+                    if length in self.trees:
+                        matches.extend(self.trees[length].search(label, max_distance))
+                matches.sort()
+                return matches
+            shared = Counter()
+            for gram in grams:
+                shared.update(self.grams.get(gram, ()))
+        matches = []
+        for candidate, count in shared.items():
+            if count < threshold or abs(len(candidate) - len(label)) > max_distance:
+                continue
+            distance = levenshtein(label, candidate, max_distance)
+            if distance <= max_distance:
+                matches.append((distance, candidate))
+        matches.sort()
+        return matches
+
+    def similar(self, domain, max_distance=DEFAULT_MAX_DISTANCE, limit=None):
+        """
+        Finds indexed registrable domains that look like a domain.
+
+        :param domain: A domain, host name, or URL (need not be in the index).
+        :param max_distance: Largest edit distance between labels. Default is 2.
+        :param limit: Maximum number of results. Default is no limit.
+        :return: A list of (distance, registrable domain) tuples, closest first, without the domain itself.
+        """
+        registrable = registrable_domain(domain)
+        matches = []
+        for distance, label in self.similar_labels(domain_label(registrable), max_distance):
+            for other in sorted(self.label_domains.get(label, ())):
+                if other != registrable:
+                    matches.append((distance, other))
+        return matches[:limit] if limit else matches
+
+    def lookalike_clusters(self, domains, max_distance=DEFAULT_MAX_DISTANCE, min_label_length=MIN_LABEL_LENGTH,
+                           known_limit=10):
+        """
+        Groups domains into lookalike families.
+
+        Two domains in the list are joined when their labels are within
+        max_distance; families are the connected groups. Each family also lists the
+        lookalikes already in the index from earlier scans.
+
+        :param domains: Domains to group (typically those of one report).
+        :param max_distance: Largest edit distance between labels. Default is 2.
+        :param min_label_length: Shorter labels are left out. Default is 5.
+        :param known_limit: Most earlier lookalikes listed per family. Default is 10.
+        :return: A list of (members, known) tuples, largest family first; both are sorted
+                 lists of registrable domains.
+        """
+        members = sorted({registrable_domain(domain) for domain in domains} - {''})
+        members = [member for member in members if len(domain_label(member)) >= min_label_length]
+        parent = {member: member for member in members}
+
+        def find(member):
+            while parent[member] != member:
+                parent[member] = parent[parent[member]]
+                member = parent[member]
+            return member
+
+        # Members are joined through an index of their own, so they need not be in this one yet
+        local = DomainSimilarityIndex(None)
+        local.add_many(members)
+        known = defaultdict(set)
+        for member in members:
+            for _, other in local.similar(member, max_distance):
+                parent[find(other)] = find(member)
+            known[member].update(other for _, other in self.similar(member, max_distance) if other not in parent)
+
+        families = defaultdict(list)
+        for member in members:
+            families[find(member)].append(member)
+
+        clusters = []
+        for family in families.values():
+            earlier = sorted(set().union(*(known[member] for member in family)))
+            if len(family) + len(earlier) > 1:
+                clusters.append((family, earlier[:known_limit]))
+        clusters.sort(key=lambda cluster: (-len(cluster[0]), cluster[0]))
+        return clusters
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_similarity_index(config=None):
+    """
+    Returns the process-wide domain similarity index, loaded from config['similarity_index_file'] on first use.
+
+    :param config: A dictionary containing the configuration settings.
+    :return: The shared DomainSimilarityIndex.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = DomainSimilarityIndex((config or {}).get('similarity_index_file', INDEX_FILE))
+        return _shared
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lookalike index of scanned registrable domains.")
+    parser.add_argument('--index', default=INDEX_FILE, help="Index file. Default: %(default)s")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="Add every domain in the result store (or a file) to the index.")
+    build.add_argument('--domains-file', help="File with one domain per line, instead of the result store.")
+    build.add_argument('--db', help="Result store. Default: scan_output/scan_results.db.")
+
+    similar = commands.add_parser('similar', help="List indexed domains similar to a domain.")
+    similar.add_argument('domain')
+    similar.add_argument('-k', '--max-distance', type=int, default=DEFAULT_MAX_DISTANCE)
+
+    args = parser.parse_args(argv)
+    index = DomainSimilarityIndex(args.index)
+
+    if args.command == 'build':
+        if args.domains_file:
+            with open(args.domains_file) as file:
+                domains = [line.strip() for line in file if line.strip()]
+        else:
+            from output_storage import connect_results_db, RESULTS_DB
+            conn = connect_results_db(args.db or RESULTS_DB)
+            try:
+                domains = [row[0] for row in conn.execute('SELECT DISTINCT domain_name FROM scan_results')]
+            finally:
+                conn.close()
+        started = time.monotonic()
+        added = index.add_many(domains)
+        index.save()
+        print(f"Added {added} registrable domain(s) in {time.monotonic() - started:.1f}s; {len(index)} in the index.")
+    else:
+        started = time.monotonic()
+        matches = index.similar(args.domain, args.max_distance)
+        for distance, domain in matches:
+            print(f"{distance}  {domain}")
+        print(f"{len(matches)} match(es) in {(time.monotonic() - started) * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
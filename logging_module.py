@@ -1,42 +1,237 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import threading
 from datetime import datetime
 
-# Create a logs directory if it doesn't exist
-if not os.path.exists('logs'):
-    os.makedirs('logs')
+# Directory and file for the structured (JSON lines) application log
+LOG_DIR = 'logs'
+LOG_FILE = os.path.join(LOG_DIR, 'app_log.jsonl')
+
+# Per-module levels applied unless the configuration overrides them.
+# Per-port scan results are logged at DEBUG, so they stay off at these defaults.
+DEFAULT_MODULE_LEVELS = {
+    'urllib3': 'WARNING',
+    'selenium': 'WARNING',
+    'WDM': 'WARNING',
+    'scapy': 'ERROR',
+}
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_listener = None
+_settings = None
+_setup_lock = threading.Lock()
+
+# Logger that progress messages go through when no other status callback is given
+status_logger = logging.getLogger('status')
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line, including any `extra` fields.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SizeAndTimeRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """
+    Rotates the log file on a schedule (like TimedRotatingFileHandler) and also
+    whenever it grows past `maxBytes`.
+    """
+
+    def __init__(self, filename, when='midnight', interval=1, backupCount=7, maxBytes=10 * 1024 * 1024,
+                 encoding='utf-8'):
+        super().__init__(filename, when=when, interval=interval, backupCount=backupCount, encoding=encoding)
+        self.maxBytes = maxBytes
+
+    def shouldRollover(self, record):
+        if super().shouldRollover(record):
+            return True
+        if self.maxBytes > 0:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.seek(0, 2)
+            if self.stream.tell() + len(self.format(record)) + 1 >= self.maxBytes:
+                return True
+        return False
+
+    def rotation_filename(self, default_name):
+        # Several size-based rollovers can happen within one time period; number
+        # them instead of overwriting the earlier file.
+        name = super().rotation_filename(default_name)
+        counter = 1
+        candidate = name
+        while os.path.exists(candidate):
+            candidate = f"{name}.{counter}"
+            counter += 1
+        return candidate
+
+
+def _log_settings(config):
+    return (
+        config.get('log_file', LOG_FILE),
+        config.get('log_level', 'INFO'),
+        config.get('console_log_level', 'INFO'),
+        config.get('log_max_bytes', 10 * 1024 * 1024),
+        config.get('log_rotate_when', 'midnight'),
+        config.get('log_backup_count', 7),
+    )
+
+
+def setup_logging(config=None):
+    """
+    Configures application-wide logging for the process.
+
+    Records are put on an in-memory queue by a QueueHandler and written by a
+    QueueListener thread, so scanning threads never block on file or terminal I/O.
+    The log file holds JSON lines and rotates daily and by size.
+
+    Recognised configuration keys: 'log_level', 'console_log_level', 'log_levels'
+    (a {module: level} dictionary), 'log_file', 'log_max_bytes', 'log_rotate_when',
+    and 'log_backup_count'. Calling it again with a configuration whose settings
+    differ (e.g., once a config file has been loaded) replaces the handlers;
+    calling it without a configuration keeps the current setup.
+
+    :param config: A dictionary containing the configuration settings.
+    :return: The running QueueListener.
+    """
+    global _listener, _settings
+
+    with _setup_lock:
+        if _listener is not None:
+            if config is None:
+                return _listener
+            if _log_settings(config) == _settings:
+                _apply_module_levels(config)
+                return _listener
+            _stop_listener()
+        else:
+            atexit.register(shutdown_logging)
+        config = config or {}
+
+        log_file = config.get('log_file', LOG_FILE)
+        os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+
+        file_handler = SizeAndTimeRotatingFileHandler(
+            log_file,
+            when=config.get('log_rotate_when', 'midnight'),
+            backupCount=config.get('log_backup_count', 7),
+            maxBytes=config.get('log_max_bytes', 10 * 1024 * 1024),
+        )
+        file_handler.setFormatter(JsonFormatter())
+
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(config.get('console_log_level', 'INFO'))
+        console_handler.setFormatter(logging.Formatter('%(message)s'))
+
+        log_queue = queue.SimpleQueue()
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+        root.setLevel(config.get('log_level', 'INFO'))
+        _apply_module_levels(config)
+
+        _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler,
+                                                   respect_handler_level=True)
+        _listener.start()
+        _settings = _log_settings(config)
+        return _listener
+
+
+def log_status(message):
+    """
+    Progress callback for headless runs: sends the message through the logging
+    queue, so scanning threads do not wait on the terminal. It shows on the
+    console at INFO and is kept in the JSON log.
+
+    :param message: The progress message.
+    """
+    status_logger.info(message)
+
+
+def process_log_config(config, suffix):
+    """
+    Returns a copy of the configuration whose log file is specific to one process
+    (e.g., "logs/app_log.shard2.jsonl"), so processes never rotate the same file.
+
+    :param config: A dictionary containing the configuration settings.
+    :param suffix: Process label inserted before the file extension.
+    """
+    base, extension = os.path.splitext(config.get('log_file', LOG_FILE))
+    return dict(config, log_file=f"{base}.{suffix}{extension}")
+
+
+def _apply_module_levels(config):
+    levels = dict(DEFAULT_MODULE_LEVELS)
+    levels.update(config.get('log_levels') or {})
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level.upper() if isinstance(level, str) else level)
+
+
+def _stop_listener():
+    global _listener, _settings
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    _settings = None
+
+
+def shutdown_logging():
+    """
+    Flushes queued records and stops the listener thread.
+    """
+    with _setup_lock:
+        if _listener is not None:
+            _stop_listener()
 
-# Configure the logging
-logging.basicConfig(
-    filename=f"logs/app_log_{datetime.now().strftime('%Y-%m-%d')}.log",
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-)
 
 def log_action(action, status):
     """
     Logs an action taken by the program.
-    
+
     :param action: Description of the action (e.g., "Domain Resolution").
     :param status: Outcome or details of the action (e.g., "IP Address: 192.168.1.1").
     """
-    logging.info(f"Action: {action}, Status: {status}")
+    logging.getLogger(__name__).info("Action: %s, Status: %s", action, status,
+                                     extra={'action': action, 'status': status})
 
 def handle_error(error):
     """
     Handles and logs an error encountered during program execution.
-    
+
     :param error: Exception object or error message.
     """
-    logging.error(f"Error: {str(error)}")
+    logging.getLogger(__name__).error("Error: %s", error, extra={'error_type': type(error).__name__})
     print(f"An error occurred: {str(error)}. Please check the log file for more details.")
 
 # Example usage within the module (optional)
 if __name__ == "__main__":
+    setup_logging()
     try:
         # Example action logging
         log_action("Example Action", "This is a test log entry.")
-        
+
         # Example error handling
         raise ValueError("This is a test error.")
     except Exception as e:
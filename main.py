@@ -1,14 +1,78 @@
-from UI import DomainScannerApp
-from PyQt5.QtWidgets import QApplication
+import argparse
 import sys
+from profiling import PROFILE_MODES
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Domain Scanner: IP, port, HTTP status and screenshot scanning.")
+    parser.add_argument('--headless', action='store_true',
+                        help="Run the scan from the command line without the GUI.")
+    parser.add_argument('--domains', help="Comma-separated list of domains to scan (headless mode).")
+    parser.add_argument('--domains-file', help="Text file with one domain per line (headless mode).")
+    parser.add_argument('--config', help="Configuration file (.json or .txt).")
+    parser.add_argument('--report-type', choices=['text', 'pdf'], default=None,
+                        help="Report format for headless runs. Default is taken from the config, else text.")
+    parser.add_argument('--detailed', action='store_true',
+                        help="Capture screenshots in a full browser instead of a headless one.")
+    parser.add_argument('--shards', type=int, default=None,
+                        help="Split the domains across this many worker processes (headless mode).")
+    parser.add_argument('--profile', nargs='?', const='cprofile', choices=PROFILE_MODES, default=None,
+                        help="Profile each scan run (default mode: cprofile) and write a Chrome trace "
+                             "of per-domain stage spans to the 'profiles' folder.")
+    return parser.parse_args(argv)
+
+
+def run_headless(args):
+    from config import load_config, default_config
+    from logging_module import setup_logging
+    from scanner import run_scan
+
+    config = load_config(args.config) if args.config else default_config()
+    setup_logging(config)
+
+    domains = []
+    if args.domains:
+        domains.extend(domain.strip() for domain in args.domains.split(','))
+    if args.domains_file:
+        with open(args.domains_file, 'r') as file:
+            domains.extend(line.strip() for line in file)
+    domains = [domain for domain in domains if domain]
+    if not domains:
+        print("No domains provided. Use --domains or --domains-file.")
+        return 1
+
+    if args.report_type:
+        config['report_type'] = args.report_type
+    if args.profile:
+        config['profile'] = args.profile
+
+    if args.shards and args.shards > 1:
+        from sharding import run_sharded_scan
+        run_sharded_scan(domains, config, headless=not args.detailed, shards=args.shards)
+    else:
+        run_scan(domains, config, headless=not args.detailed)
+    return 0
+
+
+def main(argv=None):
+    from logging_module import setup_logging
+
+    args = parse_args(argv)
+
+    if args.headless:
+        sys.exit(run_headless(args))
+
+    setup_logging()
+
+    from PyQt5.QtWidgets import QApplication
+    from UI import DomainScannerApp
 
-def main():
     app = QApplication(sys.argv)
-    scanner_app = DomainScannerApp()
+    scanner_app = DomainScannerApp(profile_mode=args.profile)
 
     # Instead of using get_user_input, we launch the PyQt5 application
     scanner_app.show()
-    
+
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
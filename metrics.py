@@ -0,0 +1,481 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in seconds. The range covers everything from a
+# cached DNS lookup to a slow browser capture.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# Pipeline stages that are instrumented by the scanner
+STAGES = ('dns', 'port_scan', 'http', 'screenshot', 'report')
+
+STAGE_CALLS = 'domain_scout_stage_calls_total'
+STAGE_ERRORS = 'domain_scout_stage_errors_total'
+STAGE_IN_FLIGHT = 'domain_scout_stage_in_flight'
+STAGE_LATENCY = 'domain_scout_stage_latency_seconds'
+DOMAINS_SCANNED = 'domain_scout_domains_scanned_total'
+CACHE_REQUESTS = 'domain_scout_cache_requests_total'
+STAGE_SKIPPED = 'domain_scout_stage_skipped_total'
+STAGE_TIME_SAVED = 'domain_scout_stage_time_saved_seconds_total'
+
+logger = logging.getLogger(__name__)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key, extra=None):
+    pairs = list(label_key) + (extra or [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store for counters, gauges, and latency histograms.
+
+    Metrics are identified by a name and a set of keyword labels, following
+    the Prometheus data model so the registry can be exported as-is.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Clears every metric and restarts the throughput clock.
+        """
+        with self._lock:
+            self.counters = defaultdict(float)
+            self.gauges = defaultdict(float)
+            self.histograms = {}
+            self.started_at = time.time()
+
+    def inc(self, name, amount=1, **labels):
+        """
+        Increments a counter.
+
+        :param name: Metric name.
+        :param amount: Value to add. Default is 1.
+        :param labels: Label values identifying the series.
+        """
+        with self._lock:
+            self.counters[(name, _label_key(labels))] += amount
+
+    def add_gauge(self, name, amount, **labels):
+        """
+        Adds a (possibly negative) amount to a gauge.
+        """
+        with self._lock:
+            self.gauges[(name, _label_key(labels))] += amount
+
+    def set_gauge(self, name, value, **labels):
+        """
+        Sets a gauge to an absolute value.
+        """
+        with self._lock:
+            self.gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        """
+        Records one observation in a histogram.
+
+        :param name: Metric name.
+        :param value: Observed value (seconds for latency histograms).
+        :param labels: Label values identifying the series.
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+                self.histograms[key] = hist
+            index = len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    index = i
+                    break
+            hist['counts'][index] += 1
+            hist['sum'] += value
+            hist['count'] += 1
+
+    def quantile(self, name, q, **labels):
+        """
+        Estimates a quantile from a histogram by interpolating within buckets.
+
+        :param name: Metric name.
+        :param q: Quantile between 0 and 1 (e.g., 0.95).
+        :param labels: Label values identifying the series.
+        :return: The estimated value, or None if nothing was observed.
+        """
+        with self._lock:
+            hist = self.histograms.get((name, _label_key(labels)))
+            if not hist or not hist['count']:
+                return None
+            counts = list(hist['counts'])
+            total = hist['count']
+
+        rank = q * total
+        cumulative = 0
+        lower = 0.0
+        for i, count in enumerate(counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+            if count and cumulative + count >= rank:
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = upper
+        return self.buckets[-1]
+
+    def mean(self, name, **labels):
+        """
+        :return: The mean of a histogram's observations, or None if nothing was observed.
+        """
+        with self._lock:
+            hist = self.histograms.get((name, _label_key(labels)))
+            if not hist or not hist['count']:
+                return None
+            return hist['sum'] / hist['count']
+
+    def export_state(self):
+        """
+        :return: A picklable copy of every series, for merging into another process's registry.
+        """
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'histograms': {key: {'counts': list(hist['counts']), 'sum': hist['sum'], 'count': hist['count']}
+                               for key, hist in self.histograms.items()},
+            }
+
+    def merge(self, state, previous=None):
+        """
+        Adds the series of another registry (see export_state) to this one.
+
+        Worker processes send their cumulative state from time to time; passing the
+        state merged last time from the same process adds only what changed since.
+
+        :param state: State exported by the other registry.
+        :param previous: State of the same registry merged earlier, if any.
+        """
+        previous = previous or {'counters': {}, 'gauges': {}, 'histograms': {}}
+        with self._lock:
+            for key, value in state['counters'].items():
+                self.counters[key] += value - previous['counters'].get(key, 0)
+            for key, value in state['gauges'].items():
+                self.gauges[key] += value - previous['gauges'].get(key, 0)
+            for key, hist in state['histograms'].items():
+                before = previous['histograms'].get(key)
+                target = self.histograms.get(key)
+                if target is None:
+                    target = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+                    self.histograms[key] = target
+                for index, count in enumerate(hist['counts']):
+                    target['counts'][index] += count - (before['counts'][index] if before else 0)
+                target['sum'] += hist['sum'] - (before['sum'] if before else 0.0)
+                target['count'] += hist['count'] - (before['count'] if before else 0)
+
+    def snapshot(self):
+        """
+        Builds a JSON-serialisable view of the registry with per-stage summaries.
+
+        :return: A dictionary with stage latency percentiles, error counts,
+                 in-flight gauges, stages skipped by rules, cache hit rates, and throughput.
+        """
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {key: dict(value) for key, value in self.histograms.items()}
+            started_at = self.started_at
+
+        elapsed = max(time.time() - started_at, 1e-9)
+        domains_scanned = sum(v for (name, _), v in counters.items() if name == DOMAINS_SCANNED)
+
+        stages = {}
+        for (name, labels), hist in histograms.items():
+            if name != STAGE_LATENCY:
+                continue
+            stage = dict(labels).get('stage')
+            stages[stage] = {
+                'count': hist['count'],
+                'mean_seconds': hist['sum'] / hist['count'] if hist['count'] else None,
+                'p50_seconds': self.quantile(STAGE_LATENCY, 0.50, stage=stage),
+                'p95_seconds': self.quantile(STAGE_LATENCY, 0.95, stage=stage),
+                'p99_seconds': self.quantile(STAGE_LATENCY, 0.99, stage=stage),
+                'errors': {},
+                'in_flight': 0,
+            }
+        for (name, labels), value in counters.items():
+            labels = dict(labels)
+            if name == STAGE_ERRORS:
+                errors = stages.setdefault(labels['stage'], {'errors': {}})['errors']
+                errors[labels['error_type']] = errors.get(labels['error_type'], 0) + value
+            elif name == STAGE_SKIPPED:
+                skipped = stages.setdefault(labels['stage'], {'errors': {}}).setdefault('skipped', {})
+                skipped[labels['rule']] = skipped.get(labels['rule'], 0) + value
+            elif name == STAGE_TIME_SAVED:
+                stages.setdefault(labels['stage'], {'errors': {}})['time_saved_seconds'] = value
+        for (name, labels), value in gauges.items():
+            labels = dict(labels)
+            if name == STAGE_IN_FLIGHT and labels.get('stage') in stages:
+                stages[labels['stage']]['in_flight'] = value
+
+        caches = {}
+        for (name, labels), value in counters.items():
+            if name != CACHE_REQUESTS:
+                continue
+            labels = dict(labels)
+            entry = caches.setdefault(labels['cache'], {'hits': 0, 'misses': 0})
+            entry['hits' if labels['result'] == 'hit' else 'misses'] += value
+        for entry in caches.values():
+            lookups = entry['hits'] + entry['misses']
+            entry['hit_rate'] = entry['hits'] / lookups if lookups else None
+
+        return {
+            'timestamp': time.time(),
+            'uptime_seconds': elapsed,
+            'domains_scanned': domains_scanned,
+            'domains_per_second': domains_scanned / elapsed,
+            'stages': stages,
+            'time_saved_seconds': sum(v for (name, _), v in counters.items() if name == STAGE_TIME_SAVED),
+            'caches': caches,
+        }
+
+    def to_prometheus(self):
+        """
+        Renders the registry in the Prometheus text exposition format.
+
+        :return: The exposition text.
+        """
+        with self._lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted(self.histograms.items())
+
+        lines = []
+        seen = set()
+        for metric_type, series in (('counter', counters), ('gauge', gauges)):
+            for (name, labels), value in series:
+                if name not in seen:
+                    lines.append(f"# TYPE {name} {metric_type}")
+                    seen.add(name)
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), hist in histograms:
+            if name not in seen:
+                lines.append(f"# TYPE {name} histogram")
+                seen.add(name)
+            cumulative = 0
+            for bound, count in zip(self.buckets, hist['counts']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {hist['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {hist['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {hist['count']}")
+
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry shared by every stage
+registry = MetricsRegistry()
+
+
+@contextmanager
+def track_stage(stage, metrics=None):
+    """
+    Context manager that times a pipeline stage and maintains its in-flight gauge.
+
+    Exceptions raised inside the block are counted by type and re-raised.
+
+    :param stage: Stage name (one of STAGES).
+    :param metrics: Registry to record into. Defaults to the process-wide registry.
+    """
+    metrics = metrics or registry
+    metrics.add_gauge(STAGE_IN_FLIGHT, 1, stage=stage)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        metrics.inc(STAGE_ERRORS, stage=stage, error_type=type(e).__name__)
+        raise
+    finally:
+        metrics.add_gauge(STAGE_IN_FLIGHT, -1, stage=stage)
+        metrics.observe(STAGE_LATENCY, time.perf_counter() - start, stage=stage)
+        metrics.inc(STAGE_CALLS, stage=stage)
+
+
+def record_error(stage, error_type, metrics=None):
+    """
+    Counts a stage failure that was handled without raising (e.g., a None result).
+
+    :param stage: Stage name.
+    :param error_type: Short error category (e.g., "unresolved", "no_response").
+    """
+    (metrics or registry).inc(STAGE_ERRORS, stage=stage, error_type=error_type)
+
+
+def record_stage_skipped(stage, rule, seconds_saved, metrics=None):
+    """
+    Counts a stage skipped by an early-exit rule and the time it was estimated to take.
+
+    :param stage: Stage name.
+    :param rule: Name of the rule that skipped it.
+    :param seconds_saved: Estimated stage duration.
+    """
+    metrics = metrics or registry
+    metrics.inc(STAGE_SKIPPED, stage=stage, rule=rule)
+    metrics.inc(STAGE_TIME_SAVED, seconds_saved, stage=stage)
+
+
+def record_cache(cache, hit, metrics=None):
+    """
+    Counts a cache lookup so hit rates show up in the exported metrics.
+
+    :param cache: Cache name.
+    :param hit: True for a hit, False for a miss.
+    """
+    (metrics or registry).inc(CACHE_REQUESTS, cache=cache, result='hit' if hit else 'miss')
+
+
+def record_domain_scanned(metrics=None):
+    """
+    Counts one fully processed domain for the throughput figure.
+    """
+    (metrics or registry).inc(DOMAINS_SCANNED)
+
+
+def write_snapshot(snapshot_file, metrics=None):
+    """
+    Writes the current metrics snapshot to a JSON file atomically.
+
+    :param snapshot_file: Path to the JSON snapshot file.
+    :return: The snapshot dictionary that was written.
+    """
+    snapshot = (metrics or registry).snapshot()
+    directory = os.path.dirname(snapshot_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_file = snapshot_file + '.tmp'
+    with open(tmp_file, 'w') as file:
+        json.dump(snapshot, file, indent=4)
+    os.replace(tmp_file, snapshot_file)
+    return snapshot
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    metrics = registry
+
+    def do_GET(self):
+        if self.path.split('?')[0] == '/metrics':
+            body = self.metrics.to_prometheus().encode()
+            content_type = 'text/plain; version=0.0.4'
+        elif self.path.split('?')[0] == '/metrics.json':
+            body = json.dumps(self.metrics.snapshot()).encode()
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes happen every few seconds; keep them out of the terminal
+        pass
+
+
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+
+def start_metrics_server(port=9464, host='127.0.0.1', metrics=None):
+    """
+    Starts a background HTTP server exposing /metrics (Prometheus text) and
+    /metrics.json. Calling it again for the same port reuses the running server.
+
+    :param port: TCP port to listen on. Default is 9464.
+    :param host: Interface to bind. Default is localhost only.
+    :return: The running server instance.
+    """
+    with _exporters_lock:
+        key = ('server', host, port)
+        if key in _exporters:
+            return _exporters[key]
+        handler = type('MetricsHandler', (_MetricsHandler,), {'metrics': metrics or registry})
+        server = ThreadingHTTPServer((host, port), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        _exporters[key] = server
+        return server
+
+
+def start_snapshot_writer(snapshot_file, interval=10, metrics=None):
+    """
+    Starts a daemon thread that rewrites the JSON snapshot file every `interval` seconds.
+    Calling it again for the same file reuses the running writer.
+
+    :param snapshot_file: Path to the JSON snapshot file.
+    :param interval: Seconds between snapshots. Default is 10.
+    :return: The event that stops the writer when set.
+    """
+    with _exporters_lock:
+        key = ('snapshot', snapshot_file)
+        if key in _exporters:
+            return _exporters[key]
+        stop_event = threading.Event()
+
+        def _run():
+            while not stop_event.wait(interval):
+                try:
+                    write_snapshot(snapshot_file, metrics)
+                except OSError as e:
+                    logger.warning("Failed to write metrics snapshot to '%s': %s", snapshot_file, e)
+
+        threading.Thread(target=_run, name='metrics-snapshot', daemon=True).start()
+        _exporters[key] = stop_event
+        return stop_event
+
+
+def start_exporters(config):
+    """
+    Starts the exporters enabled in the configuration.
+
+    Recognised keys: 'metrics_port' (None or 0 disables the HTTP endpoint),
+    'metrics_snapshot_file' (None disables snapshots) and 'metrics_snapshot_interval'.
+
+    :param config: A configuration dictionary.
+    """
+    port = config.get('metrics_port', 9464)
+    if port:
+        try:
+            start_metrics_server(port)
+        except OSError as e:
+            logger.warning("Metrics endpoint could not listen on port %s: %s", port, e)
+
+    snapshot_file = config.get('metrics_snapshot_file', os.path.join('logs', 'metrics_snapshot.json'))
+    if snapshot_file:
+        start_snapshot_writer(snapshot_file, config.get('metrics_snapshot_interval', 10))
+
+
+# Example usage within the module (optional)
+if __name__ == "__main__":
+    for delay in (0.01, 0.02, 0.2):
+        with track_stage('dns'):
+            time.sleep(delay)
+    record_cache('port_scan', hit=False)
+    record_cache('port_scan', hit=True)
+    record_domain_scanned()
+
+    print(registry.to_prometheus())
+    print(json.dumps(registry.snapshot(), indent=4))
@@ -1,13 +1,47 @@
 import csv
+import json
 import os
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from rollups import create_rollup_tables, update_rollups
+
+logger = logging.getLogger(__name__)
 
 # Define directory for output files
 OUTPUT_DIR = 'scan_output'
 
+# SQLite result store shared by every scanning process
+RESULTS_DB = os.path.join(OUTPUT_DIR, 'scan_results.db')
+
 # Ensure the output directory exists
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Callbacks (scan_record, run_id) called after a result is committed to the result store
+_write_listeners = []
+
+# Result-store connections shared by the threads of this process, by (pid, database path)
+_shared = {}
+_shared_lock = threading.Lock()
+
+def add_write_listener(listener):
+    """
+    Registers a callback run after each result this process writes to the result store
+    (used to invalidate caches of query results).
+
+    :param listener: A callable taking (scan_record, run_id).
+    """
+    _write_listeners.append(listener)
+
+def remove_write_listener(listener):
+    """
+    Unregisters a callback added with add_write_listener.
+    """
+    if listener in _write_listeners:
+        _write_listeners.remove(listener)
+
 def save_domain_info(domain_info):
     """
     Saves domain information to a CSV file.
@@ -72,6 +106,151 @@ def save_scan_results(scan_results):
             }
             writer.writerow(row)
 
+def connect_results_db(db_path=RESULTS_DB, check_same_thread=True):
+    """
+    Opens the SQLite result store, creating the schema on first use.
+
+    The database uses WAL journaling and a generous busy timeout so several
+    scanning processes can write to it at the same time.
+
+    :param db_path: Path to the SQLite database file.
+    :param check_same_thread: Passed to sqlite3.connect; False lets other threads use the connection.
+    :return: An open sqlite3 connection.
+    """
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=check_same_thread)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scan_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT,
+            domain_name TEXT NOT NULL,
+            scan_date TEXT,
+            scanned_at TEXT,
+            ip_address TEXT,
+            http_status_code TEXT,
+            http_status_desc TEXT,
+            record TEXT NOT NULL,
+            results TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_scan_results_run ON scan_results (run_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_scan_results_domain ON scan_results (domain_name)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_scan_results_date ON scan_results (scan_date)')
+    # Each domain's newest result and its number of scans, kept up to date by store_scan_result
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS latest_results (
+            domain_name TEXT PRIMARY KEY,
+            result_id INTEGER NOT NULL,
+            scan_count INTEGER NOT NULL
+        )
+    ''')
+    if (conn.execute('SELECT 1 FROM latest_results LIMIT 1').fetchone() is None
+            and conn.execute('SELECT 1 FROM scan_results LIMIT 1').fetchone() is not None):
+        # Store written before the table existed
+        with conn:
+            conn.execute('''INSERT OR REPLACE INTO latest_results (domain_name, result_id, scan_count)
+                            SELECT domain_name, MAX(id), COUNT(*) FROM scan_results GROUP BY domain_name''')
+    create_rollup_tables(conn)
+    return conn
+
+@contextmanager
+def shared_results_db(db_path=RESULTS_DB):
+    """
+    Lends out the process's connection to the result store, opening it on first use.
+
+    The connection stays open for the life of the process, so writing a result does
+    not reconnect or rerun the schema statements. Threads take turns using it.
+
+    :param db_path: Path to the SQLite database file.
+    :return: A context manager yielding the open sqlite3 connection. Do not close it.
+    """
+    key = (os.getpid(), db_path)  # A forked child opens its own connection
+    with _shared_lock:
+        conn = _shared.get(key)
+        if conn is None:
+            conn = connect_results_db(db_path, check_same_thread=False)
+            _shared[key] = conn
+        yield conn
+
+def store_scan_result(scan_record, results=None, run_id=None, db_path=RESULTS_DB):
+    """
+    Writes one domain's scan result to the shared SQLite result store, and
+    updates the domain's latest-result entry and the daily rollups (see rollups.py)
+    in the same transaction.
+
+    :param scan_record: The scan result dictionary (as passed to save_scan_results).
+    :param results: The aggregated result dictionary used for the report, if any.
+    :param run_id: Identifier of the scan run the result belongs to.
+    :param db_path: Path to the SQLite database file.
+    :return: The row id of the stored result.
+    """
+    http_status_code = scan_record.get('http_status_code')
+    with shared_results_db(db_path) as conn, conn:
+        cursor = conn.execute(
+            '''INSERT INTO scan_results (run_id, domain_name, scan_date, scanned_at, ip_address,
+                                         http_status_code, http_status_desc, record, results)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (
+                run_id,
+                scan_record.get('domain_name'),
+                scan_record.get('scan_date'),
+                datetime.now().isoformat(timespec='seconds'),
+                scan_record.get('ip_address') or (results or {}).get('IP Address'),
+                None if http_status_code is None else str(http_status_code),
+                scan_record.get('http_status_desc'),
+                json.dumps(scan_record, default=str),
+                json.dumps(results, default=str) if results is not None else None,
+            ),
+        )
+        conn.execute(
+            '''INSERT INTO latest_results (domain_name, result_id, scan_count) VALUES (?, ?, 1)
+               ON CONFLICT (domain_name) DO UPDATE SET result_id = excluded.result_id,
+                                                       scan_count = scan_count + 1''',
+            (scan_record.get('domain_name'), cursor.lastrowid),
+        )
+        update_rollups(conn, scan_record)
+
+    for listener in list(_write_listeners):
+        try:
+            listener(scan_record, run_id)
+        except Exception as e:
+            logger.error("Result store write listener failed: %s", e)
+    return cursor.lastrowid
+
+def update_run_results(run_id, entries, db_path=RESULTS_DB):
+    """
+    Rewrites the stored record and results of domains already written for a run
+    (e.g., once the run's records have been labelled by the classifier).
+
+    :param run_id: Identifier of the scan run.
+    :param entries: (results, scan_record) tuples. The newest row for each domain in the run is updated.
+    :param db_path: Path to the SQLite database file.
+    :return: The number of rows updated.
+    """
+    with shared_results_db(db_path) as conn, conn:
+        cursor = conn.executemany(
+            '''UPDATE scan_results SET record = ?, results = ?
+               WHERE id = (SELECT MAX(id) FROM scan_results WHERE run_id = ? AND domain_name = ?)''',
+            [(json.dumps(scan_record, default=str), json.dumps(results, default=str) if results is not None else None,
+              run_id, scan_record.get('domain_name')) for results, scan_record in entries],
+        )
+    return cursor.rowcount
+
+def load_run_results(run_id, db_path=RESULTS_DB):
+    """
+    Loads every result stored for a scan run, in the order they were written.
+
+    :param run_id: Identifier of the scan run.
+    :param db_path: Path to the SQLite database file.
+    :return: A list of (results, scan_record) tuples.
+    """
+    with shared_results_db(db_path) as conn:
+        rows = conn.execute(
+            'SELECT results, record FROM scan_results WHERE run_id = ? ORDER BY id', (run_id,)
+        ).fetchall()
+    return [(json.loads(results) if results else None, json.loads(record)) for results, record in rows]
+
 # Example usage
 if __name__ == "__main__":
     # Sample domain info
@@ -0,0 +1,221 @@
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+import requests
+from requests.exceptions import RequestException
+
+from HTTP_status import classify_request_error
+from metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Default cap on the page body read for fingerprinting, in kilobytes
+DEFAULT_BODY_MAX_KB = 64
+
+# Favicons larger than this are not hashed
+FAVICON_MAX_BYTES = 100 * 1024
+
+# Parsed fingerprints kept per process, keyed by the hash of the page body
+DEFAULT_CACHE_SIZE = 4096
+
+# Tags whose text is not part of the visible page
+_SKIPPED_TEXT_TAGS = {'script', 'style', 'noscript', 'template'}
+
+
+class _PageParser(HTMLParser):
+    """
+    Collects the title, form actions, favicon link, and visible text of a page.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ''
+        self.form_actions = []
+        self.favicon = None
+        self.text = []
+        self._in_title = False
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'title':
+            self._in_title = True
+        elif tag in _SKIPPED_TEXT_TAGS:
+            self._skip_depth += 1
+        elif tag == 'form':
+            self.form_actions.append(attrs.get('action') or '')
+        elif tag == 'link' and self.favicon is None:
+            rel = (attrs.get('rel') or '').lower().split()
+            if 'icon' in rel and attrs.get('href'):
+                self.favicon = attrs['href']
+
+    def handle_endtag(self, tag):
+        if tag == 'title':
+            self._in_title = False
+        elif tag in _SKIPPED_TEXT_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth:
+            self.text.append(data)
+
+
+def normalize_text(text):
+    """
+    Normalizes page text so copies of one kit hash alike: lower case, digits
+    removed (they are often per-victim tokens), and whitespace collapsed.
+
+    :param text: The visible text of a page.
+    :return: The normalized text.
+    """
+    text = re.sub(r'\d+', '', text.lower())
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def parse_page(body, encoding=None):
+    """
+    Parses an HTML body into the content-only part of its fingerprint.
+
+    :param body: The page body (bytes).
+    :param encoding: Charset from the Content-Type header, if known.
+    :return: A dictionary with 'title', 'form_actions' (as written in the page), 'favicon_href',
+             and 'text_hash' (SHA-256 of the normalized visible text).
+    """
+    try:
+        text = body.decode(encoding or 'utf-8', errors='replace')
+    except LookupError:
+        # Unknown charset name in the Content-Type header
+        text = body.decode('utf-8', errors='replace')
+
+    parser = _PageParser()
+    try:
+        parser.feed(text)
+        parser.close()
+    except Exception as e:
+        # A truncated or broken page still yields whatever was parsed before the error
+        logger.debug("HTML parsing stopped early: %s", e)
+
+    return {
+        'title': re.sub(r'\s+', ' ', parser.title).strip(),
+        'form_actions': parser.form_actions,
+        'favicon_href': parser.favicon,
+        'text_hash': hashlib.sha256(normalize_text(' '.join(parser.text)).encode('utf-8')).hexdigest(),
+    }
+
+
+class FingerprintCache:
+    """
+    LRU cache of parsed pages keyed by the SHA-256 of the body, so a kit served
+    unchanged by many domains is parsed once.
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_parse(self, content_hash, body, encoding=None):
+        """
+        :param content_hash: SHA-256 hex digest of `body`.
+        :param body: The page body (bytes).
+        :param encoding: Charset from the Content-Type header, if known.
+        :return: The parsed page dictionary (see parse_page).
+        """
+        with self._lock:
+            parsed = self.entries.get(content_hash)
+            if parsed is not None:
+                self.entries.move_to_end(content_hash)
+        record_cache('page_fingerprint', hit=parsed is not None)
+        if parsed is not None:
+            return parsed
+
+        parsed = parse_page(body, encoding)
+        with self._lock:
+            self.entries[content_hash] = parsed
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return parsed
+
+
+_cache = FingerprintCache()
+
+
+def hash_favicon(favicon_url, timeout=5, max_bytes=FAVICON_MAX_BYTES, limiter=None, limiter_key=None):
+    """
+    Downloads a favicon (at most `max_bytes`) and returns its MD5, the hash used
+    by most threat-intelligence favicon searches.
+
+    :param favicon_url: Absolute favicon URL.
+    :param timeout: Request timeout in seconds.
+    :param max_bytes: Largest favicon that is hashed.
+    :param limiter: Optional shared AdaptiveRateLimiter.
+    :param limiter_key: Destination key for the limiter, normally the resolved IP.
+    :return: The hex digest, or None if the favicon is missing or too large.
+    """
+    if limiter is not None:
+        limiter.acquire(limiter_key)
+    try:
+        with requests.get(favicon_url, timeout=timeout, stream=True, verify=False) as response:
+            if limiter is not None:
+                limiter.record(limiter_key, 'ok')
+            # Missing favicons are often answered with an HTML error or landing page
+            if response.status_code != 200 or 'html' in response.headers.get('Content-Type', '').lower():
+                return None
+            data = response.raw.read(max_bytes + 1, decode_content=True)
+    except RequestException as e:
+        if limiter is not None:
+            limiter.record(limiter_key, classify_request_error(e))
+        logger.debug("Failed to fetch favicon %s: %s", favicon_url, e)
+        return None
+    if not data or len(data) > max_bytes:
+        return None
+    return hashlib.md5(data).hexdigest()
+
+
+def fingerprint_page(body, page_url, encoding=None, fetch_favicon=True, truncated=False, timeout=5,
+                     limiter=None, limiter_key=None, cache=None):
+    """
+    Builds the fingerprint of a page from its (bounded) body.
+
+    :param body: The page body (bytes), at most the configured size.
+    :param page_url: The URL the body was served from; relative links are resolved against it.
+    :param encoding: Charset from the Content-Type header, if known.
+    :param fetch_favicon: Download and hash the favicon. Default is True.
+    :param truncated: Whether the body was cut off at the size limit.
+    :param timeout: Favicon request timeout in seconds.
+    :param limiter: Optional shared AdaptiveRateLimiter for the favicon request.
+    :param limiter_key: Destination key for the limiter, normally the resolved IP.
+    :param cache: FingerprintCache to use. Defaults to the process-wide cache.
+    :return: A dictionary with 'content_hash', 'title', 'form_actions' (absolute URLs),
+             'favicon_url', 'favicon_hash', 'text_hash', 'body_bytes', and 'truncated'.
+    """
+    content_hash = hashlib.sha256(body).hexdigest()
+    parsed = (cache or _cache).get_or_parse(content_hash, body, encoding)
+
+    favicon_url = urljoin(page_url, parsed['favicon_href'] or '/favicon.ico')
+    return {
+        'content_hash': content_hash,
+        'title': parsed['title'],
+        'form_actions': [urljoin(page_url, action) for action in parsed['form_actions']],
+        'favicon_url': favicon_url,
+        'favicon_hash': hash_favicon(favicon_url, timeout, limiter=limiter, limiter_key=limiter_key)
+        if fetch_favicon else None,
+        'text_hash': parsed['text_hash'],
+        'body_bytes': len(body),
+        'truncated': truncated,
+    }
+
+
+# Example usage within the module (optional)
+if __name__ == "__main__":
+    page = b"<html><head><title> Sign in </title><link rel='icon' href='/static/fav.png'></head>" \
+           b"<body><form action='/login.php'><input name='user'></form><p>Order 12345 ready</p></body></html>"
+    print(fingerprint_page(page, "http://example.com/account/", fetch_favicon=False))
+    print(fingerprint_page(page, "http://example.org/", fetch_favicon=False))
@@ -0,0 +1,419 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Model shipped with the scanner; any file in the same format can replace it
+DEFAULT_MODEL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'phishing_model.json')
+
+# Records scored per matrix multiplication
+DEFAULT_BATCH_SIZE = 8192
+
+# Longest domain name considered by the lexical features (longer names are cut)
+MAX_DOMAIN_LENGTH = 96
+
+# Features every model can use, in the column order of the feature matrix
+FEATURES = (
+    # Lexical features of the domain name
+    'domain_length', 'subdomain_depth', 'hyphens', 'digit_ratio', 'entropy', 'punycode',
+    'suspicious_tld', 'keyword_hits', 'brand_hits',
+    # HTTP status of the final response and the redirect chain
+    'no_response', 'status_2xx', 'status_3xx', 'status_4xx', 'status_5xx',
+    'redirect_hops', 'cross_domain_redirect', 'meta_refresh',
+    # Open-port fingerprint
+    'web_ports_open', 'other_ports_open',
+    # Page and certificate features, when they were collected
+    'has_page', 'has_title', 'title_keyword_hits', 'title_brand_hits', 'form_count', 'external_form',
+    'tls_self_signed', 'tls_invalid', 'tls_new_cert', 'cloaking',
+)
+
+# Words common in phishing domain names and page titles
+KEYWORDS = ('login', 'signin', 'sign-in', 'verify', 'secure', 'account', 'update', 'confirm', 'wallet',
+            'support', 'billing', 'unlock', 'recovery', 'auth', 'webscr', 'password')
+
+# Phrases in the titles of login pages
+TITLE_KEYWORDS = KEYWORDS + ('log in', 'sign in')
+
+# Brands most often impersonated
+BRANDS = ('paypal', 'apple', 'icloud', 'microsoft', 'office365', 'outlook', 'google', 'amazon', 'netflix',
+          'facebook', 'instagram', 'whatsapp', 'binance', 'coinbase', 'metamask', 'chase', 'wellsfargo',
+          'dhl', 'fedex', 'usps', 'ups')
+
+# Top-level domains over-represented in phishing feeds
+SUSPICIOUS_TLDS = ('top', 'xyz', 'cc', 'tk', 'ml', 'ga', 'cf', 'gq', 'buzz', 'icu', 'cyou', 'rest', 'sbs',
+                   'click', 'link', 'live', 'shop', 'online', 'site', 'website', 'fun', 'monster', 'quest')
+
+WEB_PORTS = {80, 443, 8080, 8443}
+
+# A certificate issued this recently (in days, relative to the scan date) counts as new
+NEW_CERT_DAYS = 30
+
+
+class ModelError(ValueError):
+    """
+    Raised when a model file is malformed or uses unknown features.
+    """
+
+
+def lexical_features(domains):
+    """
+    Computes the lexical features of many domain names at once.
+
+    The names are packed into a fixed-width byte matrix, so character counts and
+    Shannon entropy are computed with array operations instead of per-name loops.
+
+    :param domains: A list of domain names.
+    :return: A float32 array of shape (len(domains), 9), in the order of the first nine FEATURES.
+    """
+    count = len(domains)
+    names = np.array([(domain or '').lower()[:MAX_DOMAIN_LENGTH] for domain in domains], dtype='U')
+    chars = np.frombuffer(np.char.encode(names, 'ascii', 'replace').astype(f'S{MAX_DOMAIN_LENGTH}').tobytes(),
+                          dtype=np.uint8).reshape(count, MAX_DOMAIN_LENGTH)
+    lengths = (chars != 0).sum(axis=1)
+    dots = (chars == ord('.')).sum(axis=1)
+    digits = ((chars >= ord('0')) & (chars <= ord('9'))).sum(axis=1)
+
+    # Character histogram per name via one bincount over row-offset byte values; byte 0 is padding
+    histogram = np.bincount((np.arange(count)[:, None] * 256 + chars).ravel(), minlength=count * 256)
+    histogram = histogram.reshape(count, 256)[:, 1:].astype(np.float32)
+    safe_lengths = np.maximum(lengths, 1)[:, None].astype(np.float32)
+    probabilities = histogram / safe_lengths
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entropy = -np.where(probabilities > 0, probabilities * np.log2(probabilities), 0).sum(axis=1)
+
+    tlds = np.array([name.rsplit('.', 1)[-1] for name in names.tolist()], dtype='U')
+    keyword_hits = sum((np.char.find(names, keyword) >= 0).astype(np.float32) for keyword in KEYWORDS)
+    brand_hits = sum((np.char.find(names, brand) >= 0).astype(np.float32) for brand in BRANDS)
+
+    features = np.empty((count, 9), dtype=np.float32)
+    features[:, 0] = lengths
+    features[:, 1] = np.maximum(dots - 1, 0)
+    features[:, 2] = (chars == ord('-')).sum(axis=1)
+    features[:, 3] = digits / safe_lengths[:, 0]
+    features[:, 4] = entropy
+    features[:, 5] = np.char.find(names, 'xn--') >= 0
+    features[:, 6] = np.isin(tlds, SUSPICIOUS_TLDS)
+    features[:, 7] = keyword_hits
+    features[:, 8] = brand_hits
+    return features
+
+
+def _status_code(scan_record):
+    code = scan_record.get('http_status_code')
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        return None
+
+
+def _open_ports(port_status):
+    ports = set()
+    for port, state in (port_status or {}).items() if isinstance(port_status, dict) else ():
+        if state == 'open':
+            try:
+                ports.add(int(port))
+            except ValueError:
+                continue
+    return ports
+
+
+def _hits(text, words):
+    return sum(1 for word in words if word in text)
+
+
+def _cert_age_days(certificate, scan_date):
+    try:
+        issued = datetime.fromisoformat(certificate['not_before']).replace(tzinfo=None)
+        scanned = datetime.fromisoformat(scan_date) if scan_date else datetime.now()
+    except (KeyError, TypeError, ValueError):
+        return None
+    return (scanned - issued).days
+
+
+def _host(url):
+    # Much cheaper than urlparse, which dominates the per-record cost at these rates
+    if not url:
+        return None
+    netloc = url.split('://', 1)[-1].split('/', 1)[0].split('?', 1)[0]
+    return netloc.rsplit('@', 1)[-1].split(':', 1)[0].lower() or None
+
+
+def record_features(scan_record):
+    """
+    Computes the non-lexical features of one scan record.
+
+    :param scan_record: A scan record as produced by scanner.scan_domain (or loaded from the result store).
+    :return: A tuple of len(FEATURES) - 9 numbers, in the order of FEATURES.
+    """
+    code = _status_code(scan_record)
+    chain = scan_record.get('redirect_chain') or []
+    start_host = _host(chain[0]['url']) if chain else None
+    final_host = _host(chain[-1]['url'] if chain else scan_record.get('redirected_url'))
+    open_ports = _open_ports(scan_record.get('port_status'))
+    web_open = len(open_ports & WEB_PORTS)
+
+    page = scan_record.get('page_fingerprint') or {}
+    title = (page.get('title') or '').lower()
+    form_actions = page.get('form_actions') or []
+
+    certificate = scan_record.get('tls_certificate') or {}
+    age = _cert_age_days(certificate, scan_record.get('scan_date')) if certificate else None
+
+    return (
+        code is None,
+        code is not None and 200 <= code < 300,
+        code is not None and 300 <= code < 400,
+        code is not None and 400 <= code < 500,
+        code is not None and code >= 500,
+        max(len(chain) - 1, 0),
+        bool(start_host and final_host and start_host != final_host),
+        any(hop.get('redirect_type') in ('meta-refresh', 'refresh-header') for hop in chain),
+        web_open,
+        len(open_ports) - web_open,
+        bool(page),
+        bool(title),
+        _hits(title, TITLE_KEYWORDS) if title else 0,
+        _hits(title, BRANDS) if title else 0,
+        len(form_actions),
+        any(_host(action) not in (None, final_host) for action in form_actions),
+        bool(certificate.get('self_signed')),
+        bool(certificate) and not certificate.get('valid', True),
+        age is not None and age <= NEW_CERT_DAYS,
+        bool(scan_record.get('cloaking')),
+    )
+
+
+def extract_features(scan_records):
+    """
+    Builds the feature matrix for a batch of scan records.
+
+    :param scan_records: A list of scan records.
+    :return: A float32 array of shape (len(scan_records), len(FEATURES)).
+    """
+    matrix = np.zeros((len(scan_records), len(FEATURES)), dtype=np.float32)
+    if not scan_records:
+        return matrix
+    matrix[:, :9] = lexical_features([record.get('domain_name') for record in scan_records])
+    matrix[:, 9:] = np.array([record_features(record) for record in scan_records], dtype=np.float32)
+    return matrix
+
+
+class PhishingClassifier:
+    """
+    Multinomial logistic regression over FEATURES, loaded from a JSON model file.
+
+    A model file holds 'classes' (labels written to type_of_phishing), 'features'
+    (names from FEATURES, in any order and any subset), 'mean' and 'scale' (per-feature
+    standardization), 'weights' (one row per class), 'bias' (one per class), and
+    optionally 'min_confidence' (below it the label is 'Uncertain').
+    """
+
+    def __init__(self, model):
+        unknown = [name for name in model.get('features', []) if name not in FEATURES]
+        if unknown:
+            raise ModelError(f"Unknown feature(s) in model: {', '.join(unknown)}")
+        self.name = model.get('name', 'unnamed')
+        self.classes = list(model['classes'])
+        self.features = list(model['features'])
+        self.columns = np.array([FEATURES.index(name) for name in self.features], dtype=np.intp)
+        self.mean = np.asarray(model.get('mean', [0.0] * len(self.features)), dtype=np.float32)
+        self.scale = np.asarray(model.get('scale', [1.0] * len(self.features)), dtype=np.float32)
+        self.weights = np.asarray(model['weights'], dtype=np.float32)
+        self.bias = np.asarray(model['bias'], dtype=np.float32)
+        self.min_confidence = model.get('min_confidence', 0.0)
+        if self.weights.shape != (len(self.classes), len(self.features)) or self.bias.shape != (len(self.classes),):
+            raise ModelError(f"Model {self.name}: weights must be {len(self.classes)}x{len(self.features)} "
+                             f"and bias {len(self.classes)}")
+        # Fold the standardization into the weights so scoring is a single matrix product
+        self._weights = (self.weights / self.scale).T.copy()
+        self._bias = self.bias - (self.weights * (self.mean / self.scale)).sum(axis=1)
+
+    @classmethod
+    def load(cls, path=DEFAULT_MODEL_FILE):
+        """
+        :param path: Path to a JSON model file.
+        :return: A PhishingClassifier.
+        """
+        with open(path, 'r') as file:
+            try:
+                model = json.load(file)
+            except ValueError as e:
+                raise ModelError(f"Unreadable model file {path}: {e}") from e
+        return cls(model)
+
+    def predict_proba(self, features):
+        """
+        :param features: A matrix returned by extract_features.
+        :return: A float32 array of class probabilities, one row per record.
+        """
+        logits = features[:, self.columns] @ self._weights + self._bias
+        logits -= logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=1, keepdims=True)
+        return logits
+
+    def classify(self, scan_records, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Labels scan records in batches.
+
+        :param scan_records: A list of scan records.
+        :param batch_size: Records per batch. Default is 8192.
+        :return: A list of (label, probability) tuples, one per record.
+        """
+        labels = []
+        for start in range(0, len(scan_records), batch_size):
+            probabilities = self.predict_proba(extract_features(scan_records[start:start + batch_size]))
+            best = probabilities.argmax(axis=1)
+            confidence = probabilities[np.arange(len(best)), best]
+            for index, probability in zip(best.tolist(), confidence.tolist()):
+                label = self.classes[index] if probability >= self.min_confidence else 'Uncertain'
+                labels.append((label, probability))
+        return labels
+
+    def label(self, scan_records, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Sets 'type_of_phishing' and 'phishing_score' on each scan record in place.
+
+        :return: The number of records labelled.
+        """
+        for scan_record, (label, probability) in zip(scan_records, self.classify(scan_records, batch_size)):
+            scan_record['type_of_phishing'] = label
+            scan_record['phishing_score'] = round(probability, 3)
+        return len(scan_records)
+
+
+def train_model(scan_records, labels, name='trained', epochs=500, learning_rate=0.5, l2=1e-3):
+    """
+    Fits a model in the PhishingClassifier format by full-batch gradient descent.
+
+    :param scan_records: Labelled scan records.
+    :param labels: Their type_of_phishing labels.
+    :param name: Name stored in the model.
+    :param epochs: Gradient steps. Default is 500.
+    :param learning_rate: Step size. Default is 0.5.
+    :param l2: L2 penalty on the weights. Default is 0.001.
+    :return: The model as a JSON-serializable dictionary.
+    """
+    classes = sorted(set(labels))
+    if len(classes) < 2:
+        raise ModelError("Training needs at least two distinct labels")
+    features = extract_features(scan_records).astype(np.float64)
+    mean = features.mean(axis=0)
+    scale = features.std(axis=0)
+    scale[scale == 0] = 1.0
+    standardized = (features - mean) / scale
+    targets = np.zeros((len(labels), len(classes)))
+    targets[np.arange(len(labels)), [classes.index(label) for label in labels]] = 1.0
+
+    weights = np.zeros((len(classes), len(FEATURES)))
+    bias = np.zeros(len(classes))
+    for _ in range(epochs):
+        logits = standardized @ weights.T + bias
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        error = (probabilities - targets) / len(labels)
+        weights -= learning_rate * (error.T @ standardized + l2 * weights)
+        bias -= learning_rate * error.sum(axis=0)
+
+    return {
+        'name': name,
+        'trained_at': datetime.now().isoformat(timespec='seconds'),
+        'classes': classes,
+        'features': list(FEATURES),
+        'mean': mean.round(6).tolist(),
+        'scale': scale.round(6).tolist(),
+        'weights': weights.round(6).tolist(),
+        'bias': bias.round(6).tolist(),
+        'min_confidence': 0.5,
+    }
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_classifier(config=None):
+    """
+    Returns the process-wide classifier, loaded from config['classifier_model'] on first use.
+
+    :param config: A dictionary containing the configuration settings.
+    :return: A PhishingClassifier.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = PhishingClassifier.load((config or {}).get('classifier_model') or DEFAULT_MODEL_FILE)
+        return _shared
+
+
+def _load_store_records(db_path):
+    from output_storage import connect_results_db
+    conn = connect_results_db(db_path)
+    try:
+        return [(row_id, json.loads(record)) for row_id, record in
+                conn.execute('SELECT id, record FROM scan_results ORDER BY id')]
+    finally:
+        conn.close()
+
+
+def classify_store(classifier, db_path=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Labels every result in the SQLite result store and writes the labels back.
+
+    :param classifier: A PhishingClassifier.
+    :param db_path: Path to the result store. Defaults to the scanner's store.
+    :param batch_size: Records per batch.
+    :return: The number of results labelled.
+    """
+    from output_storage import connect_results_db, RESULTS_DB
+    db_path = db_path or RESULTS_DB
+    rows = _load_store_records(db_path)
+    records = [record for _, record in rows]
+    classifier.label(records, batch_size)
+    conn = connect_results_db(db_path)
+    try:
+        with conn:
+            conn.executemany('UPDATE scan_results SET record = ? WHERE id = ?',
+                             [(json.dumps(record, default=str), row_id) for (row_id, _), record in zip(rows, records)])
+    finally:
+        conn.close()
+    return len(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Label scan results with the batch phishing classifier.")
+    parser.add_argument('--model', default=DEFAULT_MODEL_FILE, help="JSON model file.")
+    parser.add_argument('--db', help="Result store. Default: scan_output/scan_results.db.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('classify', help="Label every stored result and write the labels back.")
+    train = commands.add_parser('train', help="Fit a model on stored results that already have a label.")
+    train.add_argument('--output', required=True, help="Where to write the trained model.")
+    train.add_argument('--epochs', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    if args.command == 'classify':
+        started = time.perf_counter()
+        count = classify_store(PhishingClassifier.load(args.model), args.db)
+        print(f"Labelled {count} result(s) in {time.perf_counter() - started:.2f}s")
+    elif args.command == 'train':
+        from output_storage import RESULTS_DB
+        records = [record for _, record in _load_store_records(args.db or RESULTS_DB)
+                   if record.get('type_of_phishing') not in (None, 'N/A', 'Uncertain')]
+        model = train_model(records, [record['type_of_phishing'] for record in records],
+                            name=os.path.splitext(os.path.basename(args.output))[0], epochs=args.epochs)
+        with open(args.output, 'w') as file:
+            json.dump(model, file, indent=2)
+        print(f"Trained on {len(records)} labelled result(s); model written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Cache file shared across runs (and across shard processes on one host)
+CACHE_FILE = os.path.join('scan_output', 'port_cache.json')
+
+# Default time to live of a cached port scan, in seconds
+DEFAULT_TTL = 6 * 60 * 60
+
+# New scans held in memory before the cache file is rewritten, and the longest
+# they are held; the file is also written when a run ends (see flush_port_cache)
+FLUSH_EVERY = 100
+FLUSH_INTERVAL = 60
+
+
+def cache_key(ip_address, ports):
+    """
+    :param ip_address: The scanned IP address.
+    :param ports: The scanned ports, in any order.
+    :return: The cache key for the (IP, port set) pair, e.g. "93.184.216.34|22,80,443".
+             Runs of consecutive ports are collapsed, so a full-range scan is "...|1-65535".
+    """
+    ranges = []
+    for port in sorted(set(ports)):
+        if ranges and port == ranges[-1][1] + 1:
+            ranges[-1][1] = port
+        else:
+            ranges.append([port, port])
+    return f"{ip_address}|{','.join(str(a) if a == b else f'{a}-{b}' for a, b in ranges)}"
+
+
+class PortScanCache:
+    """
+    TTL cache of port-scan results keyed by (IP address, port set).
+
+    Domains on the same IP share one scan: the first caller runs it while any
+    concurrent caller for the same key waits for that result. Entries are kept
+    in a JSON file so later runs reuse scans younger than the TTL. The file is
+    rewritten in batches, not after every scan, since each write merges and
+    rewrites the whole file.
+    """
+
+    def __init__(self, cache_file=CACHE_FILE, ttl=DEFAULT_TTL, flush_every=FLUSH_EVERY,
+                 flush_interval=FLUSH_INTERVAL):
+        """
+        :param cache_file: Path to the JSON cache file, or None to keep the cache in memory only.
+        :param ttl: Seconds a cached scan stays valid.
+        :param flush_every: New scans after which the file is rewritten. Default is 100.
+        :param flush_interval: Seconds after which pending scans are written anyway. Default is 60.
+        """
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.entries = {}
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._load()
+
+    def _load(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r') as file:
+                self.entries = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable port cache '%s': %s", self.cache_file, e)
+            self.entries = {}
+        self._expire(time.time())
+
+    def _expire(self, now):
+        for key in [key for key, entry in self.entries.items() if now - entry['scanned_at'] > self.ttl]:
+            del self.entries[key]
+
+    def get(self, ip_address, ports):
+        """
+        :return: A tuple (port_status, age_in_seconds) for a live entry, or None.
+        """
+        with self._lock:
+            entry = self.entries.get(cache_key(ip_address, ports))
+            if entry is None:
+                return None
+            age = time.time() - entry['scanned_at']
+            if age > self.ttl:
+                return None
+            # JSON keys are strings; restore the integer port numbers
+            return {int(port): status for port, status in entry['port_status']}, age
+
+    def put(self, ip_address, ports, port_status):
+        """
+        Stores a fresh scan, and writes the cache file once enough scans are pending.
+        """
+        with self._lock:
+            self.entries[cache_key(ip_address, ports)] = {
+                'scanned_at': time.time(),
+                'port_status': [[port, status] for port, status in port_status.items()],
+            }
+            self._pending += 1
+            if (self._pending >= self.flush_every
+                    or time.monotonic() - self._flushed_at >= self.flush_interval):
+                self._save()
+
+    def flush(self):
+        """
+        Writes scans that are not in the cache file yet.
+        """
+        with self._lock:
+            if self._pending:
+                self._save()
+
+    def _save(self):
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+        if not self.cache_file:
+            return
+        try:
+            # Merge entries written by other processes since we loaded the file
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, 'r') as file:
+                    for key, entry in json.load(file).items():
+                        current = self.entries.get(key)
+                        if current is None or entry['scanned_at'] > current['scanned_at']:
+                            self.entries[key] = entry
+            self._expire(time.time())
+            os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+            temp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(temp_file, 'w') as file:
+                json.dump(self.entries, file)
+            os.replace(temp_file, self.cache_file)
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to write port cache '%s': %s", self.cache_file, e)
+
+    def get_or_scan(self, ip_address, ports, scan):
+        """
+        Returns the cached scan for (IP, ports), running `scan(ip_address, ports)` at most once per key.
+
+        :param ip_address: The IP address to scan.
+        :param ports: A list of ports to scan.
+        :param scan: Callable performing the actual port scan.
+        :return: A tuple (port_status, age_in_seconds); the age is 0 for a scan just performed.
+        """
+        key = cache_key(ip_address, ports)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            cached = self.get(ip_address, ports)
+            if cached is not None:
+                record_cache('port_scan', hit=True)
+                logger.debug("Port scan cache hit for %s (%.0fs old)", key, cached[1],
+                             extra={'cache_key': key, 'age': cached[1]})
+                return cached
+
+            record_cache('port_scan', hit=False)
+            port_status = scan(ip_address, ports)
+            self.put(ip_address, ports, port_status)
+            return port_status, 0.0
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_port_cache(config=None):
+    """
+    Returns the process-wide port-scan cache, created from the configuration on first use.
+
+    :param config: A dictionary containing the configuration settings
+                   ('port_cache_file' and 'port_cache_ttl').
+    :return: The shared PortScanCache.
+    """
+    global _shared
+    config = config or {}
+    with _shared_lock:
+        if _shared is None:
+            _shared = PortScanCache(config.get('port_cache_file', CACHE_FILE),
+                                    ttl=config.get('port_cache_ttl', DEFAULT_TTL))
+        return _shared
+
+
+def flush_port_cache():
+    """
+    Writes the process-wide cache's pending scans to its file, if the cache is in use.
+    Called at the end of a run (and of each shard or worker).
+    """
+    with _shared_lock:
+        cache = _shared
+    if cache is not None:
+        cache.flush()
+
+
+# Example usage within the module (optional)
+if __name__ == "__main__":
+    cache = PortScanCache(cache_file=None, ttl=60)
+    fake_scan = lambda ip, ports: {port: 'open' if port == 80 else 'closed/filtered' for port in ports}
+    print(cache.get_or_scan('93.184.216.34', [443, 80], fake_scan))
+    print(cache.get_or_scan('93.184.216.34', [80, 443], fake_scan))
@@ -0,0 +1,215 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# Directory where profiles and traces are written
+PROFILE_DIR = 'profiles'
+
+# Supported profiler back-ends
+PROFILE_MODES = ('cprofile', 'sampling')
+
+
+class ScanProfiler:
+    """
+    Records a CPU profile and a Chrome-trace timeline for a single scan run.
+
+    The CPU profile is either a deterministic cProfile of the scanning thread or a
+    low-overhead sampling profile of every thread. The timeline holds one row per
+    domain with a span for each stage function, and can be opened in
+    chrome://tracing or https://ui.perfetto.dev.
+    """
+
+    def __init__(self, mode='cprofile', output_dir=PROFILE_DIR, sample_interval=0.005, run_id=None, label=None):
+        """
+        :param mode: 'cprofile' or 'sampling'. Default is 'cprofile'.
+        :param output_dir: Directory for the output files. Default is 'profiles'.
+        :param sample_interval: Seconds between stack samples in sampling mode.
+        :param run_id: Identifier used in the file names. Defaults to the time plus a random suffix.
+        :param label: Process label added to the file names (e.g., "shard2"), so every
+                      worker of a sharded or distributed run writes its own files.
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unsupported profile mode: {mode}")
+        self.mode = mode
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.run_id = run_id or datetime.now().strftime('%Y-%m-%d_%H-%M-%S_') + uuid.uuid4().hex[:6]
+        self.label = label
+        self.events = []
+        self._domain_rows = {}
+        self._lock = threading.Lock()
+        self._profile = None
+        self._samples = Counter()
+        self._sampler = None
+        self._stop_sampling = threading.Event()
+        self._origin = None
+
+    def start(self):
+        """
+        Starts profiling. Must be called from the thread that runs the scan.
+        """
+        self._origin = time.perf_counter()
+        if self.mode == 'cprofile':
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._stop_sampling.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, name='profile-sampler', daemon=True)
+            self._sampler.start()
+
+    def stop(self):
+        """
+        Stops profiling and writes the profile and trace files.
+
+        :return: A dictionary with the paths of the files that were written.
+        """
+        if self._profile is not None:
+            self._profile.disable()
+        if self._sampler is not None:
+            self._stop_sampling.set()
+            self._sampler.join()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"scan_{self.run_id}" + (f".{self.label}" if self.label else ''))
+        paths = {'trace': self.write_trace(base + '.trace.json')}
+
+        if self._profile is not None:
+            paths['profile'] = base + '.prof'
+            self._profile.dump_stats(paths['profile'])
+            paths['summary'] = base + '.txt'
+            with open(paths['summary'], 'w') as file:
+                file.write(self.summary())
+        else:
+            paths['profile'] = base + '.collapsed'
+            with open(paths['profile'], 'w') as file:
+                for stack, count in self._samples.most_common():
+                    file.write(f"{stack} {count}\n")
+
+        return paths
+
+    def summary(self, limit=30):
+        """
+        Returns the top functions by cumulative time as text (cProfile mode only).
+        """
+        if self._profile is None:
+            return ''
+        stream = io.StringIO()
+        pstats.Stats(self._profile, stream=stream).sort_stats('cumulative').print_stats(limit)
+        return stream.getvalue()
+
+    def _now_us(self):
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def _row_for(self, domain):
+        # Each domain gets its own row ("thread") in the trace viewer
+        with self._lock:
+            if domain not in self._domain_rows:
+                row = len(self._domain_rows) + 1
+                self._domain_rows[domain] = row
+                self.events.append({
+                    'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': row,
+                    'args': {'name': domain or 'run'},
+                })
+            return self._domain_rows[domain]
+
+    @contextmanager
+    def span(self, name, domain=None, **args):
+        """
+        Records a complete ("X") trace event around the wrapped block.
+
+        :param name: Span name, usually the stage function (e.g., "scan_ports").
+        :param domain: Domain the span belongs to. None puts it on the run row.
+        :param args: Extra values shown in the trace viewer.
+        """
+        row = self._row_for(domain)
+        start = self._now_us()
+        try:
+            yield
+        finally:
+            event = {
+                'name': name, 'cat': 'stage', 'ph': 'X', 'pid': os.getpid(), 'tid': row,
+                'ts': start, 'dur': self._now_us() - start,
+                'args': dict(args, domain=domain) if domain else args,
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def write_trace(self, trace_file):
+        """
+        Writes the recorded spans as a Chrome-trace JSON file.
+
+        :param trace_file: Path to the trace file.
+        :return: The path to the trace file.
+        """
+        with self._lock:
+            events = list(self.events)
+        with open(trace_file, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+        return trace_file
+
+    def _sample_loop(self):
+        own_thread = threading.get_ident()
+        while not self._stop_sampling.wait(self.sample_interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self._samples[';'.join(reversed(stack))] += 1
+
+
+def start_profiler(config, run_id=None, label=None):
+    """
+    Starts a profiler when config['profile'] is 'cprofile' or 'sampling'.
+
+    :param config: A dictionary containing the configuration settings.
+    :param run_id: Identifier of the scan run, shared by all of its processes.
+    :param label: Process label for the file names (see ScanProfiler).
+    :return: The running ScanProfiler, or None when profiling is off.
+    """
+    if not config.get('profile'):
+        return None
+    profiler = ScanProfiler(mode=config['profile'], output_dir=config.get('profile_dir', PROFILE_DIR),
+                            run_id=run_id, label=label)
+    profiler.start()
+    return profiler
+
+
+@contextmanager
+def profile_span(profiler, name, domain=None, **args):
+    """
+    Wraps a block in a profiler span, or does nothing when profiling is off.
+
+    :param profiler: A ScanProfiler, or None.
+    :param name: Span name.
+    :param domain: Domain the span belongs to.
+    """
+    if profiler is None:
+        yield
+    else:
+        with profiler.span(name, domain, **args):
+            yield
+
+
+# Example usage within the module (optional)
+if __name__ == "__main__":
+    profiler = ScanProfiler(mode='cprofile')
+    profiler.start()
+    for domain in ["example.com", "example.org"]:
+        with profiler.span('resolve_domain_to_ip', domain):
+            time.sleep(0.01)
+        with profiler.span('get_http_status_code', domain):
+            time.sleep(0.02)
+    print(profiler.stop())
@@ -0,0 +1,248 @@
+import ipaddress
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Outcomes reported by the stages. Timeouts and resets are treated as signs that
+# the path or the target is pushing back.
+CONGESTION_OUTCOMES = ('timeout', 'rst', 'reset')
+
+# Default limits in requests/packets per second: (initial rate, maximum rate)
+DEFAULT_LIMITS = {
+    'global': (100.0, 1000.0),
+    'subnet': (20.0, 200.0),
+    'ip': (5.0, 50.0),
+}
+
+# Default limits for the batch port-scan modes (top100, top1000, full), which send
+# thousands of SYNs per host and so get a packet budget of their own
+DEFAULT_SWEEP_LIMITS = {
+    'global': (2000.0, 10000.0),
+    'subnet': (1000.0, 5000.0),
+    'ip': (500.0, 2000.0),
+}
+
+RATE_GAUGE = 'domain_scout_rate_limit_per_second'
+
+
+class AdaptiveBucket:
+    """
+    Token bucket whose rate is tuned by AIMD (additive increase, multiplicative decrease).
+
+    Outcomes are counted over a window. At the end of each window the rate grows by
+    `increase` if the share of congestion outcomes stayed under `threshold`, and is
+    multiplied by `decrease` otherwise.
+    """
+
+    def __init__(self, rate, max_rate, min_rate=0.5, increase=1.0, decrease=0.5, window=20, threshold=0.3):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.window = window
+        self.threshold = threshold
+        # One second of burst allowance, but never less than one token
+        self.tokens = max(1.0, rate)
+        self.updated = time.monotonic()
+        self.outcomes = 0
+        self.congested = 0
+
+    def _refill(self, now):
+        capacity = max(1.0, self.rate)
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now, cost=1.0):
+        """
+        Takes `cost` tokens, going into debt if necessary.
+
+        :return: Seconds the caller must wait before the reservation is honoured.
+        """
+        self._refill(now)
+        self.tokens -= cost
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def record(self, congested):
+        """
+        Counts one outcome and adjusts the rate at the end of a window.
+
+        :return: True if the rate changed.
+        """
+        self.outcomes += 1
+        self.congested += 1 if congested else 0
+        if self.outcomes < self.window:
+            return False
+
+        ratio = self.congested / self.outcomes
+        self.outcomes = self.congested = 0
+        if ratio > self.threshold:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+        else:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+        return True
+
+
+def subnet_key(address):
+    """
+    :param address: An IPv4/IPv6 address or a host name.
+    :return: The /24 (IPv4) or /48 (IPv6) network as a string, or None for host names.
+    """
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return None
+    prefix = 24 if ip.version == 4 else 48
+    return str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+
+
+class AdaptiveRateLimiter:
+    """
+    Shared rate limiter with token buckets at global, per-/24, and per-destination scope.
+
+    Every packet or request calls `acquire(destination)` first, which blocks until
+    all three buckets have a token. Stages report what happened with `record()`,
+    and each bucket adapts its own rate with AIMD.
+    """
+
+    def __init__(self, limits=None, min_rate=0.5, increase=1.0, decrease=0.5, window=20, threshold=0.3,
+                 max_tracked=10000):
+        """
+        :param limits: {'global'|'subnet'|'ip': (initial_rate, max_rate)} overriding DEFAULT_LIMITS.
+        :param min_rate: Lowest rate any bucket is reduced to.
+        :param increase: Rate added after a healthy window.
+        :param decrease: Factor applied after a congested window.
+        :param window: Outcomes per adjustment window.
+        :param threshold: Share of congestion outcomes that counts as a congested window.
+        :param max_tracked: Maximum per-IP and per-subnet buckets kept (least recently used are dropped).
+        """
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update({scope: tuple(value) for scope, value in (limits or {}).items()})
+        self.bucket_options = {'min_rate': min_rate, 'increase': increase, 'decrease': decrease,
+                               'window': window, 'threshold': threshold}
+        self.max_tracked = max_tracked
+        self.global_bucket = self._new_bucket('global')
+        self.subnets = OrderedDict()
+        self.ips = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _new_bucket(self, scope):
+        rate, max_rate = self.limits[scope]
+        return AdaptiveBucket(rate, max_rate, **self.bucket_options)
+
+    def _bucket(self, table, key, scope):
+        bucket = table.get(key)
+        if bucket is None:
+            bucket = table[key] = self._new_bucket(scope)
+            if len(table) > self.max_tracked:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+        return bucket
+
+    def _buckets_for(self, destination):
+        buckets = [('global', 'global', self.global_bucket)]
+        if destination:
+            subnet = subnet_key(destination)
+            if subnet:
+                buckets.append(('subnet', subnet, self._bucket(self.subnets, subnet, 'subnet')))
+            buckets.append(('ip', destination, self._bucket(self.ips, destination, 'ip')))
+        return buckets
+
+    def acquire(self, destination=None, cost=1.0):
+        """
+        Blocks until a packet or request to `destination` is allowed.
+
+        :param destination: Destination IP address (or host name, which skips the /24 scope).
+        :param cost: Tokens to take. Default is 1.
+        :return: Seconds spent waiting.
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = max(bucket.reserve(now, cost) for _, _, bucket in self._buckets_for(destination))
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def record(self, destination, outcome):
+        """
+        Reports the outcome of a packet or request so the rates can adapt.
+
+        :param destination: Destination passed to acquire().
+        :param outcome: 'ok', 'timeout', 'rst', 'reset', or 'error'.
+        """
+        congested = outcome in CONGESTION_OUTCOMES
+        with self._lock:
+            for scope, key, bucket in self._buckets_for(destination):
+                if bucket.record(congested):
+                    registry.set_gauge(RATE_GAUGE, bucket.rate, scope=scope)
+                    logger.debug("Rate for %s %s is now %.2f/s", scope, key, bucket.rate,
+                                 extra={'scope': scope, 'key': key, 'rate': bucket.rate})
+
+    def rates(self, destination=None):
+        """
+        :return: The current rate of every bucket that applies to `destination`.
+        """
+        with self._lock:
+            return {scope: bucket.rate for scope, _, bucket in self._buckets_for(destination)}
+
+
+_shared = None
+_shared_sweep = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter(config=None):
+    """
+    Returns the process-wide limiter shared by the port scanner, HTTP prober, and
+    screenshot stage, creating it from config['rate_limit'] on first use.
+
+    :param config: A dictionary containing the configuration settings.
+    :return: The shared AdaptiveRateLimiter, or None if config['rate_limit'] is false.
+    """
+    global _shared
+    options = (config or {}).get('rate_limit', {})
+    if options is False:
+        return None
+    with _shared_lock:
+        if _shared is None:
+            _shared = AdaptiveRateLimiter(**(options or {}))
+        return _shared
+
+
+def get_sweep_limiter(config=None):
+    """
+    Returns the process-wide limiter for the batch port-scan modes, creating it from
+    config['port_sweep_rate_limit'] on first use. It has the same options as
+    'rate_limit', with DEFAULT_SWEEP_LIMITS as its limits, and its buckets are separate
+    from the shared limiter's, so a sweep neither waits behind nor stalls HTTP probes
+    and screenshots.
+
+    :param config: A dictionary containing the configuration settings.
+    :return: The sweep AdaptiveRateLimiter, or None if config['port_sweep_rate_limit'] is false.
+    """
+    global _shared_sweep
+    options = (config or {}).get('port_sweep_rate_limit', {})
+    if options is False:
+        return None
+    options = dict(options or {})
+    options['limits'] = dict(DEFAULT_SWEEP_LIMITS, **(options.get('limits') or {}))
+    with _shared_lock:
+        if _shared_sweep is None:
+            _shared_sweep = AdaptiveRateLimiter(**options)
+        return _shared_sweep
+
+
+# Example usage within the module (optional)
+if __name__ == "__main__":
+    limiter = AdaptiveRateLimiter(limits={'ip': (10.0, 50.0)}, window=10)
+    start = time.monotonic()
+    for i in range(40):
+        limiter.acquire('93.184.216.34')
+        limiter.record('93.184.216.34', 'timeout' if 10 <= i < 20 else 'ok')
+    print(f"40 requests in {time.monotonic() - start:.2f}s, rates now {limiter.rates('93.184.216.34')}")
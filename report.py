@@ -1,15 +1,141 @@
+import argparse
 import os
+import hashlib
+import json
+import logging
+import pickle
 from datetime import datetime
 from fpdf import FPDF
+from PIL import Image
 from collections import defaultdict
+from domain_similarity import DomainSimilarityIndex
+from metrics import record_cache
 
-def generate_report(results_list, report_type='text', report_file=None):
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join('output', '.report_cache')
+
+# Part of every fragment key; bump it when the way a domain is rendered changes
+FRAGMENT_VERSION = 3
+
+# Fields that differ between two scans of an unchanged domain (per-hop timings, the
+# age of a cached port scan, matches from the growing screenshot index). Their values
+# are left out of the fragment key; a cached fragment holds a ('live', field)
+# placeholder where each one goes, filled in from the record every time.
+LIVE_FIELDS = ("Port Scan Age (s)", "Redirect Chain", "Similar Screenshots")
+
+def _file_signature(path):
+    """
+    :return: The size and modification time of a file, or 'missing'.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return 'missing'
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def stable_fields(results):
+    """
+    :param results: The domain's result dictionary.
+    :return: A copy with the values of its LIVE_FIELDS set to None, in the same field order.
+    """
+    return {key: None if key in LIVE_FIELDS else value for key, value in results.items()}
+
+def fragment_key(results):
+    """
+    Hashes a domain's result record, without the values of its LIVE_FIELDS, together
+    with its screenshot file, so a cached fragment is used only while neither has changed.
+
+    :param results: The domain's result dictionary.
+    :return: A SHA-256 hex digest.
+    """
+    stable = stable_fields(results)
+    digest = hashlib.sha256(f"v{FRAGMENT_VERSION}\n".encode('utf-8'))
+    # Not sorted: the text report lists the fields in record order
+    digest.update(json.dumps(stable, default=str).encode('utf-8'))
+    screenshot = results.get("Screenshot")
+    if screenshot:
+        digest.update(f"\n{screenshot}\n{_file_signature(screenshot)}".encode('utf-8'))
+    return digest.hexdigest()
+
+class ReportFragmentCache:
+    """
+    On-disk cache of rendered per-domain report fragments, so a report over mostly
+    unchanged results only renders the domains that are new or changed.
+
+    Entries are pickled under `<cache_dir>/<kind>/<first two hex digits>/<key>`:
+    'text' holds the pieces of a domain's block of the text report, and 'pdf' the
+    FPDF calls that draw a domain (where they land on the page depends on the
+    domains before it).
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _path(self, kind, key):
+        return os.path.join(self.cache_dir, kind, key[:2], key + '.pkl')
+
+    def get(self, kind, key):
+        """
+        :return: The cached entry, or None.
+        """
+        try:
+            with open(self._path(kind, key), 'rb') as file:
+                entry = pickle.load(file)
+        except FileNotFoundError:
+            entry = None
+        except Exception as e:
+            logger.warning("Ignoring unreadable report cache entry %s/%s: %s", kind, key, e)
+            entry = None
+        record_cache(f'report_{kind}', hit=entry is not None)
+        return entry
+
+    def put(self, kind, key, entry):
+        """
+        Stores an entry, writing it atomically so concurrent reports never read half a file.
+        """
+        path = self._path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as file:
+            pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+    def fragment(self, kind, results, render):
+        """
+        :param kind: 'text' or 'pdf'.
+        :param results: The domain's result dictionary.
+        :param render: Function rendering the fragment from stable_fields(results) on a miss.
+        :return: The fragment.
+        """
+        key = fragment_key(results)
+        fragment = self.get(kind, key)
+        if fragment is None:
+            fragment = render(stable_fields(results))
+            self.put(kind, key, fragment)
+        return fragment
+
+def get_report_cache(config):
+    """
+    Builds the fragment cache from config['report_cache_dir'], or returns None
+    when config['report_cache'] is false.
+
+    :param config: A dictionary containing the configuration settings.
+    :return: A ReportFragmentCache, or None.
+    """
+    if not config.get('report_cache', True):
+        return None
+    return ReportFragmentCache(config.get('report_cache_dir') or DEFAULT_CACHE_DIR)
+
+def generate_report(results_list, report_type='text', report_file=None, similarity_index=None, cache=None):
     """
     Generates and saves a report of the scan results for multiple domains, including screenshots.
 
     :param results_list: A list of dictionaries, each containing the scan data for a domain.
     :param report_type: The format of the report ('text' or 'pdf'). Default is 'text'.
     :param report_file: The name of the report file. If not provided, it will be auto-generated.
+    :param similarity_index: DomainSimilarityIndex used for the lookalike clusters (see summarize_results).
+    :param cache: ReportFragmentCache of rendered domains. If not given, every domain is rendered.
     :return: The path to the generated report file.
     """
     # Ensure the output directory exists
@@ -36,17 +162,67 @@ def generate_report(results_list, report_type='text', report_file=None):
     report_file = os.path.join(output_dir, report_file + extension)
 
     # Generate the report with a summary
-    return generator(results_list, report_file)
+    return generator(results_list, report_file, similarity_index, cache)
+
+def text_field(key, value):
+    """
+    :return: The lines of the text report showing one field of a domain's record.
+    """
+    lines = [f"{key}:\n"]
+    if isinstance(value, dict):
+        for sub_key, sub_value in value.items():
+            lines.append(f"  {sub_key}: {sub_value}\n")
+    else:
+        lines.append(f"  {value}\n")
+    return ''.join(lines)
+
+def text_fragment(results):
+    """
+    Renders one domain's block of the text report.
+
+    :param results: The domain's result dictionary, as returned by stable_fields.
+    :return: A list of strings and ('live', field) placeholders; see fill_text_fragment.
+    """
+    domain_name = results.get("Domain Name", "Unknown Domain")
+    pieces = [f"Domain: {domain_name}\n" + "-" * 40 + "\n"]
+
+    for key, value in results.items():
+        if key in LIVE_FIELDS:
+            pieces.extend([('live', key), "\n"])
+        elif key != "Domain Name":
+            pieces.append(text_field(key, value) + "\n")
+        else:
+            pieces.append("\n")
+
+    # Include the screenshot path in the text report
+    screenshot = results.get("Screenshot", "No screenshot available")
+    pieces.append(f"Screenshot: {screenshot}\n")
+
+    pieces.append("=" * 40 + "\n\n")
+    return pieces
+
+def fill_text_fragment(pieces, results):
+    """
+    Joins a text fragment, rendering each placeholder from the domain's current record.
+
+    :param pieces: The fragment returned by text_fragment.
+    :param results: The domain's result dictionary.
+    :return: The block as a string.
+    """
+    return ''.join(piece if isinstance(piece, str) else text_field(piece[1], results.get(piece[1]))
+                   for piece in pieces)
 
-def generate_text_report(results_list, report_file):
+def generate_text_report(results_list, report_file, similarity_index=None, cache=None):
     """
     Generates a text report and saves it to a file for multiple domains, including screenshot paths.
 
     :param results_list: A list of dictionaries, each containing the scan data for a domain.
     :param report_file: The name of the report file.
+    :param similarity_index: DomainSimilarityIndex used for the lookalike clusters.
+    :param cache: ReportFragmentCache to take unchanged domains from.
     :return: The path to the generated report file.
     """
-    summary = summarize_results(results_list)
+    summary = summarize_results(results_list, similarity_index)
 
     with open(report_file, 'w') as file:
         file.write("Scan Report\n")
@@ -54,25 +230,11 @@ def generate_text_report(results_list, report_file):
         file.write(f"Generated on: {datetime.now()}\n\n")
         
         for results in results_list:  # Iterating over each domain's results
-            domain_name = results.get("Domain Name", "Unknown Domain")
-            file.write(f"Domain: {domain_name}\n")
-            file.write("-" * 40 + "\n")
-            
-            for key, value in results.items():
-                if key != "Domain Name":
-                    file.write(f"{key}:\n")
-                    if isinstance(value, dict):
-                        for sub_key, sub_value in value.items():
-                            file.write(f"  {sub_key}: {sub_value}\n")
-                    else:
-                        file.write(f"  {value}\n")
-                file.write("\n")
-
-            # Include the screenshot path in the text report
-            screenshot = results.get("Screenshot", "No screenshot available")
-            file.write(f"Screenshot: {screenshot}\n")
-            
-            file.write("=" * 40 + "\n\n")
+            if cache is not None:
+                pieces = cache.fragment('text', results, text_fragment)
+            else:
+                pieces = text_fragment(stable_fields(results))
+            file.write(fill_text_fragment(pieces, results))
         
         # Add the summary to the end of the report
         file.write("Summary\n")
@@ -80,15 +242,160 @@ def generate_text_report(results_list, report_file):
         for line in summary:
             file.write(line + "\n")
     
-    print(f"Text report saved as '{report_file}'.")
+    logger.info("Text report saved as '%s'.", report_file)
     return report_file
 
-def generate_pdf_report(results_list, report_file):
+def pdf_image_path(screenshot, cache_dir=os.path.join('output', '.report_images')):
+    """
+    Returns a path to the screenshot in a format FPDF can embed (PNG or JPEG).
+
+    WebP screenshots are converted to JPEG once and kept in `cache_dir` under the
+    same content-hash name, so later reports reuse the converted file.
+
+    :param screenshot: Path to the screenshot.
+    :param cache_dir: Directory for converted images.
+    :return: The path to embed.
+    """
+    name, extension = os.path.splitext(os.path.basename(screenshot))
+    if extension.lower() != '.webp':
+        return screenshot
+    converted = os.path.join(cache_dir, name + '.jpg')
+    if not os.path.exists(converted):
+        os.makedirs(cache_dir, exist_ok=True)
+        with Image.open(screenshot) as image:
+            image.convert('RGB').save(converted, format='JPEG', quality=85)
+    return converted
+
+def pdf_fragment(results):
+    """
+    Lays out one domain of the PDF report as a list of FPDF calls, replayed by draw_pdf_fragment.
+
+    :param results: The domain's result dictionary, as returned by stable_fields.
+    :return: A list of (method name, args, kwargs) tuples. A ('live', (field,), {})
+             call marks where draw_pdf_live_field draws a live field.
+    """
+    calls = []
+
+    def pdf(name, *args, **kwargs):
+        calls.append((name, args, kwargs))
+
+    domain_name = results.get("Domain Name", "Unknown Domain")
+    
+    # Domain Name Title
+    pdf('set_font', "Arial", 'B', size=14)
+    pdf('cell', 200, 10, txt=f"Domain: {domain_name}", ln=True, align="L")
+    pdf('ln', 5)
+    
+    # IP Address
+    pdf('set_font', "Arial", size=12)
+    ip_address = results.get("IP Address", "N/A")
+    pdf('cell', 200, 10, txt=f"IP Address: {ip_address}", ln=True, align="L")
+    pdf('ln', 5)
+    
+    # Port Status
+    pdf('set_font', "Arial", 'B', size=12)
+    pdf('live', "Port Scan Age (s)")  # The heading says whether the scan was cached
+    pdf('set_font', "Arial", size=11)
+    
+    for port, status in results.get("Port Status", {}).items():
+        if status.lower() == 'open':
+            pdf('set_text_color', 0, 128, 0)  # Green color for "open"
+        elif status.lower() == 'closed/filtered':
+            pdf('set_text_color', 255, 0, 0)  # Red color for "closed/filtered"
+        else:
+            pdf('set_text_color', 0, 0, 0)  # Default color for other statuses
+
+        pdf('cell', 200, 10, txt=f"  Port {port}: {status}", ln=True, align="L")
+    
+    pdf('set_text_color', 0, 0, 0)  # Reset to default color
+    pdf('ln', 5)
+    
+    # HTTP Status
+    http_status = results.get("HTTP Status", "N/A")
+    pdf('set_font', "Arial", 'B', size=12)
+
+    # Determine color based on HTTP status
+    if "200" in http_status:
+        pdf('set_text_color', 0, 128, 0)  # Green for 200 OK
+    elif "404" in http_status:
+        pdf('set_text_color', 255, 0, 0)  # Red for 404 Not Found
+    elif http_status == "N/A":
+        pdf('set_text_color', 128, 128, 128)  # Gray for N/A
+    else:
+        pdf('set_text_color', 0, 0, 0)  # Default color for other statuses
+
+    pdf('cell', 200, 10, txt=f"HTTP Status: {http_status}", ln=True, align="L")
+    pdf('set_text_color', 0, 0, 0)  # Reset to default color
+
+    # Redirect chain, one line per hop
+    pdf('live', "Redirect Chain")
+    pdf('ln', 10)
+
+    # Embed Screenshot into PDF if it exists
+    screenshot = results.get("Screenshot")
+    if screenshot and os.path.exists(screenshot):
+        pdf('set_font', "Arial", 'B', size=12)
+        pdf('cell', 200, 10, txt="Screenshot:", ln=True, align="L")
+        pdf('ln', 5)
+
+        # Insert the screenshot image into the PDF (see draw_pdf_fragment)
+        pdf('image', screenshot, x=10, w=190)  # Adjust the size as needed
+        pdf('ln', 10)
+    else:
+        pdf('cell', 200, 10, txt="No screenshot available", ln=True, align="L")
+        pdf('ln', 10)
+
+    # Separator between domains
+    pdf('cell', 200, 0, '', 'T', ln=True, align="C")  # Draw a horizontal line
+    pdf('ln', 10)
+    return calls
+
+def draw_pdf_live_field(pdf, key, value):
+    """
+    Draws one of a domain's LIVE_FIELDS where pdf_fragment left its placeholder.
+
+    :param pdf: The FPDF document.
+    :param key: The field name.
+    :param value: The field's value in the domain's current record.
+    """
+    if key == "Port Scan Age (s)":
+        port_heading = f"Port Status (cached, {value}s old):" if value else "Port Status:"
+        pdf.cell(200, 10, txt=port_heading, ln=True, align="L")
+    elif key == "Redirect Chain" and value:
+        pdf.set_font("Arial", 'B', size=12)
+        pdf.cell(200, 10, txt="Redirect Chain:", ln=True, align="L")
+        pdf.set_font("Arial", size=9)
+        for hop, line in value.items():
+            pdf.multi_cell(0, 6, txt=f"  {hop}: {line}", align="L")
+
+def draw_pdf_fragment(pdf, calls, results):
+    """
+    Replays a domain laid out by pdf_fragment onto the report.
+
+    Screenshots go through the public FPDF.image(), with WebP files converted once
+    (see pdf_image_path). Content-addressed screenshots shared by several domains
+    have the same path, and FPDF embeds each path only once.
+
+    :param pdf: The FPDF document.
+    :param calls: The fragment's (method name, args, kwargs) tuples.
+    :param results: The domain's result dictionary, for the live fields.
+    """
+    for name, args, kwargs in calls:
+        if name == 'live':
+            draw_pdf_live_field(pdf, args[0], results.get(args[0]))
+        elif name == 'image':
+            pdf.image(pdf_image_path(args[0]), *args[1:], **kwargs)
+        else:
+            getattr(pdf, name)(*args, **kwargs)
+
+def generate_pdf_report(results_list, report_file, similarity_index=None, cache=None):
     """
     Generates a PDF report and saves it to a file for multiple domains, embedding screenshots.
 
     :param results_list: A list of dictionaries, each containing the scan data for a domain.
     :param report_file: The name of the report file.
+    :param similarity_index: DomainSimilarityIndex used for the lookalike clusters.
+    :param cache: ReportFragmentCache to take unchanged domains from.
     :return: The path to the generated report file.
     """
     pdf = FPDF()
@@ -105,74 +412,14 @@ def generate_pdf_report(results_list, report_file):
     pdf.ln(20)
     
     for results in results_list:
-        domain_name = results.get("Domain Name", "Unknown Domain")
-        
-        # Domain Name Title
-        pdf.set_font("Arial", 'B', size=14)
-        pdf.cell(200, 10, txt=f"Domain: {domain_name}", ln=True, align="L")
-        pdf.ln(5)
-        
-        # IP Address
-        pdf.set_font("Arial", size=12)
-        ip_address = results.get("IP Address", "N/A")
-        pdf.cell(200, 10, txt=f"IP Address: {ip_address}", ln=True, align="L")
-        pdf.ln(5)
-        
-        # Port Status
-        pdf.set_font("Arial", 'B', size=12)
-        pdf.cell(200, 10, txt="Port Status:", ln=True, align="L")
-        pdf.set_font("Arial", size=11)
-        
-        for port, status in results.get("Port Status", {}).items():
-            if status.lower() == 'open':
-                pdf.set_text_color(0, 128, 0)  # Green color for "open"
-            elif status.lower() == 'closed/filtered':
-                pdf.set_text_color(255, 0, 0)  # Red color for "closed/filtered"
-            else:
-                pdf.set_text_color(0, 0, 0)  # Default color for other statuses
-
-            pdf.cell(200, 10, txt=f"  Port {port}: {status}", ln=True, align="L")
-        
-        pdf.set_text_color(0, 0, 0)  # Reset to default color
-        pdf.ln(5)
-        
-        # HTTP Status
-        http_status = results.get("HTTP Status", "N/A")
-        pdf.set_font("Arial", 'B', size=12)
-
-        # Determine color based on HTTP status
-        if "200" in http_status:
-            pdf.set_text_color(0, 128, 0)  # Green for 200 OK
-        elif "404" in http_status:
-            pdf.set_text_color(255, 0, 0)  # Red for 404 Not Found
-        elif http_status == "N/A":
-            pdf.set_text_color(128, 128, 128)  # Gray for N/A
+        if cache is not None:
+            calls = cache.fragment('pdf', results, pdf_fragment)
         else:
-            pdf.set_text_color(0, 0, 0)  # Default color for other statuses
-
-        pdf.cell(200, 10, txt=f"HTTP Status: {http_status}", ln=True, align="L")
-        pdf.ln(10)
-
-        # Embed Screenshot into PDF if it exists
-        screenshot = results.get("Screenshot")
-        if screenshot and os.path.exists(screenshot):
-            pdf.set_font("Arial", 'B', size=12)
-            pdf.cell(200, 10, txt="Screenshot:", ln=True, align="L")
-            pdf.ln(5)
-
-            # Insert the screenshot image into the PDF
-            pdf.image(screenshot, x=10, w=190)  # Adjust the size as needed
-            pdf.ln(10)
-        else:
-            pdf.cell(200, 10, txt="No screenshot available", ln=True, align="L")
-            pdf.ln(10)
-
-        # Separator between domains
-        pdf.cell(200, 0, '', 'T', ln=True, align="C")  # Draw a horizontal line
-        pdf.ln(10)
+            calls = pdf_fragment(stable_fields(results))
+        draw_pdf_fragment(pdf, calls, results)
 
     # Add the summary to the end of the report
-    summary = summarize_results(results_list)
+    summary = summarize_results(results_list, similarity_index)
     pdf.add_page()
     pdf.set_font("Arial", 'B', size=16)
     pdf.cell(200, 10, txt="Summary", ln=True, align="L")
@@ -182,15 +429,17 @@ def generate_pdf_report(results_list, report_file):
         pdf.cell(200, 10, txt=line, ln=True, align="L")
     
     pdf.output(report_file)
-    print(f"PDF report saved as '{report_file}'.")
+    logger.info("PDF report saved as '%s'.", report_file)
     return report_file
 
-def summarize_results(results_list):
+def summarize_results(results_list, similarity_index=None):
     """
     Summarizes the scan results, categorizing by HTTP status, listing domains, and separating unique and repeated IPs.
     Includes closed or unresponsive domains.
 
     :param results_list: A list of dictionaries, each containing the scan data for a domain.
+    :param similarity_index: DomainSimilarityIndex of earlier scans, used to group lookalike domains and
+                             list earlier lookalikes. If not given, the report's own domains are grouped.
     :return: A list of summary lines.
     """
     http_statuses = defaultdict(list)
@@ -242,37 +491,66 @@ def summarize_results(results_list):
     for ip, domains in repeated_ips.items():
         summary.append(f"  - {ip} ({', '.join(domains)})")
 
+    # Domains served the same certificate (same SAN list, or same CN when there are no SANs)
+    # are likely run by one operator; the key is the san_group stored with each result
+    certificate_groups = defaultdict(list)
+    for result in results_list:
+        san_group = result.get("TLS Certificate", {}).get("SAN Group")
+        if san_group and san_group != "(none)":
+            certificate_groups[san_group].append(result.get("Domain Name", "Unknown Domain"))
+    shared_certificates = {group: domains for group, domains in certificate_groups.items() if len(domains) > 1}
+    if shared_certificates:
+        summary.append("=" * 40)
+        summary.append(f"Shared Certificates ({len(shared_certificates)}):")
+        for group, domains in shared_certificates.items():
+            summary.append(f"  - {group} ({', '.join(domains)})")
+
+    # Typosquat families: registrable domains whose names are a couple of edits apart
+    domain_names = [result.get("Domain Name") for result in results_list if result.get("Domain Name")]
+    if similarity_index is None:
+        similarity_index = DomainSimilarityIndex(None)
+        similarity_index.add_many(domain_names)
+    clusters = similarity_index.lookalike_clusters(domain_names)
+    if clusters:
+        summary.append("=" * 40)
+        summary.append(f"Lookalike Clusters ({len(clusters)}):")
+        for members, earlier in clusters:
+            line = f"  - {', '.join(members)}"
+            if earlier:
+                line += f" (seen before: {', '.join(earlier)})"
+            summary.append(line)
+
     return summary
 
-# Example usage within the module (optional)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regenerate the report of a scan run from the result store.")
+    parser.add_argument('run_id', help="The run to report on, as stored in the run_id column.")
+    parser.add_argument('--type', choices=('text', 'pdf'), help="Report format. Default: the config's report_type.")
+    parser.add_argument('--config', default='config.json', help="Configuration file. Default: %(default)s")
+    parser.add_argument('--db', help="Result store. Default: scan_output/scan_results.db.")
+    parser.add_argument('--output', help="Report file name in output/, without extension. Default: timestamped.")
+    args = parser.parse_args(argv)
+
+    from config import load_config
+    from domain_similarity import get_similarity_index
+    from output_storage import load_run_results, RESULTS_DB
+
+    config = load_config(args.config)
+    # A domain retried or rescanned within the run keeps its latest result
+    latest = {}
+    for results, scan_record in load_run_results(args.run_id, args.db or RESULTS_DB):
+        latest[scan_record.get('domain_name')] = results
+    results_list = [results for results in latest.values() if results is not None]
+    if not results_list:
+        print(f"No results stored for run '{args.run_id}'.")
+        return 1
+
+    report_type = args.type or ('pdf' if config.get('report_type') == 'pdf' else 'text')
+    similarity_index = get_similarity_index(config) if config.get('similarity_index', True) else None
+    report_file = generate_report(results_list, report_type=report_type, report_file=args.output,
+                                  similarity_index=similarity_index, cache=get_report_cache(config))
+    print(f"Report of {len(results_list)} domain(s) saved as '{report_file}'.")
+    return 0
+
 if __name__ == "__main__":
-    # Example results
-    results_list = [
-        {
-            "Domain Name": "example.com",
-            "IP Address": "93.184.216.34",
-            "Port Status": {"80": "open", "443": "closed"},
-            "HTTP Status": "200 OK",
-            "Screenshot": "screenshots/example_com.png"
-        },
-        {
-            "Domain Name": "example.org",
-            "IP Address": "93.184.216.35",
-            "Port Status": {"80": "closed", "443": "open"},
-            "HTTP Status": "301 Moved Permanently",
-            "Screenshot": "screenshots/example_org.png"
-        },
-        {
-            "Domain Name": "example.net",
-            "IP Address": "93.184.216.34",  # Same IP as example.com
-            "Port Status": {"80": "open", "443": "open"},
-            "HTTP Status": "404 Not Found",
-            "Screenshot": "screenshots/example_net.png"
-        }
-    ]
-    
-    # Generate text report
-    generate_report(results_list, report_type='text')
-    
-    # Generate PDF report
-    generate_report(results_list, report_type='pdf')
+    raise SystemExit(main())
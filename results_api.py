@@ -0,0 +1,507 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+from output_storage import RESULTS_DB, connect_results_db, add_write_listener, remove_write_listener
+from rollups import rollup_totals, rollup_series, DIMENSIONS
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the API server
+DEFAULT_PORT = 8780
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Cached response bodies kept in memory
+DEFAULT_CACHE_SIZE = 512
+
+# Status messages kept per scan job
+JOB_LOG_LINES = 50
+
+# Origin of the React dashboard in development (npm start)
+DEFAULT_CORS_ORIGIN = 'http://localhost:3000'
+
+_COLUMNS = ('id', 'run_id', 'domain_name', 'scan_date', 'scanned_at', 'ip_address', 'http_status_code',
+            'http_status_desc', 'record', 'results')
+
+
+class ApiError(Exception):
+    """
+    An error answered to the client with an HTTP status code.
+    """
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+def encode_cursor(value):
+    """
+    :return: An opaque pagination cursor for a position value.
+    """
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    :return: The position value of a cursor made by encode_cursor.
+    """
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise ApiError(400, 'invalid cursor')
+
+
+class ResponseCache:
+    """
+    LRU cache of JSON response bodies, tagged with the result-store version they
+    were built from. An entry is only served while the version is unchanged.
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self, *args):
+        """
+        Drops every entry. Registered as a result-store write listener.
+        """
+        with self._lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def get(self, key, version):
+        """
+        :return: A tuple (body, etag) cached for the key at this version, or None.
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != (self.generation, version):
+                return None
+            self.entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def put(self, key, version, body, etag):
+        with self._lock:
+            self.entries[key] = ((self.generation, version), body, etag)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class ResultsStore:
+    """
+    Read-only queries over the SQLite result store, on one shared connection.
+    """
+
+    def __init__(self, db_path=RESULTS_DB):
+        self.db_path = db_path
+        # Creates the schema if this is a fresh store
+        connect_results_db(db_path).close()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._conn.close()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def version(self):
+        """
+        :return: SQLite's data version for this connection. It changes whenever any other
+                 connection commits to the store: new results from any process (shards,
+                 distributed workers), records rewritten in place (phishing_classifier
+                 classify), and rollup backfills.
+        """
+        return self._query('PRAGMA data_version')[0][0]
+
+    @staticmethod
+    def _filters(params, alias=''):
+        clauses, values = [], []
+        for name, column in (('domain', 'domain_name'), ('ip', 'ip_address'), ('run_id', 'run_id')):
+            if params.get(name):
+                clauses.append(f'{alias}{column} = ?')
+                values.append(params[name])
+        if params.get('status'):
+            statuses = params['status'].split(',')
+            clauses.append(f"{alias}http_status_code IN ({', '.join('?' * len(statuses))})")
+            values.extend(statuses)
+        if params.get('date_from'):
+            clauses.append(f'{alias}scan_date >= ?')
+            values.append(params['date_from'])
+        if params.get('date_to'):
+            clauses.append(f'{alias}scan_date <= ?')
+            values.append(params['date_to'])
+        return clauses, values
+
+    @staticmethod
+    def _item(row, include_results=False):
+        item = dict(zip(_COLUMNS, row))
+        item['record'] = json.loads(item['record'])
+        results = item.pop('results')
+        if include_results:
+            item['results'] = json.loads(results) if results else None
+        return item
+
+    def scans(self, params, limit):
+        """
+        Lists stored results, newest first.
+
+        :param params: Filters: 'domain', 'ip', 'run_id', 'status' (comma-separated codes,
+                       'N/A' for no response), 'date_from', 'date_to', and 'cursor'.
+        :param limit: Page size.
+        :return: A dictionary with 'items' and 'next_cursor' (None on the last page).
+        """
+        clauses, values = self._filters(params)
+        if params.get('cursor'):
+            clauses.append('id < ?')
+            values.append(int(decode_cursor(params['cursor'])))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._query(f"SELECT {', '.join(_COLUMNS)} FROM scan_results{where} ORDER BY id DESC LIMIT ?",
+                           values + [limit + 1])
+        items = [self._item(row, params.get('include') == 'results') for row in rows[:limit]]
+        return {'items': items, 'next_cursor': encode_cursor(items[-1]['id']) if len(rows) > limit else None}
+
+    def domains(self, params, limit):
+        """
+        Lists each domain's latest result, in domain order. Filters apply to the latest result.
+
+        :return: A dictionary with 'items' (each with 'scan_count') and 'next_cursor'.
+        """
+        clauses, values = self._filters(params, alias='s.')
+        if params.get('cursor'):
+            clauses.append('latest.domain_name > ?')
+            values.append(decode_cursor(params['cursor']))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        # latest_results is maintained on write, so no pass over the whole history is needed
+        rows = self._query(
+            f'''SELECT {', '.join('s.' + column for column in _COLUMNS)}, latest.scan_count
+                FROM latest_results latest
+                JOIN scan_results s ON s.id = latest.result_id{where}
+                ORDER BY latest.domain_name LIMIT ?''',
+            values + [limit + 1])
+        items = []
+        for row in rows[:limit]:
+            item = self._item(row[:-1], params.get('include') == 'results')
+            item['scan_count'] = row[-1]
+            items.append(item)
+        return {'items': items,
+                'next_cursor': encode_cursor(items[-1]['domain_name']) if len(rows) > limit else None}
+
+
+class ScanJobs:
+    """
+    Runs scans submitted through the API, one at a time, in a background thread.
+    """
+
+    def __init__(self, config, runner=None):
+        """
+        :param config: A dictionary containing the configuration settings.
+        :param runner: Function with the signature of scanner.run_scan. Defaults to it.
+        """
+        self.config = config
+        self.runner = runner
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, domains, report_type=None, headless=True):
+        """
+        Starts a scan of the given domains.
+
+        :return: The job dictionary (see get).
+        :raises ApiError: 409 if a scan is already running.
+        """
+        from scanner import new_run_id, run_scan
+
+        config = dict(self.config)
+        if report_type:
+            config['report_type'] = report_type
+        job_id = new_run_id()
+        job = {'job_id': job_id, 'state': 'running', 'total': len(domains), 'done': 0, 'current': None,
+               'started_at': time.time(), 'finished_at': None, 'error': None, 'log': deque(maxlen=JOB_LOG_LINES)}
+        with self._lock:
+            if any(existing['state'] == 'running' for existing in self.jobs.values()):
+                raise ApiError(409, 'a scan is already running')
+            self.jobs[job_id] = job
+
+        def status(message):
+            job['log'].append(message)
+
+        def progress(done, total, domain):
+            job['done'] = done
+            job['current'] = domain
+
+        def run():
+            try:
+                (self.runner or run_scan)(domains, config, headless, status=status, run_id=job_id, progress=progress)
+                job['state'] = 'finished'
+            except Exception as e:
+                logger.error("API scan job %s failed: %s", job_id, e, extra={'job_id': job_id})
+                job['state'] = 'failed'
+                job['error'] = str(e)
+            job['finished_at'] = time.time()
+
+        threading.Thread(target=run, name=f'api-scan-{job_id}', daemon=True).start()
+        logger.info("API scan job %s started with %d domain(s)", job_id, len(domains), extra={'job_id': job_id})
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """
+        :return: The job's 'job_id', 'state' ('running', 'finished', or 'failed'), 'total', 'done',
+                 'current' domain, timestamps, 'error', and recent status messages, or None.
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        return dict(job, log=list(job['log']))
+
+    def list(self):
+        return [self.get(job_id) for job_id in reversed(self.jobs)]
+
+
+def _make_handler(store, cache, jobs, token=None, cors_origin=DEFAULT_CORS_ORIGIN):
+    class ResultsApiHandler(BaseHTTPRequestHandler):
+        def _send_cors_headers(self):
+            if cors_origin:
+                self.send_header('Access-Control-Allow-Origin', cors_origin)
+                self.send_header('Vary', 'Origin')
+
+        def _send(self, code, body=b'', etag=None):
+            self.send_response(code)
+            if cors_origin:
+                self._send_cors_headers()
+                self.send_header('Access-Control-Expose-Headers', 'ETag')
+            if etag:
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', 'no-cache')
+            if code != 304:
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if code != 304:
+                self.wfile.write(body)
+
+        def _reply(self, code, payload):
+            self._send(code, json.dumps(payload, default=str).encode())
+
+        def _reply_cached(self, key, build):
+            """
+            Answers a GET with a (possibly cached) body and an ETag; 304 if the client's copy is current.
+            """
+            version = store.version()
+            cached = cache.get(key, version) if cache is not None else None
+            if cached is None:
+                body = json.dumps(build(), default=str).encode()
+                etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+                if cache is not None:
+                    cache.put(key, version, body, etag)
+            else:
+                body, etag = cached
+            if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+                self._send(304, etag=etag)
+            else:
+                self._send(200, body, etag=etag)
+
+        def _authorised(self):
+            # Browsers send Origin on cross-site requests; only the dashboard may start scans
+            origin = self.headers.get('Origin')
+            if origin and cors_origin != '*' and origin != cors_origin:
+                self._reply(403, {'error': 'origin not allowed'})
+                return False
+            if not token:
+                self._reply(403, {'error': 'scan submission is disabled; start the API with a token'})
+                return False
+            if not hmac.compare_digest(self.headers.get('X-Scan-Token', '').encode(), token.encode()):
+                self._reply(403, {'error': 'invalid token'})
+                return False
+            return True
+
+        def do_OPTIONS(self):
+            # CORS preflight from the dashboard
+            self.send_response(204)
+            if cors_origin:
+                self._send_cors_headers()
+                self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+                self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-None-Match, X-Scan-Token')
+                self.send_header('Access-Control-Max-Age', '600')
+            self.end_headers()
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            parts = [unquote(part) for part in url.path.strip('/').split('/')]
+            try:
+                limit = min(int(params.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+                if limit < 1:
+                    raise ValueError
+            except ValueError:
+                self._reply(400, {'error': 'invalid limit'})
+                return
+
+            try:
+                if parts == ['api', 'scans']:
+                    self._reply_cached(self.path, lambda: store.scans(params, limit))
+                elif parts == ['api', 'domains']:
+                    self._reply_cached(self.path, lambda: store.domains(params, limit))
+                elif len(parts) == 3 and parts[:2] == ['api', 'domains']:
+                    params['domain'] = parts[2]
+                    self._reply_cached(self.path, lambda: store.scans(params, limit))
+                elif len(parts) == 3 and parts[:2] == ['api', 'rollups'] and parts[2] in DIMENSIONS:
+                    if params.get('series'):
+                        build = lambda: rollup_series(parts[2], params.get('start'), params.get('end'),
+                                                      db_path=store.db_path)
+                    else:
+                        build = lambda: [{'key': key, 'count': count} for key, count in rollup_totals(
+                            parts[2], params.get('start'), params.get('end'), params.get('limit'),
+                            db_path=store.db_path)]
+                    self._reply_cached(self.path, build)
+                elif parts == ['api', 'jobs']:
+                    self._reply(200, {'items': jobs.list()})
+                elif len(parts) == 3 and parts[:2] == ['api', 'jobs']:
+                    job = jobs.get(parts[2])
+                    if job is None:
+                        self._reply(404, {'error': 'unknown job'})
+                    else:
+                        self._reply(200, job)
+                else:
+                    self._reply(404, {'error': 'not found'})
+            except ApiError as e:
+                self._reply(e.code, {'error': str(e)})
+            except (ValueError, sqlite3.Error) as e:
+                logger.error("API query %s failed: %s", self.path, e)
+                self._reply(400 if isinstance(e, ValueError) else 500, {'error': str(e)})
+
+        def do_POST(self):
+            if not self._authorised():
+                return
+            if urlparse(self.path).path.rstrip('/') != '/api/scans':
+                self._reply(404, {'error': 'not found'})
+                return
+            # A JSON content type cannot be sent cross-origin without a CORS preflight
+            if self.headers.get('Content-Type', '').split(';')[0].strip().lower() != 'application/json':
+                self._reply(415, {'error': 'Content-Type must be application/json'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                self._reply(400, {'error': 'invalid JSON'})
+                return
+
+            domains = [domain.strip() for domain in payload.get('domains', []) if domain and domain.strip()]
+            if not domains:
+                self._reply(400, {'error': "'domains' must be a non-empty list"})
+                return
+            try:
+                job = jobs.submit(domains, payload.get('report_type'), payload.get('headless', True))
+            except ApiError as e:
+                self._reply(e.code, {'error': str(e)})
+                return
+            self._reply(202, dict(job, status_url=f"/api/jobs/{job['job_id']}"))
+
+        def log_message(self, format, *args):
+            # Dashboards poll every few seconds; keep requests out of the terminal
+            logger.debug("results API: " + format, *args)
+
+    return ResultsApiHandler
+
+
+def serve_api(config, host='127.0.0.1', port=DEFAULT_PORT, token=None, cors_origin=DEFAULT_CORS_ORIGIN,
+              db_path=RESULTS_DB, runner=None):
+    """
+    Starts the results API in a background thread.
+
+    Endpoints (JSON over HTTP):
+      GET  /api/scans                 stored results, newest first
+      GET  /api/domains               each domain's latest result
+      GET  /api/domains/<domain>      one domain's results, newest first
+      GET  /api/rollups/<dimension>   rollup totals (?series=1 for daily counts)
+      POST /api/scans                 start a scan: {"domains": [...], "report_type": "pdf"}
+      GET  /api/jobs, /api/jobs/<id>  scan progress
+
+    Listings take 'limit' and 'cursor' (from 'next_cursor'), and the filters 'status',
+    'ip', 'run_id', 'date_from', and 'date_to'. Result and rollup responses carry an
+    ETag; a request with a matching If-None-Match is answered 304 without a body.
+    Responses are cached in memory until a new result is written.
+
+    Starting a scan needs the token in the X-Scan-Token header and a JSON body sent
+    as application/json. A request whose Origin is not `cors_origin` is refused, and
+    without a token POST /api/scans is disabled.
+
+    :param config: A dictionary containing the configuration settings (used for submitted scans).
+    :param host: Interface to bind. Default is localhost only.
+    :param port: TCP port to listen on. Default is 8780.
+    :param token: Shared secret required in the X-Scan-Token header to submit scans. None disables submission.
+    :param cors_origin: The dashboard's origin, sent as Access-Control-Allow-Origin, or None to send no
+                        CORS headers. '*' allows any origin (not recommended with a token).
+    :param db_path: Path to the SQLite result store.
+    :param runner: Scan function for submitted jobs. Defaults to scanner.run_scan.
+    :return: The running server instance.
+    """
+    store = ResultsStore(db_path)
+    cache = ResponseCache()
+    add_write_listener(cache.invalidate)
+    jobs = ScanJobs(config, runner)
+
+    server = ThreadingHTTPServer((host, port), _make_handler(store, cache, jobs, token, cors_origin))
+    server.daemon_threads = True
+    server.jobs = jobs
+
+    def close():
+        remove_write_listener(cache.invalidate)
+        store.close()
+
+    server.close_store = close
+    threading.Thread(target=server.serve_forever, name='results-api', daemon=True).start()
+    logger.info("Results API listening on http://%s:%d/api/", host, server.server_address[1],
+                extra={'port': server.server_address[1]})
+    return server
+
+
+def main(argv=None):
+    from config import load_config, default_config
+    from logging_module import setup_logging
+
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON API over the scan results.")
+    parser.add_argument('--config', help="Configuration file (.json or .txt).")
+    parser.add_argument('--bind', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--token', help="Shared secret required in the X-Scan-Token header to submit scans "
+                                        "(default: \"api_token\" from the config). Without one, POST is disabled.")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config) if args.config else default_config()
+    setup_logging(config)
+    port = args.port or config.get('api_port', DEFAULT_PORT)
+    token = args.token or config.get('api_token')
+    server = serve_api(config, host=args.bind, port=port, token=token,
+                       cors_origin=config.get('api_cors_origin', DEFAULT_CORS_ORIGIN))
+    print(f"Results API on http://{args.bind}:{server.server_address[1]}/api/ (Ctrl+C to stop)")
+    if not token:
+        print("No token set (--token or \"api_token\"); starting scans through POST /api/scans is disabled.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.close_store()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,195 @@
+import heapq
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from IP_address import TRANSIENT_DNS_FAILURES
+from logging_module import log_status
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Error types worth another attempt later; anything else is final
+TRANSIENT_ERRORS = ('dns', 'timeout', 'reset')
+
+# Retries scheduled, and domains that ran out of attempts, labelled by error type
+RETRIES_DEFERRED = 'domain_scout_retries_deferred_total'
+RETRIES_EXHAUSTED = 'domain_scout_retries_exhausted_total'
+
+
+def transient_failure(results, scan_record):
+    """
+    Decides whether a domain's scan failed for a reason that may clear up on its own.
+
+    :param results: The results returned by scanner.scan_domain (None if the domain did not resolve,
+                    or if the scan stopped at a transient HTTP failure).
+    :param scan_record: The scan record returned with them.
+    :return: 'dns' (no nameserver answered), 'timeout', or 'reset' (HTTP), or None if the
+             result is final (including NXDOMAIN, NODATA, unexpected resolver errors,
+             refused connections, and HTTP error statuses).
+    """
+    if results is None and (scan_record or {}).get('http_error_type') is None:
+        # NXDOMAIN comes back as a CLOSED_DOMAIN result; retry only lookups nobody answered
+        failure = (scan_record or {}).get('dns_failure')
+        return 'dns' if failure in TRANSIENT_DNS_FAILURES else None
+    error_type = (scan_record or {}).get('http_error_type')
+    return error_type if error_type in TRANSIENT_ERRORS else None
+
+
+class RetryQueue:
+    """
+    Heap of domains waiting for another attempt, ordered by the time they are due.
+
+    Each domain gets at most `max_attempts` attempts in total. The delay before
+    attempt n + 1 is base_delay * factor ** (n - 1), capped at max_delay, with
+    up to 20% random jitter so retries to one host do not line up.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=5.0, factor=3.0, max_delay=120.0, seed=None):
+        """
+        :param max_attempts: Attempts per domain, including the first. Default is 3.
+        :param base_delay: Seconds before the first retry. Default is 5.
+        :param factor: Growth of the delay per attempt. Default is 3.
+        :param max_delay: Longest delay in seconds. Default is 120.
+        :param seed: Seed for the jitter, for reproducible runs.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.factor = factor
+        self.max_delay = max_delay
+        self.attempts = {}
+        self.heap = []
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def delay(self, attempt):
+        """
+        :param attempt: Number of attempts made so far (1 after the first failure).
+        :return: Seconds to wait before the next attempt.
+        """
+        delay = min(self.base_delay * self.factor ** (attempt - 1), self.max_delay)
+        return delay * (1 + 0.2 * self.random.random())
+
+    def defer(self, domain, error_type):
+        """
+        Records a failed attempt and schedules another one if the domain has budget left.
+
+        :param domain: The domain that failed.
+        :param error_type: Error type (one of TRANSIENT_ERRORS).
+        :return: Seconds until the retry, or None if the budget is used up.
+        """
+        with self._lock:
+            attempts = self.attempts.get(domain, 0) + 1
+            self.attempts[domain] = attempts
+            if attempts >= self.max_attempts:
+                registry.inc(RETRIES_EXHAUSTED, error_type=error_type)
+                return None
+            delay = self.delay(attempts)
+            heapq.heappush(self.heap, (time.monotonic() + delay, domain, error_type))
+        registry.inc(RETRIES_DEFERRED, error_type=error_type)
+        logger.info("Deferring %s after a %s failure (attempt %d/%d); retry in %.1fs", domain, error_type,
+                    attempts, self.max_attempts, delay,
+                    extra={'domain': domain, 'error_type': error_type, 'attempt': attempts})
+        return delay
+
+    def pop_ready(self):
+        """
+        :return: The next domain whose retry is due, or None.
+        """
+        with self._lock:
+            if self.heap and self.heap[0][0] <= time.monotonic():
+                return heapq.heappop(self.heap)[1]
+        return None
+
+    def wait_next(self):
+        """
+        Sleeps until the earliest retry is due.
+        """
+        with self._lock:
+            due = self.heap[0][0] if self.heap else None
+        if due is not None:
+            time.sleep(max(due - time.monotonic(), 0))
+
+    def attempt(self, domain):
+        """
+        :return: The number of the attempt about to be made for a domain (1 for the first).
+        """
+        with self._lock:
+            return self.attempts.get(domain, 0) + 1
+
+
+def run_with_retries(domains, scan, on_result, queue=None, status=log_status):
+    """
+    Scans domains once each, moving transient failures to a retry queue instead
+    of retrying them on the spot.
+
+    Retries that are due are taken before the next new domain, so they run
+    interleaved with the main pass; whatever is still queued afterwards is drained
+    in due order. A domain whose budget runs out is reported with its last result.
+
+    :param domains: Domains to scan.
+    :param scan: Function taking (domain, final_attempt) and returning (results, scan_record).
+                 final_attempt is False while a transient failure would still be retried,
+                 so the scan can stop at the failed stage instead of running the rest.
+    :param on_result: Callback (domain, results, scan_record) called once per domain with its final result.
+    :param queue: RetryQueue to use. None scans every domain exactly once.
+    :param status: Callback receiving progress messages. Default logs them (see logging_module.log_status).
+    """
+    pending = deque(domains)
+    while pending or (queue is not None and len(queue)):
+        domain = queue.pop_ready() if queue is not None else None
+        if domain is not None:
+            status(f"Retrying {domain} (attempt {queue.attempt(domain)}/{queue.max_attempts})...")
+        elif pending:
+            domain = pending.popleft()
+        else:
+            queue.wait_next()
+            continue
+
+        final_attempt = queue is None or queue.attempt(domain) >= queue.max_attempts
+        results, scan_record = scan(domain, final_attempt)
+        error_type = transient_failure(results, scan_record) if queue is not None else None
+        if error_type:
+            delay = queue.defer(domain, error_type)
+            if delay is not None:
+                status(f"Transient {error_type} failure for {domain}; retrying in {delay:.1f}s.")
+                continue
+            status(f"Giving up on {domain} after {queue.max_attempts} attempts ({error_type}).")
+        on_result(domain, results, scan_record)
+
+
+def get_retry_queue(config):
+    """
+    Builds a retry queue from config['retry_attempts'], config['retry_base_delay'],
+    and config['retry_max_delay'], or returns None when config['retry_queue'] is false.
+
+    :param config: A dictionary containing the configuration settings.
+    :return: A new RetryQueue, or None.
+    """
+    if not config.get('retry_queue', True):
+        return None
+    return RetryQueue(
+        max_attempts=config.get('retry_attempts', 3),
+        base_delay=config.get('retry_base_delay', 5.0),
+        max_delay=config.get('retry_max_delay', 120.0),
+    )
+
+
+# Example usage within the module (optional)
+if __name__ == "__main__":
+    flaky = {'flaky.example': 2}
+
+    def fake_scan(domain, final_attempt):
+        if flaky.get(domain):
+            flaky[domain] -= 1
+            return {'Domain Name': domain}, {'http_error_type': 'timeout'}
+        return {'Domain Name': domain}, {'http_error_type': None}
+
+    run_with_retries(['flaky.example', 'a.example', 'b.example'], fake_scan,
+                     lambda domain, results, record: print(f"done: {domain}"),
+                     RetryQueue(base_delay=0.2))
@@ -0,0 +1,400 @@
+import argparse
+import ast
+import calendar
+import csv
+import glob
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from IP_address import canonical_domain
+from rate_limiter import subnet_key
+
+logger = logging.getLogger(__name__)
+
+# Rollup dimensions, each counted per scan date and key:
+#   scans       - results stored that day (key '')
+#   status      - HTTP status code ('N/A' when there was no response)
+#   tld         - last label of the domain name
+#   ip_cluster  - /24 (IPv4) or /48 (IPv6) network of the resolved IP
+#   port_open   - port number, counted when the port was open
+DIMENSIONS = ('scans', 'status', 'tld', 'ip_cluster', 'port_open')
+
+_PORT_TEXT = re.compile(r'Port (\d+) (\w+)', re.IGNORECASE)
+
+
+def create_rollup_tables(conn):
+    """
+    Creates the rollup tables in the result store if they do not exist.
+
+    :param conn: An open sqlite3 connection to the result store.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_daily (
+            dimension TEXT NOT NULL,
+            day TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (dimension, day, key)
+        ) WITHOUT ROWID
+    ''')
+    # The same counts summed per month, so long ranges read a few rows per key
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_monthly (
+            dimension TEXT NOT NULL,
+            month TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (dimension, month, key)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_sources (
+            source TEXT PRIMARY KEY,
+            rows INTEGER NOT NULL,
+            ingested_at TEXT
+        )
+    ''')
+
+
+def tld_of(domain_name):
+    """
+    :return: The last label of a domain name or URL, or '(none)' for single-label names.
+    """
+    host = canonical_domain(domain_name or '')
+    return host.rsplit('.', 1)[-1] if '.' in host else '(none)'
+
+
+def rollup_counts(scan_record):
+    """
+    Computes the rollup increments for one scan result.
+
+    :param scan_record: A scan result dictionary (as passed to store_scan_result).
+    :return: A Counter of (dimension, day, key) -> increment.
+    """
+    day = scan_record.get('scan_date') or time.strftime('%Y-%m-%d')
+    status = scan_record.get('http_status_code')
+    counts = Counter()
+    counts['scans', day, ''] += 1
+    counts['status', day, 'N/A' if status in (None, '') else str(status)] += 1
+    counts['tld', day, tld_of(scan_record.get('domain_name'))] += 1
+
+    cluster = subnet_key(scan_record.get('ip_address') or '')
+    if cluster:
+        counts['ip_cluster', day, cluster] += 1
+
+    for port, state in (scan_record.get('port_status') or {}).items():
+        if state == 'open':
+            counts['port_open', day, str(port)] += 1
+    return counts
+
+
+def apply_counts(conn, counts):
+    """
+    Adds rollup increments inside the caller's transaction.
+
+    :param conn: An open sqlite3 connection to the result store.
+    :param counts: A mapping of (dimension, day, key) -> increment.
+    """
+    conn.executemany(
+        '''INSERT INTO rollup_daily (dimension, day, key, count) VALUES (?, ?, ?, ?)
+           ON CONFLICT (dimension, day, key) DO UPDATE SET count = count + excluded.count''',
+        [(dimension, day, key, count) for (dimension, day, key), count in counts.items()],
+    )
+    monthly = Counter()
+    for (dimension, day, key), count in counts.items():
+        monthly[dimension, day[:7], key] += count
+    conn.executemany(
+        '''INSERT INTO rollup_monthly (dimension, month, key, count) VALUES (?, ?, ?, ?)
+           ON CONFLICT (dimension, month, key) DO UPDATE SET count = count + excluded.count''',
+        [(dimension, month, key, count) for (dimension, month, key), count in monthly.items()],
+    )
+
+
+def update_rollups(conn, scan_record):
+    """
+    Updates the rollups for one newly stored scan result. Called by
+    output_storage.store_scan_result in the same transaction as the insert, so
+    the rollups always match the stored results.
+
+    :param conn: An open sqlite3 connection to the result store.
+    :param scan_record: The scan result dictionary that was stored.
+    """
+    apply_counts(conn, rollup_counts(scan_record))
+
+
+def _connect(db_path):
+    # Imported here: output_storage imports this module to keep the rollups up to date
+    from output_storage import connect_results_db, RESULTS_DB
+    return connect_results_db(db_path or RESULTS_DB)
+
+
+def _range_clause(start, end, column='day'):
+    clause, params = '', []
+    if start:
+        clause += f' AND {column} >= ?'
+        params.append(start)
+    if end:
+        clause += f' AND {column} <= ?'
+        params.append(end)
+    return clause, params
+
+
+def split_range(start, end):
+    """
+    Splits a date range into whole months, read from rollup_monthly, and the
+    partial months at either end, read from rollup_daily.
+
+    :param start: First day ('YYYY-MM-DD'), or None for no lower bound.
+    :param end: Last day ('YYYY-MM-DD'), or None for no upper bound.
+    :return: A tuple (day ranges, month range): a list of (first day, last day) pairs,
+             and a (first month, last month) pair ('YYYY-MM', None when unbounded) or None.
+    """
+    first_month = last_month = None
+    head = tail = None
+    if start:
+        first = date.fromisoformat(start)
+        first_month = start[:7]
+        if first.day != 1:
+            month_end = first.replace(day=calendar.monthrange(first.year, first.month)[1])
+            head = (start, month_end.isoformat())
+            first_month = (month_end + timedelta(days=1)).isoformat()[:7]
+    if end:
+        last = date.fromisoformat(end)
+        last_month = end[:7]
+        if last.day != calendar.monthrange(last.year, last.month)[1]:
+            tail = (last.replace(day=1).isoformat(), end)
+            last_month = (last.replace(day=1) - timedelta(days=1)).isoformat()[:7]
+
+    if first_month and last_month and first_month > last_month:
+        # The range does not contain a whole month
+        return [(start, end)], None
+    return [span for span in (head, tail) if span], (first_month, last_month)
+
+
+def _ranged_rows(dimension, start, end):
+    """
+    :return: SQL selecting (key, count) rows of a dimension over a date range, and its parameters.
+    """
+    day_ranges, month_range = split_range(start, end)
+    parts, params = [], []
+    for first, last in day_ranges:
+        clause, range_params = _range_clause(first, last)
+        parts.append(f'SELECT key, count FROM rollup_daily WHERE dimension = ?{clause}')
+        params += [dimension] + range_params
+    if month_range:
+        clause, range_params = _range_clause(*month_range, column='month')
+        parts.append(f'SELECT key, count FROM rollup_monthly WHERE dimension = ?{clause}')
+        params += [dimension] + range_params
+    return ' UNION ALL '.join(parts), params
+
+
+def rollup_totals(dimension, start=None, end=None, limit=None, db_path=None):
+    """
+    Totals a rollup dimension over a date range, largest first.
+
+    :param dimension: One of DIMENSIONS.
+    :param start: First scan date to include ('YYYY-MM-DD'). Default is no lower bound.
+    :param end: Last scan date to include ('YYYY-MM-DD'). Default is no upper bound.
+    :param limit: Maximum number of keys returned. Default is all.
+    :param db_path: Path to the result store. Default is output_storage.RESULTS_DB.
+    :return: A list of (key, count) tuples.
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown rollup dimension: {dimension}")
+    rows, params = _ranged_rows(dimension, start, end)
+    sql = f'SELECT key, SUM(count) AS total FROM ({rows}) GROUP BY key ORDER BY total DESC, key'
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(int(limit))
+    conn = _connect(db_path)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def rollup_series(dimension, start=None, end=None, keys=None, db_path=None):
+    """
+    Returns the daily counts of a rollup dimension, for charts over time.
+
+    :param dimension: One of DIMENSIONS.
+    :param start: First scan date to include ('YYYY-MM-DD').
+    :param end: Last scan date to include ('YYYY-MM-DD').
+    :param keys: Only these keys (e.g., ['200', '404']). Default is every key.
+    :param db_path: Path to the result store. Default is output_storage.RESULTS_DB.
+    :return: A dictionary of day -> {key: count}, in date order.
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown rollup dimension: {dimension}")
+    clause, params = _range_clause(start, end)
+    if keys:
+        clause += f" AND key IN ({', '.join('?' * len(keys))})"
+        params.extend(str(key) for key in keys)
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute(f'SELECT day, key, count FROM rollup_daily WHERE dimension = ?{clause} ORDER BY day',
+                            [dimension] + params).fetchall()
+    finally:
+        conn.close()
+    series = defaultdict(dict)
+    for day, key, count in rows:
+        series[day][key] = count
+    return dict(series)
+
+
+def port_frequency(start=None, end=None, limit=None, db_path=None):
+    """
+    Lists how often each port was found open over a date range.
+
+    :return: A list of (port, times open, share of scans with the port open), most frequent first.
+    """
+    scans = sum(count for _, count in rollup_totals('scans', start, end, db_path=db_path))
+    return [(int(port), count, count / scans if scans else 0.0)
+            for port, count in rollup_totals('port_open', start, end, limit, db_path=db_path)]
+
+
+def parse_port_status(value):
+    """
+    Parses a 'Port Status' CSV cell: either a dictionary such as
+    "{80: 'open', 443: 'closed/filtered'}" or text such as "Port 80 Open".
+
+    :return: A dictionary of port -> 'open' or 'closed/filtered'.
+    """
+    value = (value or '').strip()
+    if value.startswith('{'):
+        try:
+            return {int(port): state for port, state in ast.literal_eval(value).items()}
+        except (ValueError, SyntaxError):
+            return {}
+    return {int(port): 'open' if state.lower() == 'open' else 'closed/filtered'
+            for port, state in _PORT_TEXT.findall(value)}
+
+
+def _csv_record(row):
+    status = (row.get('HTTP Status Code') or '').strip()
+    if status.endswith('.0'):
+        status = status[:-2]
+    return {
+        'domain_name': row.get('Domain Name'),
+        'scan_date': row.get('Scan Date'),
+        'ip_address': row.get('IP Address'),
+        'port_status': parse_port_status(row.get('Port Status')),
+        'http_status_code': status or None,
+    }
+
+
+def backfill_csv(paths=None, db_path=None):
+    """
+    Adds scan results from CSV files to the rollups.
+
+    Only rows not yet ingested from each file are read, so the backfill can be
+    re-run after the file grows. Rows whose domain and scan date are already in
+    the result store (written by a live scan, which updated the rollups itself)
+    are skipped.
+
+    :param paths: CSV files to ingest. Default is every scan CSV in scan_output/.
+    :param db_path: Path to the result store. Default is output_storage.RESULTS_DB.
+    :return: A dictionary of path -> number of rows added.
+    """
+    from output_storage import OUTPUT_DIR
+    paths = paths or sorted(glob.glob(os.path.join(OUTPUT_DIR, '*.csv')))
+    added = {}
+    conn = _connect(db_path)
+    try:
+        for path in paths:
+            source = os.path.abspath(path)
+            with open(path, newline='') as file:
+                reader = csv.DictReader(file)
+                if not {'Domain Name', 'Scan Date'}.issubset(reader.fieldnames or []):
+                    continue
+                rows = list(reader)
+            row = conn.execute('SELECT rows FROM rollup_sources WHERE source = ?', (source,)).fetchone()
+            done = row[0] if row and row[0] <= len(rows) else 0
+
+            counts = Counter()
+            count = 0
+            for row in rows[done:]:
+                record = _csv_record(row)
+                if conn.execute('SELECT 1 FROM scan_results WHERE domain_name = ? AND scan_date = ? LIMIT 1',
+                                (record['domain_name'], record['scan_date'])).fetchone():
+                    continue
+                counts.update(rollup_counts(record))
+                count += 1
+            with conn:
+                apply_counts(conn, counts)
+                conn.execute('''INSERT INTO rollup_sources (source, rows, ingested_at) VALUES (?, ?, ?)
+                                ON CONFLICT (source) DO UPDATE SET rows = excluded.rows,
+                                ingested_at = excluded.ingested_at''',
+                             (source, len(rows), time.strftime('%Y-%m-%dT%H:%M:%S')))
+            added[path] = count
+            logger.info("Backfilled %d row(s) from %s into the rollups", count, path,
+                        extra={'source': path, 'rows': count})
+    finally:
+        conn.close()
+    return added
+
+
+def rebuild_rollups(db_path=None):
+    """
+    Recomputes the rollups from every result in the store. CSV backfills are
+    cleared as well and must be re-run.
+
+    :return: The number of stored results counted.
+    """
+    conn = _connect(db_path)
+    try:
+        counts = Counter()
+        total = 0
+        for (record,) in conn.execute('SELECT record FROM scan_results'):
+            record = json.loads(record)
+            record['port_status'] = {int(port): state for port, state in (record.get('port_status') or {}).items()}
+            counts.update(rollup_counts(record))
+            total += 1
+        with conn:
+            conn.execute('DELETE FROM rollup_daily')
+            conn.execute('DELETE FROM rollup_monthly')
+            conn.execute('DELETE FROM rollup_sources')
+            apply_counts(conn, counts)
+    finally:
+        conn.close()
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Daily rollups of scan results for dashboards.")
+    parser.add_argument('--db', default=None, help="Result store. Default: scan_output/scan_results.db")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    backfill = commands.add_parser('backfill', help="Add CSV scan results to the rollups.")
+    backfill.add_argument('csv', nargs='*')
+
+    commands.add_parser('rebuild', help="Recompute the rollups from the result store.")
+
+    query = commands.add_parser('query', help="Total a dimension over a date range.")
+    query.add_argument('dimension', choices=DIMENSIONS)
+    query.add_argument('--start')
+    query.add_argument('--end')
+    query.add_argument('--limit', type=int, default=20)
+
+    args = parser.parse_args(argv)
+    if args.command == 'backfill':
+        for path, count in backfill_csv(args.csv, args.db).items():
+            print(f"{path}: {count} row(s) added")
+    elif args.command == 'rebuild':
+        print(f"Rebuilt rollups from {rebuild_rollups(args.db)} stored result(s).")
+    else:
+        started = time.monotonic()
+        rows = rollup_totals(args.dimension, args.start, args.end, args.limit, args.db)
+        print(f"{len(rows)} key(s) in {(time.monotonic() - started) * 1000:.1f} ms:")
+        for key, count in rows:
+            print(f"  {count:8d}  {key}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,548 @@
+import os
+import re
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from IP_address import resolve_domain, get_nameserver_pool
+from PORT_scan import scan_ports_by_mode, ports_for_mode
+from HTTP_status import get_http_status
+from screenshot_module import capture_domain_screenshot, capture_multi_device, DEFAULT_VIEWPORT, DEFAULT_DEADLINE, BLOCKED_RESOURCES
+from report import generate_report, get_report_cache
+from output_storage import save_scan_results, store_scan_result, update_run_results
+from metrics import track_stage, record_error, record_domain_scanned, start_exporters, write_snapshot
+from profiling import start_profiler, profile_span
+from rate_limiter import get_rate_limiter, get_sweep_limiter
+from port_cache import get_port_cache, flush_port_cache
+from tls_certificates import san_group_key
+from stage_rules import StageRules, summarize_skips
+from phishing_classifier import get_classifier
+from domain_similarity import get_similarity_index
+from retry_queue import run_with_retries, get_retry_queue, TRANSIENT_ERRORS
+from page_fingerprint import fingerprint_page, DEFAULT_BODY_MAX_KB
+from screenshot_index import get_screenshot_index, dhash, format_hash, DEFAULT_MAX_DISTANCE
+from logging_module import setup_logging, log_status
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _stage(stage, function_name, domain, profiler):
+    """
+    Times a stage for the metrics registry and, when profiling, records its trace span.
+    """
+    with track_stage(stage), profile_span(profiler, function_name, domain):
+        yield
+
+
+def scan_domain(domain, config, headless, status=log_status, profiler=None, rules=None, final_attempt=True):
+    """
+    Runs every stage of the pipeline for a single domain.
+
+    Early-exit rules (see stage_rules.py) are applied after the DNS, port-scan, and
+    HTTP stages and can skip or shorten the stages after them.
+
+    :param domain: The domain (or URL) to scan.
+    :param config: A dictionary containing the configuration settings.
+    :param headless: Capture screenshots in a headless browser (fast scan) or a full browser (detailed scan).
+    :param status: Callback receiving progress messages. Default logs them (see logging_module.log_status).
+    :param profiler: Optional ScanProfiler recording stage spans.
+    :param rules: StageRules to apply. Built from the config if not given.
+    :param final_attempt: False when the retry queue will try the domain again. A transient HTTP
+                          failure then ends the scan after the HTTP stage, so the later stages
+                          and the domain's metrics run only on the attempt that is kept.
+    :return: A tuple (results, scan_record) for the report and for output storage, or
+             (None, {'dns_failure': reason}) if the domain could not be resolved
+             (see IP_address.resolve_domain), or (None, {'http_error_type': error_type})
+             for a transient HTTP failure on an attempt that is not the final one.
+    """
+    sanitized_domain = re.sub(r'[\\/:*?"<>|]', '_', domain)
+    status(f"Starting scan for {domain}...")
+
+    # Initialize variables to ensure they are always defined
+    http_status_code = "N/A"
+    http_status_desc = "N/A"
+    ip_address = None
+    port_status = {}
+    port_cache_age = None
+    screenshot_path = None
+    redirected_url = None  # Store redirected URL
+    redirect_chain = []
+    http_result = None
+    page_fingerprint = None
+    tls_certificate = None
+    screenshot_hash = None
+    similar_screenshots = []
+    device_capture = None
+    limiter = get_rate_limiter(config)
+    plan = (rules or StageRules.from_config(config)).plan()
+
+    # Step 1: Resolve domain to IP
+    try:
+        with _stage('dns', 'resolve_domain_to_ip', domain, profiler):
+            ip_address, dns_failure = resolve_domain(domain,
+                                                     use_system_resolver=config.get('use_system_resolver', True),
+                                                     pool=get_nameserver_pool(config))
+        if not ip_address:
+            record_error('dns', 'unresolved')
+            status(f"Failed to resolve IP for {domain} ({dns_failure}).")
+            return None, {'dns_failure': dns_failure}
+        status(f"Resolved IP for {domain}: {ip_address}")
+        # NXDOMAIN answers come back as CLOSED_DOMAIN; the domain is still reported as closed
+        if plan.after('dns', resolved=ip_address != 'CLOSED_DOMAIN'):
+            _report_skips(plan, domain, status)
+    except Exception as e:
+        status(f"Error resolving IP for {domain}: {str(e)}")
+        return None, {'dns_failure': 'error'}
+
+    # Step 2: Scan ports (once per IP and port set; other domains on the IP reuse the result)
+    mode = config.get('port_scan_mode', 'list')
+    ports = ports_for_mode(mode, config.get('ports', [80, 443, 22]))
+    port_scan_failed = False
+    try:
+        if not plan.should_run('port_scan'):
+            raise _Skipped()
+
+        def report_open_port(port, state):
+            if state == 'open':
+                status(f"Open port on {ip_address}: {port}")
+
+        def scan(ip, ports):
+            # The batch modes have their own packet budget (see rate_limiter.get_sweep_limiter)
+            port_limiter = limiter if mode == 'list' else get_sweep_limiter(config)
+            port_status = scan_ports_by_mode(ip, mode, ports, limiter=port_limiter, on_result=report_open_port)
+            if mode != 'list':
+                # Keep top-N and full-range results readable: only the open ports are reported
+                port_status = {port: state for port, state in sorted(port_status.items()) if state == 'open'}
+            return port_status
+
+        with _stage('port_scan', 'scan_ports', domain, profiler):
+            if config.get('port_cache', True):
+                port_status, port_cache_age = get_port_cache(config).get_or_scan(ip_address, ports, scan)
+            else:
+                port_status = scan(ip_address, ports)
+        if port_cache_age:
+            status(f"Port scan results for {domain} (cached {port_cache_age:.0f}s ago): {port_status}")
+        else:
+            status(f"Port scan results for {domain}: {port_status}")
+    except _Skipped:
+        pass
+    except Exception as e:
+        status(f"Error scanning ports for {domain}: {str(e)}")
+        port_status = {}
+        port_scan_failed = True
+    if plan.should_run('port_scan') and plan.after_port_scan(port_status, ports, failed=port_scan_failed):
+        _report_skips(plan, domain, status)
+
+    # Step 3: Get HTTP status code and follow the redirect chain (no browser needed)
+    try:
+        if not plan.should_run('http'):
+            raise _Skipped()
+        with _stage('http', 'get_http_status_code', domain, profiler):
+            http_options = {
+                'limiter': limiter,
+                'limiter_key': ip_address,
+                'body_bytes': config.get('body_max_kb', DEFAULT_BODY_MAX_KB) * 1024 if config.get('fetch_body') else 0,
+            }
+            if config.get('retry_queue', True):
+                # Transient failures are retried later from the retry queue, not on the spot
+                http_options['retries'] = 1
+            http_options.update(plan.overrides('http'))
+            http_result = get_http_status(domain, **http_options)
+        http_status_code, http_status_desc = http_result['status_code'], http_result['description']
+        redirect_chain = http_result['chain']
+        tls_certificate = http_result['certificate']
+        if tls_certificate:
+            status(f"TLS certificate for {domain}: {tls_certificate['subject']} issued by {tls_certificate['issuer']}"
+                   f"{'' if tls_certificate['valid'] else ' (not valid)'}")
+        if len(redirect_chain) > 1:
+            redirected_url = http_result['final_url']
+            status(f"Redirected URL: {redirected_url} ({len(redirect_chain) - 1} redirect(s))")
+        logger.info("Raw HTTP response for %s: %s - %s", domain, http_status_code, http_status_desc,
+                    extra={'domain': domain, 'status_code': http_status_code})
+
+        if http_status_code is None:
+            record_error('http', 'no_response')
+            http_status_code, http_status_desc = "N/A", "N/A"
+            logger.warning("Empty or None HTTP status code for %s, defaulting to 'N/A'", domain,
+                           extra={'domain': domain})
+
+        status(f"HTTP status code for {domain}: {http_status_code} - {http_status_desc}")
+    except _Skipped:
+        pass
+    except Exception as e:
+        status(f"Failed to retrieve HTTP status for {domain}: {str(e)}")
+        http_status_code, http_status_desc = "N/A", "N/A"
+        logger.error("Error retrieving HTTP status for %s: %s", domain, e, extra={'domain': domain})
+    if not final_attempt and http_result and http_result['error_type'] in TRANSIENT_ERRORS:
+        # Retried later from the retry queue; nothing after the HTTP stage runs twice
+        return None, {'http_error_type': http_result['error_type']}
+    if plan.should_run('http') and plan.after('http', http_ok=http_status_code != "N/A",
+                                              http_status=None if http_status_code == "N/A" else http_status_code,
+                                              redirected=len(redirect_chain) > 1):
+        _report_skips(plan, domain, status)
+
+    # Step 3b: Fingerprint the page body (optional, see 'fetch_body')
+    if http_result and http_result.get('body') and plan.should_run('fingerprint'):
+        try:
+            with _stage('fingerprint', 'fingerprint_page', domain, profiler):
+                fingerprint_options = {'fetch_favicon': config.get('fetch_favicon', True)}
+                fingerprint_options.update(plan.overrides('fingerprint'))
+                page_fingerprint = fingerprint_page(
+                    http_result['body'], http_result['final_url'], encoding=http_result['body_charset'],
+                    truncated=http_result['body_truncated'], limiter=limiter, limiter_key=ip_address,
+                    **fingerprint_options,
+                )
+            status(f"Page fingerprint for {domain}: title {page_fingerprint['title']!r}, "
+                   f"content {page_fingerprint['content_hash'][:12]}")
+        except Exception as e:
+            record_error('fingerprint', type(e).__name__)
+            status(f"Failed to fingerprint page for {domain}: {str(e)}")
+
+    # Step 4: Capture a screenshot
+    try:
+        if not plan.should_run('screenshot'):
+            raise _Skipped()
+        status(f"Capturing screenshot for {domain}...")
+
+        # Capture screenshot; lean capture stops waiting once the page's network is idle
+        capture_options = {
+            'headless': headless,
+            'limiter': limiter,
+            'limiter_key': ip_address,
+            'image_format': config.get('screenshot_format', 'webp'),
+            'quality': config.get('screenshot_quality', 80),
+            'lean': config.get('screenshot_lean', True),
+            'deadline': config.get('screenshot_deadline', DEFAULT_DEADLINE),
+            'block': config.get('screenshot_block', list(BLOCKED_RESOURCES)),
+        }
+        devices = config.get('screenshot_devices') or []
+        if len(devices) > 1:
+            # Every device profile in one browser session, compared for device-based cloaking
+            with _stage('screenshot', 'capture_multi_device', domain, profiler):
+                device_capture = capture_multi_device(f"http://{domain}", devices=devices, **capture_options)
+            screenshot_path = next((path for path in device_capture['screenshots'].values() if path), None)
+            if device_capture['cloaking']:
+                status(f"{domain} serves different content by device ({', '.join(device_capture['differences'])} "
+                       f"differ)")
+        else:
+            with _stage('screenshot', 'capture_domain_screenshot', domain, profiler):
+                screenshot_path = capture_domain_screenshot(
+                    f"http://{domain}", device=devices[0] if devices else 'android',
+                    viewport=tuple(config.get('screenshot_viewport', DEFAULT_VIEWPORT)), **capture_options
+                )
+        mode = "headless" if headless else "full browser mode"
+        status(f"Screenshot captured for {domain} in {mode}. Saved to: {screenshot_path}")
+
+        # Index the capture by perceptual hash and look up other domains with near-identical pages
+        if (config.get('screenshot_index', True) and plan.should_run('screenshot_index')
+                and screenshot_path and os.path.exists(screenshot_path)):
+            with _stage('screenshot_index', 'index_screenshot', domain, profiler):
+                index = get_screenshot_index(config)
+                screenshot_hash = index.add(sanitized_domain, dhash(screenshot_path))
+                max_distance = config.get('screenshot_similarity_distance', DEFAULT_MAX_DISTANCE)
+                similar_screenshots = [name for _, name in index.find_similar(screenshot_hash, max_distance, limit=21)
+                                       if name != sanitized_domain][:20]
+            if similar_screenshots:
+                status(f"Screenshot of {domain} is similar to {len(similar_screenshots)} other domain(s): "
+                       f"{', '.join(similar_screenshots[:5])}")
+
+    except _Skipped:
+        pass
+    except Exception as e:
+        status(f"Failed to capture screenshot for {domain}: {str(e)}")
+
+    # Step 5: Aggregate results
+    results = {
+        "Domain Name": sanitized_domain,
+        "IP Address": ip_address,
+        "Port Status": port_status,
+        "Port Scan Age (s)": None if port_cache_age is None else round(port_cache_age),
+        "HTTP Status": f"{http_status_code} - {http_status_desc}",
+        "Screenshot": screenshot_path,
+        "Redirected URL": redirected_url,  # Include the redirected URL
+        "Redirect Chain": format_redirect_chain(redirect_chain),
+    }
+    if similar_screenshots:
+        results["Similar Screenshots"] = {f"Match {number}": path for number, path in enumerate(similar_screenshots, 1)}
+    if plan.skipped:
+        results["Skipped Stages"] = {stage: f"skipped by rule '{rule}'" for stage, rule in plan.skipped.items()}
+    if device_capture:
+        results["Device Screenshots"] = {device: path or "capture failed"
+                                         for device, path in device_capture['screenshots'].items()}
+        results["Cloaking"] = (f"Yes ({', '.join(device_capture['differences'])} differ between devices)"
+                               if device_capture['cloaking'] else "No")
+    if tls_certificate:
+        results["TLS Certificate"] = format_tls_certificate(tls_certificate)
+    if page_fingerprint:
+        results["Page Fingerprint"] = format_page_fingerprint(page_fingerprint)
+    record_domain_scanned()
+    status(f"Aggregated results for {domain}")
+
+    # Step 6: Prepare scan results for saving
+    scan_record = {
+        'domain_name': sanitized_domain,
+        'scan_date': datetime.now().strftime('%Y-%m-%d'),
+        'ip_address': ip_address,
+        'port_status': port_status,
+        'port_cache_age': None if port_cache_age is None else round(port_cache_age),
+        'http_status_code': http_status_code,
+        'http_status_desc': http_status_desc,
+        'additional_info': screenshot_path,
+        'redirected_url': redirected_url,  # Save the redirected URL
+        'redirect_chain': redirect_chain,
+        'page_fingerprint': page_fingerprint,
+        'http_error_type': http_result['error_type'] if http_result else None,
+        'tls_certificate': tls_certificate,
+        'san_group': san_group_key(tls_certificate) if tls_certificate else None,
+        'screenshot_phash': format_hash(screenshot_hash) if screenshot_hash is not None else None,
+        'similar_screenshots': similar_screenshots,
+        'device_screenshots': device_capture['screenshots'] if device_capture else None,
+        'cloaking': device_capture['cloaking'] if device_capture else None,
+        'skipped_stages': plan.skipped,
+        'time_saved_s': round(plan.time_saved, 1),
+        'type_of_phishing': 'N/A',  # Set for the whole run by the classifier in finish_scan
+        'phishing_score': None,
+    }
+
+    return results, scan_record
+
+
+class _Skipped(Exception):
+    """
+    Raised inside a stage's try block when a rule skipped the stage.
+    """
+
+
+def _report_skips(plan, domain, status):
+    """
+    Reports the stages that rules have skipped so far for a domain.
+    """
+    if plan.skipped:
+        skipped = ', '.join(f"{stage} ({rule})" for stage, rule in plan.skipped.items())
+        status(f"Skipping for {domain}: {skipped}")
+
+
+def format_redirect_chain(chain):
+    """
+    Formats redirect hops for the report, e.g. {"Hop 1": "302 http://a/ -> http://b/ (12.0 ms, sets cookies: sid)"}.
+
+    :param chain: Hop dictionaries as returned by HTTP_status.get_http_status.
+    :return: A dictionary of hop labels to one-line descriptions, empty if there was no redirect.
+    """
+    if len(chain) < 2:
+        return {}
+    lines = {}
+    for number, hop in enumerate(chain, start=1):
+        line = f"{hop['status_code']} {hop['url']}"
+        if hop['location']:
+            via = '' if hop['redirect_type'] == 'http' else f" via {hop['redirect_type']}"
+            line += f" -> {hop['location']}{via}"
+        line += f" ({hop['elapsed_ms']} ms"
+        if hop['set_cookies']:
+            line += f", sets cookies: {', '.join(hop['set_cookies'])}"
+        lines[f"Hop {number}"] = line + ")"
+    return lines
+
+
+def format_page_fingerprint(fingerprint):
+    """
+    Formats a page fingerprint for the report.
+
+    :param fingerprint: Dictionary returned by page_fingerprint.fingerprint_page.
+    :return: A dictionary of labels to values.
+    """
+    return {
+        "Title": fingerprint['title'] or "(none)",
+        "Form Actions": ', '.join(fingerprint['form_actions']) or "(none)",
+        "Favicon Hash": fingerprint['favicon_hash'] or "(none)",
+        "Text Hash": fingerprint['text_hash'][:16],
+        "Content Hash": fingerprint['content_hash'][:16],
+        "Body Bytes": f"{fingerprint['body_bytes']}{' (truncated)' if fingerprint['truncated'] else ''}",
+    }
+
+
+def format_tls_certificate(certificate):
+    """
+    Formats a TLS certificate for the report.
+
+    :param certificate: Dictionary returned by tls_certificates.capture_peer_certificate.
+    :return: A dictionary of labels to values.
+    """
+    problems = [label for label, failed in (("hostname mismatch", not certificate['hostname_match']),
+                                             ("expired or not yet valid", certificate['expired']),
+                                             ("self-signed", certificate['self_signed'])) if failed]
+    return {
+        "Subject": certificate['subject'],
+        "Issuer": certificate['issuer'],
+        "SANs": ', '.join(certificate['sans']) or "(none)",
+        "SAN Group": san_group_key(certificate) or "(none)",
+        "Valid From": certificate['not_before'],
+        "Valid To": certificate['not_after'],
+        "SHA-256": certificate['sha256'],
+        "Checks": ', '.join(problems) or "OK",
+    }
+
+
+def new_run_id():
+    """
+    :return: An identifier for a scan run, used to group its rows in the result store.
+    """
+    return datetime.now().strftime('%Y-%m-%d_%H-%M-%S_') + uuid.uuid4().hex[:6]
+
+
+def finish_scan(results_list, scan_results_to_save, config, status=log_status, profiler=None, run_id=None):
+    """
+    Classifies the run's domains, generates the report, and saves the scan results
+    to CSV once every domain is done.
+
+    :param results_list: Aggregated result dictionaries for the report.
+    :param scan_results_to_save: Scan result dictionaries for output storage, one per entry of
+                                 results_list and in the same order.
+    :param config: A dictionary containing the configuration settings.
+    :param status: Callback receiving progress messages. Default logs them (see logging_module.log_status).
+    :param profiler: Optional ScanProfiler recording the report span.
+    :param run_id: The run whose stored results get the classifier's labels. None leaves the store as it is.
+    """
+    # Step 7b: Classify the run's domains in one batch (see phishing_classifier.py)
+    if config.get('classifier', True) and scan_results_to_save:
+        try:
+            with _stage('classify', 'classify_domains', None, profiler):
+                get_classifier(config).label(scan_results_to_save)
+            for results, scan_record in zip(results_list, scan_results_to_save):
+                results["Type of Phishing"] = f"{scan_record['type_of_phishing']} ({scan_record['phishing_score']:.0%})"
+            if run_id is not None:
+                update_run_results(run_id, zip(results_list, scan_results_to_save))
+        except Exception as e:
+            record_error('classify', type(e).__name__)
+            status(f"Failed to classify the scanned domains: {str(e)}")
+
+    # Step 8: Add the run's domains to the lookalike index and generate the report
+    similarity_index = None
+    if config.get('similarity_index', True):
+        try:
+            similarity_index = get_similarity_index(config)
+            similarity_index.add_many(result["Domain Name"] for result in results_list)
+            similarity_index.save()
+        except Exception as e:
+            status(f"Failed to update the domain similarity index: {str(e)}")
+    if results_list:
+        try:
+            report_type = 'pdf' if config.get('report_type') == 'pdf' else 'text'
+            with _stage('report', 'generate_report', None, profiler):
+                generate_report(results_list, report_type=report_type, similarity_index=similarity_index,
+                                cache=get_report_cache(config))
+            status(f"Report generated successfully.")
+        except Exception as e:
+            status(f"Failed to generate report: {str(e)}")
+    else:
+        status("No valid results to report.")
+
+    skipped, domains, seconds = summarize_skips(scan_results_to_save)
+    if skipped:
+        status(f"Stage rules skipped {skipped} stage(s) on {domains} domain(s), saving about {seconds:.0f}s.")
+
+    # Step 9: Save the scan results to CSV
+    try:
+        save_scan_results(scan_results_to_save)
+        status(f"Scan results saved to output storage.")
+    except Exception as e:
+        status(f"Failed to save scan results: {str(e)}")
+
+
+def stop_profiler(profiler, status=log_status):
+    """
+    Stops a profiler started with profiling.start_profiler and reports where its files went.
+
+    :param profiler: A ScanProfiler, or None when profiling is off.
+    :param status: Callback receiving progress messages. Default logs them (see logging_module.log_status).
+    """
+    if profiler is None:
+        return
+    try:
+        paths = profiler.stop()
+        status(f"Profile written to {paths['profile']}, trace written to {paths['trace']}")
+    except OSError as e:
+        status(f"Failed to write profile: {str(e)}")
+
+
+def write_final_snapshot(config, status=log_status):
+    """
+    Writes a final metrics snapshot so the run's numbers survive the process.
+    """
+    snapshot_file = config.get('metrics_snapshot_file', os.path.join('logs', 'metrics_snapshot.json'))
+    if snapshot_file:
+        try:
+            write_snapshot(snapshot_file)
+        except OSError as e:
+            status(f"Failed to write metrics snapshot: {str(e)}")
+
+
+def run_scan(domains, config, headless, status=log_status, run_id=None, progress=None):
+    """
+    Scans a list of domains, generates the report, and saves the results.
+
+    Each domain's result is written to the SQLite result store as soon as it is
+    available; the CSV file and the report are written at the end of the run.
+    When config['profile'] is set to 'cprofile' or 'sampling', the run is profiled
+    and a Chrome-trace file of per-domain stage spans is written to 'profiles/'.
+    Domains that fail for a transient reason (DNS timeout or SERVFAIL, HTTP timeout
+    or connection reset) are retried later from a retry queue (see retry_queue.py).
+
+    :param domains: A list of domains to scan.
+    :param config: A dictionary containing the configuration settings.
+    :param headless: Capture screenshots in a headless browser (fast scan) or a full browser (detailed scan).
+    :param status: Callback receiving progress messages. Default logs them (see logging_module.log_status).
+    :param run_id: Identifier for the run in the result store. Generated if not given.
+    :param progress: Optional callback (domains done, total, domain) called after each domain.
+    :return: A list of result dictionaries, one per resolved domain.
+    """
+    results_list = []
+    scan_results_to_save = []  # List to store scan results for saving
+    run_id = run_id or new_run_id()
+
+    setup_logging(config)
+    start_exporters(config)
+
+    profiler = start_profiler(config, run_id=run_id)
+
+    rules = StageRules.from_config(config)
+    done = []
+
+    def scan(domain, final_attempt):
+        with profile_span(profiler, 'scan_domain', domain):
+            return scan_domain(domain, config, headless, status=status, profiler=profiler, rules=rules,
+                               final_attempt=final_attempt)
+
+    def on_result(domain, results, scan_record):
+        done.append(domain)
+        if progress is not None:
+            progress(len(done), len(domains), domain)
+        if results is None:
+            return
+
+        results_list.append(results)
+        scan_results_to_save.append(scan_record)
+        try:
+            store_scan_result(scan_record, results, run_id=run_id)
+        except Exception as e:
+            status(f"Failed to store result for {domain}: {str(e)}")
+
+        # Step 7: Optional fixed pause between domains; pacing is otherwise left to the rate limiter
+        if config.get('domain_delay', 0):
+            status(f"Waiting before scanning the next domain...")
+            time.sleep(config['domain_delay'])
+
+    try:
+        run_with_retries(domains, scan, on_result, queue=get_retry_queue(config), status=status)
+        flush_port_cache()
+        finish_scan(results_list, scan_results_to_save, config, status=status, profiler=profiler, run_id=run_id)
+
+    except Exception as e:
+        status(f"An unexpected error occurred: {str(e)}")
+
+    stop_profiler(profiler, status=status)
+    write_final_snapshot(config, status=status)
+
+    return results_list
@@ -0,0 +1,269 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Append-only index file; one line per inserted screenshot
+INDEX_FILE = os.path.join('screenshots', 'phash_index.jsonl')
+
+# Default Hamming distance under which two 64-bit dHashes count as near-duplicates
+DEFAULT_MAX_DISTANCE = 6
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+
+def dhash(image, hash_size=8):
+    """
+    Computes the difference hash (dHash) of an image.
+
+    The image is reduced to (hash_size + 1) x hash_size grayscale pixels, and each
+    bit records whether a pixel is brighter than its right-hand neighbour. Pages
+    that differ only in small details (a domain name, a token) get hashes a few
+    bits apart.
+
+    :param image: A PIL image or a path to an image file.
+    :param hash_size: Bits per row and number of rows. Default is 8 (a 64-bit hash).
+    :return: The hash as an int.
+    """
+    if not isinstance(image, Image.Image):
+        with Image.open(image) as opened:
+            return dhash(opened, hash_size)
+
+    pixels = image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for column in range(hash_size):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def hamming_distance(a, b):
+    """
+    :return: The number of differing bits between two hashes.
+    """
+    return bin(a ^ b).count('1')
+
+
+def format_hash(value, hash_size=8):
+    """
+    :return: The hash as a zero-padded hexadecimal string.
+    """
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+def _flip_masks(bits, max_flips):
+    """
+    :return: Every `bits`-wide mask with at most `max_flips` bits set, fewest bits first.
+    """
+    masks = [0]
+    for _ in range(max_flips):
+        masks = sorted(set(masks) | {mask | (1 << bit) for mask in masks for bit in range(bits)},
+                       key=lambda mask: bin(mask).count('1'))
+    return masks
+
+
+class ScreenshotIndex:
+    """
+    Persistent multi-index hash table of screenshot dHashes for near-duplicate lookup.
+
+    Each 64-bit hash is split into BLOCKS blocks, and each block value has its own
+    table. If two hashes differ in at most k bits, at least one of their blocks
+    differs in at most k // BLOCKS bits (pigeonhole), so a search only probes the
+    block values within that many bits of the query's blocks and checks the few
+    candidates it finds. Results are exact.
+
+    Insertions are appended to a JSON-lines file, so saving never rewrites it and
+    other processes' additions are picked up by refresh(). Re-indexing a path
+    replaces its earlier hash in search results.
+    """
+
+    BLOCKS = 4
+
+    def __init__(self, index_file=INDEX_FILE, hash_bits=64):
+        """
+        :param index_file: Path to the index file, or None to keep the index in memory only.
+        :param hash_bits: Bits per hash. Default is 64 (an 8x8 dHash).
+        """
+        self.index_file = index_file
+        self.block_bits = hash_bits // self.BLOCKS
+        self.block_mask = (1 << self.block_bits) - 1
+        self.hashes = []
+        self.paths = []
+        self.latest = {}
+        self.tables = [{} for _ in range(self.BLOCKS)]
+        self._masks = {}
+        self._offset = 0
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def __len__(self):
+        return len(self.latest)
+
+    def _blocks(self, value):
+        return [(value >> (block * self.block_bits)) & self.block_mask for block in range(self.BLOCKS)]
+
+    def _insert(self, value, path):
+        index = len(self.hashes)
+        self.hashes.append(value)
+        self.paths.append(path)
+        self.latest[path] = index
+        for table, block in zip(self.tables, self._blocks(value)):
+            table.setdefault(block, []).append(index)
+        return index
+
+    def refresh(self):
+        """
+        Loads entries appended to the index file since the last load, including
+        those written by other processes.
+
+        :return: The number of entries loaded.
+        """
+        if not self.index_file or not os.path.exists(self.index_file):
+            return 0
+        loaded = 0
+        with self._lock, open(self.index_file, 'r') as file:
+            file.seek(self._offset)
+            for line in file:
+                if not line.endswith('\n'):
+                    # A line still being written by another process
+                    break
+                self._offset += len(line.encode('utf-8'))
+                entry = json.loads(line)
+                value = int(entry['hash'], 16)
+                current = self.latest.get(entry['path'])
+                if current is not None and self.hashes[current] == value:
+                    # Already in memory (our own write, or a repeated entry)
+                    continue
+                self._insert(value, entry['path'])
+                loaded += 1
+        return loaded
+
+    def add(self, path, value=None):
+        """
+        Hashes a screenshot and inserts it into the index.
+
+        :param path: Path to the screenshot, or any identifier (such as a domain) when `value` is given.
+        :param value: Precomputed dHash. Computed from the file if not given.
+        :return: The dHash as an int.
+        """
+        if value is None:
+            value = dhash(path)
+        with self._lock:
+            current = self.latest.get(path)
+            if current is not None and self.hashes[current] == value:
+                return value
+            self._insert(value, path)
+            if self.index_file:
+                os.makedirs(os.path.dirname(self.index_file) or '.', exist_ok=True)
+                with open(self.index_file, 'a') as file:
+                    file.write(json.dumps({'hash': format_hash(value), 'path': path}) + '\n')
+        return value
+
+    def find_similar(self, query, max_distance=DEFAULT_MAX_DISTANCE, limit=None):
+        """
+        Finds indexed screenshots within a Hamming distance of a screenshot or hash.
+
+        :param query: A path to an image, or a dHash int.
+        :param max_distance: Largest Hamming distance to include. Default is 6 (of 64 bits).
+        :param limit: Maximum number of results. Default is no limit.
+        :return: A list of (distance, path) tuples, closest first.
+        """
+        value = query if isinstance(query, int) else dhash(query)
+        flips = max_distance // self.BLOCKS
+        with self._lock:
+            masks = self._masks.get(flips)
+            if masks is None:
+                masks = self._masks[flips] = _flip_masks(self.block_bits, flips)
+
+            if len(masks) * self.BLOCKS > len(self.hashes):
+                # Probing would cost more than checking every hash
+                candidates = range(len(self.hashes))
+            else:
+                candidates = set()
+                for table, block in zip(self.tables, self._blocks(value)):
+                    for mask in masks:
+                        candidates.update(table.get(block ^ mask, ()))
+
+            matches = []
+            for index in candidates:
+                distance = hamming_distance(value, self.hashes[index])
+                if distance <= max_distance and self.latest.get(self.paths[index]) == index:
+                    matches.append((distance, self.paths[index]))
+        matches.sort()
+        return matches[:limit] if limit else matches
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_screenshot_index(config=None):
+    """
+    Returns the process-wide screenshot index, loaded from config['screenshot_index_file'] on first use.
+
+    :param config: A dictionary containing the configuration settings.
+    :return: The shared ScreenshotIndex.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ScreenshotIndex((config or {}).get('screenshot_index_file', INDEX_FILE))
+        return _shared
+
+
+def index_directory(index, directory):
+    """
+    Adds every image under a directory to the index (used to backfill existing screenshots).
+
+    :return: The number of images indexed.
+    """
+    count = 0
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(root, name)
+                try:
+                    index.add(path)
+                    count += 1
+                except OSError as e:
+                    logger.warning("Skipping unreadable image %s: %s", path, e)
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perceptual-hash index of screenshots.")
+    parser.add_argument('--index', default=INDEX_FILE, help="Index file. Default: %(default)s")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="Index every image in a directory.")
+    build.add_argument('directory', nargs='?', default='screenshots')
+
+    similar = commands.add_parser('similar', help="List indexed screenshots similar to an image.")
+    similar.add_argument('image')
+    similar.add_argument('-k', '--max-distance', type=int, default=DEFAULT_MAX_DISTANCE)
+
+    args = parser.parse_args(argv)
+    index = ScreenshotIndex(args.index)
+
+    if args.command == 'build':
+        started = time.monotonic()
+        count = index_directory(index, args.directory)
+        print(f"Indexed {count} image(s) in {time.monotonic() - started:.1f}s; {len(index)} in the index.")
+    else:
+        started = time.monotonic()
+        matches = index.find_similar(args.image, args.max_distance)
+        print(f"{len(matches)} match(es) in {(time.monotonic() - started) * 1000:.1f} ms:")
+        for distance, path in matches:
+            print(f"  {distance:2d}  {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
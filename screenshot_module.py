@@ -5,67 +5,474 @@ from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
+from selenium.common.exceptions import TimeoutException
 import time
 import os
+import io
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from urllib.parse import urlparse
+from PIL import Image
+
+from page_fingerprint import parse_page
 
 # User-Agent strings for different devices
 USER_AGENTS = {
     'android': 'Mozilla/5.0 (Linux; Android 13; SM-S918B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.5481.77 Mobile Safari/537.36',
-    'apple': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.0 Mobile/15E148 Safari/604.1'
+    'apple': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.0 Mobile/15E148 Safari/604.1',
+    'desktop': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.5481.77 Safari/537.36'
+}
+
+# Device profiles for multi-device capture: user agent, viewport (CSS pixels), device pixel ratio, touch/mobile
+DEVICE_PROFILES = {
+    'android': {'user_agent': USER_AGENTS['android'], 'viewport': (412, 915), 'scale': 2.625, 'mobile': True},
+    'apple': {'user_agent': USER_AGENTS['apple'], 'viewport': (390, 844), 'scale': 3, 'mobile': True},
+    'desktop': {'user_agent': USER_AGENTS['desktop'], 'viewport': (1280, 800), 'scale': 1, 'mobile': False},
+}
+
+logger = logging.getLogger(__name__)
+
+# Default browser viewport (width, height) in CSS pixels
+DEFAULT_VIEWPORT = (1280, 800)
+
+# Encodings for stored screenshots and their file extensions
+IMAGE_FORMATS = {'webp': '.webp', 'jpeg': '.jpg', 'png': '.png'}
+
+# Captures remembered per domain in the manifest
+MANIFEST_HISTORY = 10
+
+# Seconds a single capture may take, page load included, before the browser is killed
+DEFAULT_DEADLINE = 30
+
+# Lean capture: the page counts as loaded once at most NETWORK_IDLE_INFLIGHT requests
+# have been in flight for DEFAULT_IDLE_MS milliseconds
+DEFAULT_IDLE_MS = 500
+NETWORK_IDLE_INFLIGHT = 2
+
+# URL patterns blocked through DevTools in lean capture, by category
+BLOCKED_RESOURCES = {
+    'media': ['*.mp4', '*.webm', '*.ogg', '*.ogv', '*.mp3', '*.m4a', '*.wav', '*.m3u8', '*.mpd'],
+    'fonts': ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot'],
+    'trackers': ['*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*googlesyndication.com*',
+                 '*connect.facebook.net*', '*hotjar.com*', '*clarity.ms*', '*mc.yandex.ru*', '*scorecardresearch.com*',
+                 '*quantserve.com*', '*segment.io*', '*cdn.segment.com*', '*mixpanel.com*', '*newrelic.com*',
+                 '*nr-data.net*', '*criteo.com*', '*taboola.com*', '*outbrain.com*'],
 }
 
-def capture_domain_screenshot(domain_url, output_dir='screenshots', screenshot_file=None, device='android', headless=False):
+_manifest_lock = threading.Lock()
+
+def manifest_path(output_dir='screenshots'):
+    return os.path.join(output_dir, 'manifest.jsonl')
+
+def _fold_capture(manifest, domain, capture):
+    history = [entry for entry in manifest.get(domain, []) if entry['hash'] != capture['hash']]
+    manifest[domain] = (history + [capture])[-MANIFEST_HISTORY:]
+
+def load_manifest(output_dir='screenshots'):
     """
-    Function to capture a screenshot with user-agent simulation and headless mode control.
+    Loads the screenshot manifest, which maps each domain to its captures (newest last).
+
+    The manifest file is append-only, one line per capture, so processes scanning in
+    parallel add their captures without rewriting (and losing) each other's. Captures
+    in a manifest.json written by earlier versions come first.
+
+    :param output_dir: Screenshot directory.
+    :return: A dictionary {domain: [{'hash', 'path', 'url', 'format', 'width', 'height', 'captured_at'}, ...]}.
     """
-    # Ensure output directory exists
-    os.makedirs(output_dir, exist_ok=True)
+    manifest = {}
+    try:
+        with open(os.path.join(output_dir, 'manifest.json'), 'r') as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        pass
+    except ValueError as e:
+        logger.warning("Ignoring unreadable screenshot manifest: %s", e)
+
+    try:
+        with open(manifest_path(output_dir), 'r') as file:
+            for line in file:
+                if not line.endswith('\n'):
+                    # A line still being written by another process
+                    break
+                try:
+                    capture = json.loads(line)
+                except ValueError as e:
+                    logger.warning("Skipping unreadable screenshot manifest line: %s", e)
+                    continue
+                _fold_capture(manifest, capture.pop('domain'), capture)
+    except FileNotFoundError:
+        pass
+    return manifest
 
-    # If no screenshot file name is provided, default to domain name
-    if screenshot_file is None:
-        screenshot_file = domain_url.replace("https://", "").replace("http://", "").replace("/", "_") + ".png"
-    screenshot_path = os.path.join(output_dir, screenshot_file)
+def _record_capture(output_dir, domain, capture):
+    # One appended line per capture; other processes' lines are never rewritten
+    line = json.dumps(dict(capture, domain=domain)) + '\n'
+    with _manifest_lock, open(manifest_path(output_dir), 'a') as file:
+        file.write(line)
 
+def store_screenshot(png_data, domain_url, output_dir='screenshots', image_format='webp', quality=80):
+    """
+    Encodes a screenshot and stores it under its content hash.
+
+    The file goes to <output_dir>/<first two hex digits>/<hash><extension>, so the same
+    page captured for many domains (or many times) is stored once. The manifest
+    records which hash each domain produced.
+
+    :param png_data: PNG bytes as returned by the browser.
+    :param domain_url: The captured URL; its host is the manifest key.
+    :param output_dir: Screenshot directory.
+    :param image_format: 'webp' (default), 'jpeg', or 'png'.
+    :param quality: Encoder quality for WebP and JPEG (1-100). Default is 80.
+    :return: The path of the stored image.
+    """
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported screenshot format: {image_format}")
+
+    with Image.open(io.BytesIO(png_data)) as image:
+        if image_format == 'png':
+            data, size = png_data, image.size
+        else:
+            buffer = io.BytesIO()
+            image.convert('RGB').save(buffer, format=image_format.upper(), quality=quality)
+            data, size = buffer.getvalue(), image.size
+
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    directory = os.path.join(output_dir, digest[:2])
+    path = os.path.join(directory, digest + IMAGE_FORMATS[image_format])
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        temp_file = f"{path}.{os.getpid()}.tmp"
+        with open(temp_file, 'wb') as file:
+            file.write(data)
+        os.replace(temp_file, path)
+
+    domain = domain_url.replace("https://", "").replace("http://", "").strip('/')
+    _record_capture(output_dir, domain, {
+        'hash': digest,
+        'path': path,
+        'url': domain_url,
+        'format': image_format,
+        'width': size[0],
+        'height': size[1],
+        'bytes': len(data),
+        'captured_at': datetime.now().isoformat(timespec='seconds'),
+    })
+    return path
+
+def migrate_legacy_screenshots(output_dir='screenshots', image_format='webp', quality=80, remove=False):
+    """
+    Moves PNG screenshots named after their URL (e.g. "rpc.dqmco.top.png" and "rpc.dqmco.top_.png")
+    into the content-addressed store and manifest.
+
+    :param output_dir: Screenshot directory.
+    :param image_format: Encoding for the stored copies.
+    :param quality: Encoder quality for WebP and JPEG.
+    :param remove: Delete each legacy file once it is stored. Default is False.
+    :return: The number of screenshots migrated.
+    """
+    migrated = 0
+    for name in sorted(os.listdir(output_dir)):
+        legacy_path = os.path.join(output_dir, name)
+        if not name.lower().endswith('.png') or not os.path.isfile(legacy_path):
+            continue
+        with open(legacy_path, 'rb') as file:
+            png_data = file.read()
+        # Variant names end with "_" where the URL had a trailing slash
+        store_screenshot(png_data, name[:-len('.png')].rstrip('_'), output_dir, image_format, quality)
+        if remove:
+            os.remove(legacy_path)
+        migrated += 1
+    return migrated
+
+def _block_resources(driver, categories):
+    unknown = [category for category in categories if category not in BLOCKED_RESOURCES]
+    if unknown:
+        logger.warning("Ignoring unknown resource categories to block: %s", ', '.join(unknown))
+    patterns = [pattern for category in categories for pattern in BLOCKED_RESOURCES.get(category, [])]
+    if patterns:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+    return patterns
+
+def wait_for_network_idle(driver, deadline, idle_ms=DEFAULT_IDLE_MS, max_inflight=NETWORK_IDLE_INFLIGHT):
+    """
+    Waits until the page has had at most `max_inflight` requests in flight for `idle_ms`
+    milliseconds, tracked from the DevTools network events in the browser's performance log.
+
+    :param driver: A Chrome WebDriver started with the 'performance' log enabled.
+    :param deadline: time.monotonic() value after which waiting stops.
+    :param idle_ms: Quiet period in milliseconds. Default is 500.
+    :param max_inflight: Requests allowed to stay open (long polls, beacons). Default is 2.
+    :return: True if the network went idle, False if the deadline came first.
+    """
+    inflight = set()
+    quiet_since = time.monotonic()
+    while time.monotonic() < deadline:
+        for entry in driver.get_log('performance'):
+            message = json.loads(entry['message'])['message']
+            method, request_id = message.get('method'), message.get('params', {}).get('requestId')
+            if method == 'Network.requestWillBeSent':
+                inflight.add(request_id)
+            elif method in ('Network.loadingFinished', 'Network.loadingFailed'):
+                inflight.discard(request_id)
+            else:
+                continue
+            if len(inflight) > max_inflight:
+                quiet_since = time.monotonic()
+        if len(inflight) > max_inflight:
+            quiet_since = time.monotonic()
+        elif (time.monotonic() - quiet_since) * 1000 >= idle_ms:
+            return True
+        time.sleep(0.05)
+    return False
+
+def _kill_browser(driver, domain_url):
+    logger.warning("Capture of %s passed its deadline; killing the browser", domain_url, extra={'url': domain_url})
+    try:
+        driver.service.process.kill()
+    except Exception as e:
+        logger.debug("Could not kill the browser for %s: %s", domain_url, e)
+
+def _start_browser(user_agent, headless, viewport, lean):
     # Set up Chrome options to ignore SSL certificate errors and set user-agent
     chrome_options = Options()
     chrome_options.headless = headless  # Control headless mode
     chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument(f'user-agent={USER_AGENTS[device]}')
+    chrome_options.add_argument(f'user-agent={user_agent}')
     chrome_options.add_argument("--ignore-certificate-errors")
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-extensions")  # Disable extensions
-    chrome_options.add_argument("--start-maximized")  # Maximize browser window
+    chrome_options.add_argument(f"--window-size={viewport[0]},{viewport[1]}")  # Fixed viewport instead of maximized
+    if lean:
+        chrome_options.page_load_strategy = 'eager'
+        chrome_options.add_argument("--autoplay-policy=user-gesture-required")
+        # The DevTools network events drive the network-idle wait
+        chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    return webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=chrome_options)
+
+def _start_watchdog(driver, domain_url, seconds):
+    # Give a stopped page a few seconds to be captured before killing a hung renderer
+    watchdog = threading.Timer(seconds + 5, _kill_browser, args=(driver, domain_url))
+    watchdog.daemon = True
+    watchdog.start()
+    return watchdog
+
+def _load_page(driver, domain_url, limiter, limiter_key, lean, deadline, idle_ms):
+    """
+    Loads a page and waits until it is ready to capture, stopping it at `deadline`
+    (a time.monotonic() value) if it is still loading.
+    """
+    remaining = max(deadline - time.monotonic(), 1)
+    driver.set_page_load_timeout(remaining)
+    driver.set_script_timeout(remaining)
+    if lean:
+        # Drop network events left over from a page loaded earlier in this session
+        driver.get_log('performance')
+
+    # Load the domain URL
+    if limiter is not None:
+        limiter.acquire(limiter_key)
+    try:
+        driver.get(domain_url)
+    except TimeoutException:
+        if limiter is not None:
+            limiter.record(limiter_key, 'timeout')
+        logger.warning("Page load for %s passed its deadline; capturing it as it is", domain_url,
+                       extra={'url': domain_url})
+        driver.execute_script("window.stop();")
+    except Exception:
+        if limiter is not None:
+            limiter.record(limiter_key, 'timeout')
+        raise
+    else:
+        if limiter is not None:
+            limiter.record(limiter_key, 'ok')
+
+    # Wait for the page to load or redirection to complete
+    if lean:
+        if not wait_for_network_idle(driver, deadline, idle_ms):
+            logger.debug("Network for %s never went idle; capturing at the deadline", domain_url)
+    else:
+        remaining = max(deadline - time.monotonic(), 0.1)
+        WebDriverWait(driver, min(10, remaining)).until(EC.presence_of_element_located((By.TAG_NAME, 'body')))
+
+def _quit_browser(driver, watchdog, domain_url):
+    if watchdog is not None:
+        watchdog.cancel()
+    if driver:
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.debug("Browser for %s was already gone: %s", domain_url, e)
+        logger.debug("Browser closed.")
+
+def capture_domain_screenshot(domain_url, output_dir='screenshots', screenshot_file=None, device='android', headless=False,
+                              limiter=None, limiter_key=None, viewport=DEFAULT_VIEWPORT, image_format='webp',
+                              quality=80, lean=False, deadline=DEFAULT_DEADLINE, block=tuple(BLOCKED_RESOURCES),
+                              idle_ms=DEFAULT_IDLE_MS):
+    """
+    Function to capture a screenshot with user-agent simulation and headless mode control.
+
+    The capture is stored content-addressed (see store_screenshot) unless an explicit
+    `screenshot_file` name is given, in which case a PNG is written under that name.
+
+    When a shared rate limiter is given, the page load waits for a token for
+    `limiter_key` (normally the resolved IP) and reports whether it loaded.
+
+    In lean mode the page is loaded with the 'eager' strategy (the browser returns at
+    DOMContentLoaded instead of waiting for every resource), the resource categories in
+    `block` are blocked through DevTools, and the screenshot is taken as soon as the
+    network goes idle (see wait_for_network_idle). In either mode a page that is still
+    loading at the deadline is stopped and captured as it is, and a browser that is
+    still busy shortly after the deadline is killed.
+
+    :param viewport: Browser window size (width, height). Default is 1280x800.
+    :param image_format: 'webp' (default), 'jpeg', or 'png'.
+    :param quality: Encoder quality for WebP and JPEG. Default is 80.
+    :param lean: Use the lean capture described above. Default is False.
+    :param deadline: Seconds the whole capture may take. Default is 30.
+    :param block: Categories of BLOCKED_RESOURCES to block in lean mode. Default is all of them.
+    :param idle_ms: Quiet network period in milliseconds that ends a lean page load. Default is 500.
+    :return: The path of the stored screenshot, or None if the capture failed.
+    """
+    # Ensure output directory exists
+    os.makedirs(output_dir, exist_ok=True)
+
+    screenshot_path = os.path.join(output_dir, screenshot_file) if screenshot_file else None
 
     # Initialize the Chrome WebDriver
     driver = None
+    watchdog = None
+    started = time.monotonic()
     try:
-        print(f"Opening browser for {domain_url} with {device} device simulation...")
-        driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=chrome_options)
+        logger.info("Opening browser for %s with %s device simulation...", domain_url, device)
+        driver = _start_browser(USER_AGENTS[device], headless, viewport, lean)
+        watchdog = _start_watchdog(driver, domain_url, max(deadline - (time.monotonic() - started), 1))
+        if lean and block:
+            _block_resources(driver, block)
+        _load_page(driver, domain_url, limiter, limiter_key, lean, started + deadline, idle_ms)
 
-        # Load the domain URL
-        driver.get(domain_url)
+        # Capture the screenshot and save it
+        if screenshot_file:
+            driver.save_screenshot(screenshot_path)
+        else:
+            screenshot_path = store_screenshot(driver.get_screenshot_as_png(), domain_url, output_dir,
+                                               image_format=image_format, quality=quality)
+        logger.info("Screenshot successfully saved to %s in %.1fs", screenshot_path, time.monotonic() - started,
+                    extra={'url': domain_url, 'screenshot': screenshot_path})
 
-        # Wait for the page to load or redirection to complete
-        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.TAG_NAME, 'body')))
+    except Exception as e:
+        logger.error("Failed to capture screenshot for %s: %s", domain_url, e, extra={'url': domain_url})
 
-        # Capture the screenshot and save it
-        driver.save_screenshot(screenshot_path)
-        print(f"Screenshot successfully saved to {screenshot_path}")
+    finally:
+        _quit_browser(driver, watchdog, domain_url)
+
+    return screenshot_path
+
+def _page_signature(driver):
+    # What the device was served: where it ended up, and the title and text of the page
+    page = parse_page(driver.page_source.encode('utf-8'), 'utf-8')
+    return {'final_url': driver.current_url, 'title': page['title'], 'text_hash': page['text_hash']}
 
-        # Keep the browser open for 10 more seconds after the screenshot is taken
-        print("Waiting 10 seconds before closing the browser...")
-        time.sleep(10)
+def compare_device_pages(signatures):
+    """
+    Compares what each device profile was served.
+
+    Responsive pages serve the same document to every device and only lay it out
+    differently, so a different final URL, title, or page text between devices
+    means the server chose the content by device (cloaking).
+
+    :param signatures: A dictionary {device: {'final_url', 'title', 'text_hash'}}.
+    :return: The names of the fields that differ between devices ('final_url' compares host and path only).
+    """
+    differences = []
+    for field in ('final_url', 'title', 'text_hash'):
+        values = set()
+        for signature in signatures.values():
+            value = signature.get(field)
+            if field == 'final_url' and value:
+                parsed = urlparse(value)
+                value = (parsed.hostname, parsed.path.rstrip('/'))
+            values.add(value)
+        if len(values) > 1:
+            differences.append(field)
+    return differences
+
+def capture_multi_device(domain_url, devices=('android', 'apple', 'desktop'), output_dir='screenshots', headless=True,
+                         limiter=None, limiter_key=None, image_format='webp', quality=80, lean=False,
+                         deadline=DEFAULT_DEADLINE, block=tuple(BLOCKED_RESOURCES), idle_ms=DEFAULT_IDLE_MS):
+    """
+    Captures a page as several device profiles in one browser session.
+
+    The browser is started once. Before each load, DevTools overrides switch the user
+    agent, viewport, device pixel ratio, and touch support to the next profile in
+    DEVICE_PROFILES, and cookies are cleared so one device's visit does not shape the
+    next. The HTTP cache is kept, so static resources are downloaded once.
+
+    :param domain_url: The URL to capture.
+    :param devices: Names of DEVICE_PROFILES to capture, in order.
+    :param deadline: Seconds each device's page load and capture may take. Default is 30.
+    :return: A dictionary with 'screenshots' ({device: path, or None if that capture failed}),
+             'pages' ({device: {'final_url', 'title', 'text_hash'}}), 'differences' (see
+             compare_device_pages), and 'cloaking' (True if the devices were served different content).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    unknown = [device for device in devices if device not in DEVICE_PROFILES]
+    if unknown:
+        raise ValueError(f"Unknown device profile(s): {', '.join(unknown)}")
+
+    screenshots = {device: None for device in devices}
+    pages = {}
+    first = DEVICE_PROFILES[devices[0]]
+    driver = None
+    watchdog = None
+    started = time.monotonic()
+    try:
+        logger.info("Opening browser for %s to capture %s...", domain_url, ', '.join(devices))
+        driver = _start_browser(first['user_agent'], headless, first['viewport'], lean)
+        watchdog = _start_watchdog(driver, domain_url, deadline * len(devices))
+        driver.execute_cdp_cmd('Network.enable', {})
+        if lean and block:
+            _block_resources(driver, block)
+
+        for device in devices:
+            profile = DEVICE_PROFILES[device]
+            device_started = time.monotonic()
+            try:
+                driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+                driver.execute_cdp_cmd('Emulation.setUserAgentOverride', {'userAgent': profile['user_agent']})
+                driver.execute_cdp_cmd('Emulation.setDeviceMetricsOverride', {
+                    'width': profile['viewport'][0],
+                    'height': profile['viewport'][1],
+                    'deviceScaleFactor': profile['scale'],
+                    'mobile': profile['mobile'],
+                })
+                driver.execute_cdp_cmd('Emulation.setTouchEmulationEnabled', {'enabled': profile['mobile']})
+                _load_page(driver, domain_url, limiter, limiter_key, lean, device_started + deadline, idle_ms)
+                pages[device] = _page_signature(driver)
+                screenshots[device] = store_screenshot(driver.get_screenshot_as_png(), domain_url, output_dir,
+                                                       image_format=image_format, quality=quality)
+                logger.info("Screenshot of %s as %s saved to %s in %.1fs", domain_url, device, screenshots[device],
+                            time.monotonic() - device_started,
+                            extra={'url': domain_url, 'device': device, 'screenshot': screenshots[device]})
+            except Exception as e:
+                logger.error("Failed to capture %s as %s: %s", domain_url, device, e,
+                             extra={'url': domain_url, 'device': device})
 
     except Exception as e:
-        print(f"Failed to capture screenshot for {domain_url}: {str(e)}")
+        logger.error("Failed to capture screenshots for %s: %s", domain_url, e, extra={'url': domain_url})
 
     finally:
-        # Ensure the browser is closed after 10 seconds
-        if driver:
-            driver.quit()
-            print("Browser closed.")
+        _quit_browser(driver, watchdog, domain_url)
 
-    return screenshot_path
+    differences = compare_device_pages(pages) if len(pages) > 1 else []
+    if differences:
+        logger.warning("%s serves different content by device (%s differ)", domain_url, ', '.join(differences),
+                       extra={'url': domain_url, 'differences': differences})
+    return {'screenshots': screenshots, 'pages': pages, 'differences': differences, 'cloaking': bool(differences)}
 
 # Example usage: Capture screenshots for multiple domains with different devices
 if __name__ == "__main__":
@@ -73,10 +480,6 @@ if __name__ == "__main__":
     domains = ["https://www.fla-sh.cc"]
 
     for domain in domains:
-        # Capture screenshot as Samsung Galaxy S23 (Android)
-        capture_domain_screenshot(domain, device='android', headless=True)  # Fast Scan (Headless)
-        time.sleep(1)  # Add a short delay between screenshots
-        
-        # Capture screenshot as iPhone (Apple)
-        capture_domain_screenshot(domain, device='apple', headless=False)  # Detailed Scan (Full Browser)
-        time.sleep(1)  # Add a short delay between screenshots
+        # Capture the page as Samsung Galaxy S23, iPhone, and desktop Chrome in one browser session
+        capture = capture_multi_device(domain, devices=('android', 'apple', 'desktop'), headless=True, lean=True)
+        print(capture['screenshots'], "cloaking" if capture['cloaking'] else "same content on every device")
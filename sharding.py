@@ -0,0 +1,249 @@
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import time
+
+from IP_address import canonical_domain
+from logging_module import log_status
+
+logger = logging.getLogger(__name__)
+
+# Virtual nodes per shard on the hash ring; more nodes give a more even split
+VIRTUAL_NODES = 64
+
+# Seconds between the metrics a shard sends to the coordinator
+METRICS_INTERVAL = 5
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping hosts to shards.
+
+    The same host always lands on the same shard, so domains on one host (and
+    therefore, usually, one IP) are scanned, deduplicated, and cached by a single
+    process. Changing the shard count only moves about 1/N of the hosts.
+    """
+
+    def __init__(self, shards, virtual_nodes=VIRTUAL_NODES):
+        """
+        :param shards: Number of shards.
+        :param virtual_nodes: Points per shard on the ring. Default is 64.
+        """
+        self.shards = shards
+        self._ring = sorted(
+            (_hash(f"shard-{shard}-{node}"), shard)
+            for shard in range(shards) for node in range(virtual_nodes)
+        )
+        self._keys = [point for point, _ in self._ring]
+
+    def shard_for(self, domain):
+        """
+        :param domain: A domain name or URL.
+        :return: The shard index responsible for the domain's host.
+        """
+        index = bisect.bisect(self._keys, _hash(canonical_domain(domain))) % len(self._ring)
+        return self._ring[index][1]
+
+
+def shard_domains(domains, shards):
+    """
+    Splits a domain list into shards by consistent hash of the host.
+
+    :param domains: A list of domains.
+    :param shards: Number of shards.
+    :return: A list of `shards` domain lists, each in input order.
+    """
+    ring = HashRing(shards)
+    buckets = [[] for _ in range(shards)]
+    for domain in domains:
+        buckets[ring.shard_for(domain)].append(domain)
+    return buckets
+
+
+def _shard_worker(shard_id, domains, config, headless, run_id, events):
+    """
+    Entry point of a shard process: runs the pipeline over its domains and writes
+    each result to the shared result store.
+    """
+    from logging_module import setup_logging, process_log_config
+    from metrics import registry
+    from output_storage import store_scan_result
+    from port_cache import flush_port_cache
+    from profiling import start_profiler, profile_span
+    from scanner import scan_domain, stop_profiler
+    from stage_rules import StageRules
+    from retry_queue import run_with_retries, get_retry_queue
+
+    # Each shard logs to its own file so rotation never races between processes
+    setup_logging(process_log_config(config, f"shard{shard_id}"))
+
+    def status(message):
+        events.put(('status', shard_id, message))
+
+    rules = StageRules.from_config(config)
+    # Every shard profiles itself into its own files, named after the run and the shard
+    profiler = start_profiler(config, run_id=run_id, label=f"shard{shard_id}")
+
+    def scan(domain, final_attempt):
+        with profile_span(profiler, 'scan_domain', domain):
+            return scan_domain(domain, config, headless, status=status, profiler=profiler, rules=rules,
+                               final_attempt=final_attempt)
+
+    # The coordinator folds each shard's metrics into its own registry, keyed by process
+    metrics_sent = time.monotonic()
+
+    def send_metrics():
+        events.put(('metrics', shard_id, (os.getpid(), registry.export_state())))
+
+    def on_result(domain, results, scan_record):
+        nonlocal metrics_sent
+        if results is not None:
+            store_scan_result(scan_record, results, run_id=run_id)
+        events.put(('done', shard_id, domain))
+        if time.monotonic() - metrics_sent >= METRICS_INTERVAL:
+            send_metrics()
+            metrics_sent = time.monotonic()
+        time.sleep(config.get('domain_delay', 0))
+
+    try:
+        run_with_retries(domains, scan, on_result, queue=get_retry_queue(config), status=status)
+    finally:
+        flush_port_cache()
+        stop_profiler(profiler, status=status)
+        send_metrics()
+
+
+def run_sharded_scan(domains, config, headless, shards=None, status=log_status, max_restarts=3):
+    """
+    Scans domains in several worker processes and merges their results.
+
+    Domains are split across shards by consistent hash of the host. Every shard
+    runs its own pipeline and writes to the shared SQLite result store. This
+    coordinator relays progress, respawns crashed shards with the domains they
+    had not finished, then builds the report and CSV from the stored results.
+    Shards send their metrics every few seconds and when they finish; the
+    coordinator adds them to its own registry, so /metrics and the snapshot
+    cover the whole run.
+    With config['profile'] set, each shard writes its own profile and trace,
+    named after the run and the shard (see profiling.ScanProfiler).
+
+    :param domains: A list of domains to scan.
+    :param config: A dictionary containing the configuration settings.
+    :param headless: Capture screenshots in a headless browser (fast scan) or a full browser (detailed scan).
+    :param shards: Number of worker processes. Defaults to config['shards'] or the CPU count.
+    :param status: Callback receiving progress messages. Default logs them (see logging_module.log_status).
+    :param max_restarts: How many times a crashed shard is respawned. Default is 3.
+    :return: A list of result dictionaries, one per resolved domain.
+    """
+    from logging_module import setup_logging
+    from metrics import registry, start_exporters
+    from output_storage import load_run_results
+    from profiling import start_profiler
+    from scanner import finish_scan, new_run_id, stop_profiler, write_final_snapshot
+
+    setup_logging(config)
+    start_exporters(config)
+
+    shards = shards or config.get('shards') or multiprocessing.cpu_count()
+    run_id = new_run_id()
+    # 'spawn' keeps Qt and scapy state from the parent out of the workers
+    context = multiprocessing.get_context('spawn')
+    events = context.Queue()
+
+    pending = {shard_id: list(shard) for shard_id, shard in enumerate(shard_domains(domains, shards)) if shard}
+    restarts = {shard_id: 0 for shard_id in pending}
+    processes = {}
+    shard_metrics = {}  # (shard, pid) -> metrics state merged last
+
+    def merge_metrics(shard_id, payload):
+        pid, state = payload
+        registry.merge(state, previous=shard_metrics.get((shard_id, pid)))
+        shard_metrics[(shard_id, pid)] = state
+
+    def spawn(shard_id):
+        process = context.Process(
+            target=_shard_worker, name=f'scan-shard-{shard_id}',
+            args=(shard_id, pending[shard_id], config, headless, run_id, events),
+        )
+        process.start()
+        processes[shard_id] = process
+
+    for shard_id, shard in pending.items():
+        status(f"Shard {shard_id}: {len(shard)} domain(s)")
+        spawn(shard_id)
+
+    total = len(domains)
+    completed = 0
+    while processes:
+        try:
+            kind, shard_id, payload = events.get(timeout=0.5)
+            if kind == 'status':
+                status(f"[shard {shard_id}] {payload}")
+            elif kind == 'done':
+                pending[shard_id].remove(payload)
+                completed += 1
+                status(f"Progress: {completed}/{total} domains")
+            elif kind == 'metrics':
+                merge_metrics(shard_id, payload)
+            continue
+        except queue.Empty:
+            pass
+
+        for shard_id, process in list(processes.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del processes[shard_id]
+            if not pending[shard_id]:
+                continue
+            if restarts[shard_id] < max_restarts:
+                restarts[shard_id] += 1
+                status(f"Shard {shard_id} exited with code {process.exitcode}; respawning with "
+                       f"{len(pending[shard_id])} remaining domain(s) (restart {restarts[shard_id]}/{max_restarts})")
+                spawn(shard_id)
+            else:
+                status(f"Shard {shard_id} failed {max_restarts} times; giving up on "
+                       f"{len(pending[shard_id])} domain(s)")
+                logger.error("Shard %d abandoned", shard_id,
+                             extra={'shard': shard_id, 'domains': pending[shard_id]})
+
+    # Drain progress messages sent just before the last workers exited
+    while True:
+        try:
+            kind, shard_id, payload = events.get_nowait()
+        except queue.Empty:
+            break
+        if kind == 'status':
+            status(f"[shard {shard_id}] {payload}")
+        elif kind == 'metrics':
+            merge_metrics(shard_id, payload)
+
+    stored = load_run_results(run_id)
+    # A shard that crashed after storing a result but before reporting it will have
+    # scanned that domain again; keep the latest result per domain.
+    merged = {}
+    for results, scan_record in stored:
+        merged[scan_record.get('domain_name')] = (results, scan_record)
+    results_list = [results for results, _ in merged.values() if results is not None]
+    scan_results_to_save = [scan_record for results, scan_record in merged.values() if results is not None]
+
+    # The shards profile the scanning; the coordinator profiles the report
+    profiler = start_profiler(config, run_id=run_id, label='coordinator')
+    finish_scan(results_list, scan_results_to_save, config, status=status, profiler=profiler, run_id=run_id)
+    stop_profiler(profiler, status=status)
+    write_final_snapshot(config, status=status)
+    return results_list
+
+
+# Example usage within the module (optional)
+if __name__ == "__main__":
+    sample = ["example.com", "www.example.com", "example.org", "rpc.dqmco.top", "rpc.kc7e.xyz", "www.fla-sh.cc"]
+    for shard_id, shard in enumerate(shard_domains(sample, 3)):
+        print(shard_id, shard)
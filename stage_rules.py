@@ -0,0 +1,229 @@
+import logging
+
+from metrics import registry, record_stage_skipped, STAGE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Stages that rules can skip or shorten, in pipeline order
+RULE_STAGES = ('port_scan', 'http', 'fingerprint', 'screenshot', 'screenshot_index')
+
+# Stage results that rules can be evaluated after
+RULE_TRIGGERS = ('dns', 'port_scan', 'http')
+
+# Ports that count as web ports for the 'web_ports_open' fact
+DEFAULT_WEB_PORTS = (80, 443, 8080, 8443)
+
+# Facts each trigger stage provides to the rules evaluated after it
+FACTS = {
+    'dns': ('resolved',),
+    'port_scan': ('port_scan_failed', 'web_ports_open', 'open_ports'),
+    'http': ('http_ok', 'http_status', 'redirected'),
+}
+
+# Keyword arguments a 'shorten' action may override, per stage
+SHORTEN_PARAMETERS = {
+    'http': ('retries', 'timeout', 'max_hops', 'body_bytes'),
+    'fingerprint': ('fetch_favicon',),
+}
+
+# Seconds assumed saved by skipping a stage that has no latency observations yet
+FALLBACK_STAGE_SECONDS = {
+    'port_scan': 2.0,
+    'http': 3.0,
+    'fingerprint': 0.5,
+    'screenshot': 20.0,
+    'screenshot_index': 0.05,
+}
+
+DEFAULT_RULES = [
+    # An unresolved domain has nothing to scan
+    {'name': 'nxdomain', 'after': 'dns', 'when': {'resolved': False},
+     'skip': ['port_scan', 'http', 'fingerprint', 'screenshot', 'screenshot_index']},
+    # Every web port that was scanned is closed or filtered: HTTP would only time out
+    {'name': 'no_web_ports', 'after': 'port_scan', 'when': {'web_ports_open': False},
+     'skip': ['http', 'fingerprint', 'screenshot', 'screenshot_index']},
+    # The port scan could not tell whether a web server is listening: probe HTTP once instead of three times
+    {'name': 'web_ports_unknown', 'after': 'port_scan', 'when': {'web_ports_open': None},
+     'shorten': {'http': {'retries': 1}}},
+    # No HTTP response on any attempt: the browser would fail the same way, only slower
+    {'name': 'http_failed', 'after': 'http', 'when': {'http_ok': False},
+     'skip': ['fingerprint', 'screenshot', 'screenshot_index']},
+]
+
+
+def validate_rule(rule):
+    """
+    Checks a rule from the configuration.
+
+    :param rule: A dictionary with 'name', 'after' (one of RULE_TRIGGERS), 'when' (fact -> value,
+                 or fact -> list of values), and 'skip' (list of stages) and/or 'shorten'
+                 (stage -> {parameter: value}).
+    :return: A list of problems, empty if the rule is usable.
+    """
+    problems = []
+    name = rule.get('name', '(unnamed)')
+    after = rule.get('after')
+    if after not in RULE_TRIGGERS:
+        return [f"rule {name}: 'after' must be one of {', '.join(RULE_TRIGGERS)}"]
+    for fact in rule.get('when', {}):
+        if fact not in FACTS[after]:
+            problems.append(f"rule {name}: fact '{fact}' is not known after '{after}'")
+    later = RULE_STAGES[RULE_STAGES.index(after) + 1:] if after in RULE_STAGES else RULE_STAGES
+    for stage in rule.get('skip', []):
+        if stage not in later:
+            problems.append(f"rule {name}: cannot skip '{stage}' after '{after}'")
+    for stage, parameters in rule.get('shorten', {}).items():
+        if stage not in later or stage not in SHORTEN_PARAMETERS:
+            problems.append(f"rule {name}: cannot shorten '{stage}' after '{after}'")
+            continue
+        for parameter in parameters:
+            if parameter not in SHORTEN_PARAMETERS[stage]:
+                problems.append(f"rule {name}: '{parameter}' cannot be shortened for '{stage}'")
+    if not rule.get('skip') and not rule.get('shorten'):
+        problems.append(f"rule {name}: needs 'skip' or 'shorten'")
+    return problems
+
+
+def _matches(when, facts):
+    for fact, expected in when.items():
+        actual = facts.get(fact)
+        if isinstance(expected, list):
+            if actual not in expected:
+                return False
+        elif actual != expected:
+            return False
+    return True
+
+
+def estimate_stage_seconds(stage, metrics=None):
+    """
+    :return: The mean latency of a stage so far, or its fallback estimate if it has not run yet.
+    """
+    mean = (metrics or registry).mean(STAGE_LATENCY, stage=stage)
+    return mean if mean is not None else FALLBACK_STAGE_SECONDS.get(stage, 0.0)
+
+
+class StagePlan:
+    """
+    Tracks which stages are still to run for one domain, as rules fire after
+    each stage.
+    """
+
+    def __init__(self, rules, web_ports=DEFAULT_WEB_PORTS, metrics=None):
+        self.rules = rules
+        self.web_ports = set(web_ports)
+        self.metrics = metrics
+        self.facts = {}
+        self.skipped = {}
+        self.shortened = {}
+        self.time_saved = 0.0
+
+    def after(self, stage, **facts):
+        """
+        Records the facts a stage produced and applies the rules evaluated after it.
+
+        :param stage: The stage that just finished (one of RULE_TRIGGERS).
+        :param facts: The facts it produced (see FACTS).
+        :return: The names of the rules that fired.
+        """
+        self.facts.update(facts)
+        fired = []
+        for rule in self.rules:
+            if rule['after'] != stage or not _matches(rule.get('when', {}), self.facts):
+                continue
+            fired.append(rule['name'])
+            for skipped in rule.get('skip', []):
+                if skipped in self.skipped:
+                    continue
+                self.skipped[skipped] = rule['name']
+                seconds = estimate_stage_seconds(skipped, self.metrics)
+                self.time_saved += seconds
+                record_stage_skipped(skipped, rule['name'], seconds, self.metrics)
+            for shortened, parameters in rule.get('shorten', {}).items():
+                self.shortened.setdefault(shortened, {}).update(parameters)
+        if fired:
+            logger.debug("Stage rules fired after %s: %s", stage, ', '.join(fired),
+                         extra={'stage': stage, 'rules': fired})
+        return fired
+
+    def after_port_scan(self, port_status, scanned_ports, failed=False):
+        """
+        Derives the port-scan facts and applies the rules evaluated after the port scan.
+
+        'web_ports_open' is None when the scan failed or no web port was scanned.
+        """
+        open_ports = sorted(port for port, state in port_status.items() if state == 'open')
+        scanned_web_ports = self.web_ports.intersection(scanned_ports)
+        web_ports_open = None
+        if not failed and scanned_web_ports:
+            web_ports_open = bool(scanned_web_ports.intersection(open_ports))
+        return self.after('port_scan', port_scan_failed=failed, web_ports_open=web_ports_open, open_ports=open_ports)
+
+    def should_run(self, stage):
+        """
+        :return: False if a rule skipped the stage.
+        """
+        return stage not in self.skipped
+
+    def overrides(self, stage):
+        """
+        :return: Keyword arguments that rules set to shorten the stage.
+        """
+        return dict(self.shortened.get(stage, {}))
+
+
+class StageRules:
+    """
+    The configured early-exit rules. Rules are read from config['stage_rules']
+    (a list; DEFAULT_RULES when absent, or [] to run every stage). Each rule
+    names the stage it is evaluated after, the facts it matches, and the later
+    stages it skips or the parameters it shortens them with.
+    """
+
+    def __init__(self, rules=None, web_ports=DEFAULT_WEB_PORTS, metrics=None):
+        self.rules = []
+        for rule in DEFAULT_RULES if rules is None else rules:
+            problems = validate_rule(rule)
+            if problems:
+                for problem in problems:
+                    logger.warning("Ignoring stage rule: %s", problem)
+                continue
+            self.rules.append(rule)
+        self.web_ports = tuple(web_ports)
+        self.metrics = metrics
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        :param config: A dictionary containing the configuration settings.
+        :return: StageRules built from config['stage_rules'] and config['web_ports'].
+        """
+        return cls(config.get('stage_rules'), config.get('web_ports', DEFAULT_WEB_PORTS))
+
+    def plan(self):
+        """
+        :return: A new StagePlan for one domain.
+        """
+        return StagePlan(self.rules, self.web_ports, self.metrics)
+
+
+def summarize_skips(scan_records):
+    """
+    Totals the stages skipped by rules across a run's scan records.
+
+    :param scan_records: Scan result dictionaries with 'skipped_stages' and 'time_saved_s'.
+    :return: A tuple (skipped stage count, domains with a skipped stage, estimated seconds saved).
+    """
+    skipped = sum(len(record.get('skipped_stages') or {}) for record in scan_records)
+    domains = sum(1 for record in scan_records if record.get('skipped_stages'))
+    seconds = sum(record.get('time_saved_s') or 0 for record in scan_records)
+    return skipped, domains, seconds
+
+
+# Example usage within the module (optional)
+if __name__ == "__main__":
+    rules = StageRules()
+    plan = rules.plan()
+    plan.after('dns', resolved=True)
+    print(plan.after_port_scan({22: 'open', 80: 'closed/filtered', 443: 'closed/filtered'}, [22, 80, 443]))
+    print(plan.skipped, plan.should_run('http'), f"{plan.time_saved:.1f}s saved")
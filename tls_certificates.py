@@ -0,0 +1,186 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from cryptography import x509
+from cryptography.x509.oid import NameOID, ExtensionOID
+
+from metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Parsed certificates kept per process, keyed by the SHA-256 of the DER encoding
+DEFAULT_PARSED_CACHE_SIZE = 4096
+
+
+def _common_name(name):
+    values = name.get_attributes_for_oid(NameOID.COMMON_NAME)
+    return values[0].value if values else None
+
+
+def _utc(value):
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def parse_certificate(der):
+    """
+    Parses a DER-encoded certificate into the fields kept with scan results.
+
+    :param der: The certificate in DER form, as returned by getpeercert(binary_form=True).
+    :return: A dictionary with 'subject', 'subject_cn', 'issuer', 'issuer_cn', 'sans', 'serial',
+             'not_before', 'not_after' (ISO 8601, UTC), 'sha256' (fingerprint), and 'self_signed'.
+    """
+    cert = x509.load_der_x509_certificate(der)
+    try:
+        san_extension = cert.extensions.get_extension_for_oid(ExtensionOID.SUBJECT_ALTERNATIVE_NAME)
+        sans = sorted({name.lower() for name in san_extension.value.get_values_for_type(x509.DNSName)})
+    except x509.ExtensionNotFound:
+        sans = []
+
+    # cryptography >= 42 exposes timezone-aware validity dates under *_utc
+    not_before = getattr(cert, 'not_valid_before_utc', None) or _utc(cert.not_valid_before)
+    not_after = getattr(cert, 'not_valid_after_utc', None) or _utc(cert.not_valid_after)
+
+    return {
+        'subject': cert.subject.rfc4514_string(),
+        'subject_cn': _common_name(cert.subject),
+        'issuer': cert.issuer.rfc4514_string(),
+        'issuer_cn': _common_name(cert.issuer),
+        'sans': sans,
+        'serial': format(cert.serial_number, 'x'),
+        'not_before': not_before.isoformat(),
+        'not_after': not_after.isoformat(),
+        'sha256': hashlib.sha256(der).hexdigest(),
+        'self_signed': cert.issuer == cert.subject,
+    }
+
+
+def hostname_matches(hostname, names):
+    """
+    Checks a host name against certificate names, allowing a wildcard in the left-most label.
+
+    :param hostname: The host name that was requested (the SNI).
+    :param names: SANs, or the subject CN when there are no SANs.
+    :return: True if any name covers the host name.
+    """
+    hostname = (hostname or '').lower().rstrip('.')
+    for name in names:
+        name = name.lower().rstrip('.')
+        if name == hostname:
+            return True
+        if name.startswith('*.'):
+            suffix = name[1:]
+            if hostname.endswith(suffix) and '.' not in hostname[:-len(suffix)]:
+                return True
+    return False
+
+
+def san_group_key(certificate):
+    """
+    Returns the key used to group domains by certificate: the sorted SAN list, or
+    the subject CN when the certificate has no SANs. Domains behind one
+    multi-domain or wildcard certificate share a key.
+
+    :param certificate: A dictionary returned by parse_certificate.
+    :return: A string such as "*.kc7e.xyz, kc7e.xyz", or None.
+    """
+    names = certificate.get('sans') or ([certificate['subject_cn']] if certificate.get('subject_cn') else [])
+    return ', '.join(names) or None
+
+
+class CertificateCache:
+    """
+    Caches parsed certificates by their DER fingerprint, so one certificate served
+    for many domains is parsed once. The DER itself always comes from the live
+    connection, so a changed certificate is never missed.
+    """
+
+    def __init__(self, max_parsed=DEFAULT_PARSED_CACHE_SIZE):
+        self.max_parsed = max_parsed
+        self.parsed = OrderedDict()
+        self._lock = threading.Lock()
+
+    def parse(self, der):
+        """
+        Returns the parsed certificate, parsing it only if its fingerprint is not cached.
+
+        :param der: The certificate in DER form.
+        :return: The parsed certificate dictionary (see parse_certificate).
+        """
+        fingerprint = hashlib.sha256(der).hexdigest()
+        with self._lock:
+            certificate = self.parsed.get(fingerprint)
+            if certificate is not None:
+                self.parsed.move_to_end(fingerprint)
+        record_cache('tls_certificate', hit=certificate is not None)
+
+        if certificate is None:
+            certificate = parse_certificate(der)
+            with self._lock:
+                self.parsed[fingerprint] = certificate
+                if len(self.parsed) > self.max_parsed:
+                    self.parsed.popitem(last=False)
+        return certificate
+
+
+certificate_cache = CertificateCache()
+
+
+def capture_peer_certificate(response, sni, cache=None):
+    """
+    Reads the server certificate from the connection a streamed HTTPS response
+    arrived on, so no extra handshake is needed.
+
+    Must be called before the response is closed or its body fully read, while
+    the connection is still attached to it. For redirects that means from a
+    'response' hook: requests reads a redirect's body, and so releases its
+    connection, before Session.get returns, even with allow_redirects=False.
+
+    :param response: A requests Response made with stream=True.
+    :param sni: The host name sent as SNI.
+    :param cache: CertificateCache to use. Defaults to the process-wide cache.
+    :return: The parsed certificate plus 'ip', 'port', 'sni', 'tls_version', 'hostname_match',
+             'expired', and 'valid' (hostname matches, within validity, not self-signed), or None.
+    """
+    raw = response.raw
+    # urllib3 2.x exposes the connection as `connection`, 1.x as `_connection`
+    connection = getattr(raw, 'connection', None) or getattr(raw, '_connection', None)
+    sock = getattr(connection, 'sock', None)
+    if sock is None or not hasattr(sock, 'getpeercert'):
+        return None
+    try:
+        der = sock.getpeercert(binary_form=True)
+        ip_address, port = sock.getpeername()[:2]
+        tls_version = sock.version()
+    except (OSError, ValueError) as e:
+        logger.debug("Could not read the peer certificate for %s: %s", sni, e)
+        return None
+    if not der:
+        return None
+
+    certificate = (cache or certificate_cache).parse(der)
+    now = datetime.now(timezone.utc)
+    names = certificate['sans'] or ([certificate['subject_cn']] if certificate['subject_cn'] else [])
+    hostname_match = hostname_matches(sni, names)
+    expired = not (datetime.fromisoformat(certificate['not_before']) <= now
+                   <= datetime.fromisoformat(certificate['not_after']))
+    return dict(
+        certificate,
+        ip=ip_address,
+        port=port,
+        sni=sni,
+        tls_version=tls_version,
+        hostname_match=hostname_match,
+        expired=expired,
+        valid=hostname_match and not expired and not certificate['self_signed'],
+    )
+
+
+# Example usage within the module (optional)
+if __name__ == "__main__":
+    import requests
+
+    with requests.get("https://example.com", stream=True, timeout=10) as response:
+        print(capture_peer_certificate(response, "example.com"))